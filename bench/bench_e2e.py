@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the AuthorizedKeysCommand scripts in usr/local/bin
+against a local mock Reg-App (see mock_regapp.py).
+
+Each login starts the script in a new interpreter, like sshd does, with a
+config file pointing to the mock. Reports p50/p95/p99 wall time, median CPU
+time, peak RSS and upstream requests per login for every script, with a cold
+cache (emptied before each login) and a warm cache (same logins run before).
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from logins import BIN_DIR, GECOS_SCRIPTS, gecos_users, login_args, scripts
+from mock_regapp import add_mock_arguments, make_cert, mock_options, start_mock
+
+CONFIG = """\
+[DEFAULT]
+max_time = {max_time}
+
+[REST]
+reg_host = localhost:{port}
+rest_user = user
+rest_pw = secret
+transport = {transport}
+failure_threshold = 0
+
+[SSN]
+ssn = service
+
+[CACHE]
+cache_dir = {work_dir}/cache
+lock_dir = {work_dir}/locks
+"""
+
+
+def run_login(command, env, server):
+    """Runs one login, returns wall s, CPU s, peak RSS KiB, requests, exit code."""
+    requests_before = server.stats().get("total", 0)
+    start = time.perf_counter()
+    with subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    ) as proc:
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+    requests = server.stats().get("total", 0) - requests_before
+    return (
+        wall,
+        usage.ru_utime + usage.ru_stime,
+        usage.ru_maxrss,
+        requests,
+        proc.returncode,
+    )
+
+
+def percentiles(values):
+    """Returns p50, p95 and p99 of 'values'."""
+    if len(values) < 2:
+        return values * 3
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return cuts[49], cuts[94], cuts[98]
+
+
+def report(script, cache, runs):
+    """Prints one result line."""
+    p50, p95, p99 = percentiles([run[0] * 1000 for run in runs])
+    cpu = statistics.median(run[1] for run in runs) * 1000
+    rss = max(run[2] for run in runs) / 1024
+    requests = sum(run[3] for run in runs) / len(runs)
+    failed = sum(1 for run in runs if run[4])
+    print(
+        f"{script:<28} {cache:<5} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} "
+        f"{cpu:>8.1f} {rss:>8.1f} {requests:>9.2f} {failed:>6}"
+    )
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--logins", type=int, default=50, help="Logins per run")
+parser.add_argument(
+    "--transport", choices=["requests", "stdlib"], default="stdlib", help="Transport"
+)
+parser.add_argument("--max-time", type=int, default=10, help="Request timeout")
+parser.add_argument(
+    "--unknown-share", type=float, default=0.0, help="Logins of unknown users"
+)
+parser.add_argument("--scripts", nargs="*", help="Only these scripts")
+add_mock_arguments(parser)
+args = parser.parse_args()
+
+work_dir = tempfile.mkdtemp(prefix="bwidm-bench-")
+try:
+    cert, key = make_cert(work_dir)
+    options = mock_options(args)
+    gecos = gecos_users(args.users)
+    if gecos:
+        options["population"].extra_eppns = {
+            entry.pw_gecos: number for number, entry in enumerate(gecos)
+        }
+    server = start_mock(cert, key, **options)
+    config_file = os.path.join(work_dir, "bwidm_rest_ssh.conf")
+    with open(config_file, "w", encoding="utf-8") as file:
+        file.write(
+            CONFIG.format(
+                max_time=args.max_time,
+                port=server.server_address[1],
+                transport=args.transport,
+                work_dir=work_dir,
+            )
+        )
+    env = {**os.environ, "REQUESTS_CA_BUNDLE": cert}
+
+    # Same logins for every script, unknown users are beyond the population
+    rng = random.Random(args.seed)
+    numbers = [
+        (
+            args.users + rng.randrange(args.users)
+            if rng.random() < args.unknown_share
+            else rng.randrange(args.users)
+        )
+        for _ in range(args.logins)
+    ]
+
+    print(
+        f"{args.logins} logins, {args.users} users, latency {args.latency:.0f}"
+        f"+{args.jitter:.0f} ms, error rate {args.error_rate:.0%}, "
+        f"transport {args.transport}"
+    )
+    print(
+        f"{'script':<28} {'cache':<5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'CPU ms':>8} {'RSS MiB':>8} {'req/login':>9} {'failed':>6}"
+    )
+    for script in scripts(args.scripts):
+        if script in GECOS_SCRIPTS and not gecos:
+            print(f"{script:<28} skipped, no local users with a gecos field")
+            continue
+        logins = [
+            [
+                sys.executable,
+                os.path.join(BIN_DIR, script),
+                "-c",
+                config_file,
+                *login_args(script, number, gecos),
+            ]
+            for number in numbers
+        ]
+        cache_dir = os.path.join(work_dir, "cache")
+        cold = []
+        for command in logins:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            cold.append(run_login(command, env, server))
+        report(script, "cold", cold)
+        for command in logins:
+            run_login(command, env, server)
+        report(script, "warm", [run_login(command, env, server) for command in logins])
+        shutil.rmtree(cache_dir, ignore_errors=True)
+finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
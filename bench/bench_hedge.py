@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark of hedged requests and failover with two Reg-App endpoints.
+
+Starts two mock Reg-Apps (see mock_regapp.py): 'fast' answers quickly but a
+share of its requests is slow (tail latency), 'steady' is slower without a
+tail. Runs the same key lookups with each endpoint alone, with both and
+failover only, with both and hedged requests, and with the fast endpoint
+down. Reports p50/p95/p99/max latency and Reg-App requests per lookup.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from mock_regapp import FIRST_UID, Population, make_cert, start_mock
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), "..", "usr", "local", "lib"
+    ),
+)
+# pylint: disable=wrong-import-position
+from bwidm_rest.config import read_config
+from bwidm_rest.lookup import Resolver
+
+CONFIG = """\
+[REST]
+reg_host = {reg_host}
+rest_user = user
+rest_pw = secret
+transport = {transport}
+breaker_dir = {work_dir}/{name}
+hedge_percentile = {percentile}
+
+[SSN]
+ssn = service
+
+[CACHE]
+cache_dir = {work_dir}/cache
+lock_dir = {work_dir}/locks
+ttl = 0
+stale_ttl = 0
+negative_ttl = 0
+eppn_index =
+
+[METRICS]
+spool =
+"""
+
+
+def run(name, reg_host, percentile, numbers, servers):
+    """Runs warm-up and measured lookups, prints one result line."""
+    config_file = os.path.join(work_dir, f"{name}.conf")
+    with open(config_file, "w", encoding="utf-8") as file:
+        file.write(
+            CONFIG.format(
+                reg_host=reg_host,
+                transport=args.transport,
+                work_dir=work_dir,
+                name=name,
+                percentile=percentile,
+            )
+        )
+    resolver = Resolver(read_config(config_file))
+
+    def lookup(number):
+        start = time.perf_counter()
+        resolver.lookup("ssh2", f"user{number}", FIRST_UID + number)
+        return time.perf_counter() - start
+
+    # Response times for the hedge delay
+    for number in numbers[: args.warmup]:
+        lookup(number)
+    before = sum(server.stats().get("total", 0) for server in servers)
+    durations = [lookup(number) * 1000 for number in numbers]
+    requests = sum(server.stats().get("total", 0) for server in servers) - before
+    cuts = statistics.quantiles(durations, n=100, method="inclusive")
+    print(
+        f"{name:<16} {cuts[49]:>8.1f} {cuts[94]:>8.1f} {cuts[98]:>8.1f} "
+        f"{max(durations):>8.1f} {requests / len(numbers):>8.2f}"
+    )
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--lookups", type=int, default=500, help="Lookups")
+parser.add_argument("--warmup", type=int, default=50, help="Lookups before")
+parser.add_argument("--users", type=int, default=1000, help="Number of users")
+parser.add_argument("--fast-latency", type=float, default=10, help="ms")
+parser.add_argument("--slow-share", type=float, default=0.05, help="Slow share")
+parser.add_argument("--slow-latency", type=float, default=400, help="Extra ms")
+parser.add_argument("--steady-latency", type=float, default=30, help="ms")
+parser.add_argument("--percentile", type=int, default=90, help="Hedge percentile")
+parser.add_argument(
+    "--transport", choices=["requests", "stdlib"], default="stdlib", help="Transport"
+)
+parser.add_argument("--seed", type=int, default=0, help="Population seed")
+args = parser.parse_args()
+
+work_dir = tempfile.mkdtemp(prefix="bwidm-bench-")
+try:
+    cert, key = make_cert(work_dir)
+    os.environ["REQUESTS_CA_BUNDLE"] = cert
+    population = Population(args.users, seed=args.seed)
+    fast = start_mock(
+        cert,
+        key,
+        population=population,
+        latency=args.fast_latency,
+        jitter=args.fast_latency / 2,
+        slow_share=args.slow_share,
+        slow_latency=args.slow_latency,
+    )
+    steady = start_mock(
+        cert,
+        key,
+        population=population,
+        latency=args.steady_latency,
+        jitter=args.steady_latency / 5,
+    )
+    fast_host = f"localhost:{fast.server_address[1]}"
+    steady_host = f"localhost:{steady.server_address[1]}"
+    # Nothing listens on the port of a closed server
+    down = start_mock(cert, key, population=population)
+    down_host = f"localhost:{down.server_address[1]}"
+    down.shutdown()
+    down.server_close()
+
+    rng = random.Random(args.seed)
+    numbers = [rng.randrange(args.users) for _ in range(args.lookups)]
+    print(
+        f"{args.lookups} lookups, fast {args.fast_latency:.0f} ms with "
+        f"{args.slow_share:.0%} +{args.slow_latency:.0f} ms, steady "
+        f"{args.steady_latency:.0f} ms, hedged after p{args.percentile}"
+    )
+    print(
+        f"{'endpoints':<16} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+        f"{'max ms':>8} {'req':>8}"
+    )
+    servers = [fast, steady]
+    run("fast", fast_host, 0, numbers, servers)
+    run("steady", steady_host, 0, numbers, servers)
+    run("failover", f"{fast_host}, {steady_host}", 0, numbers, servers)
+    run("hedged", f"{fast_host}, {steady_host}", args.percentile, numbers, servers)
+    run(
+        "fast down",
+        f"{down_host}, {steady_host}",
+        args.percentile,
+        numbers,
+        servers,
+    )
+finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
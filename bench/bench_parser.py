@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the FIDO2 rewrite of authorized_keys lines.
+Compares the former regex implementation (two re.findall, full base64 decode
+and re.search per line) with the single-pass parser of bwidm_rest.keys,
+without (cold) and with (warm) memoized parse results.
+"""
+
+import argparse
+import base64
+import os
+import random
+import re
+import struct
+import sys
+import time
+
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), "..", "usr", "local", "lib"
+    ),
+)
+# pylint: disable-next=wrong-import-position
+from bwidm_rest import keys
+
+FIDO2_KEY_NAME = "FIDO2"
+
+
+def legacy_decode_fido2_public_key(fido2_pub_key):
+    """Former implementation, with the FIDO2_KEY_NAME pattern interpolated."""
+    ssh_key = re.findall(
+        rf'command="{FIDO2_KEY_NAME}",from=".*"\s+sk-ssh-ed25519@openssh.com\s+([A-Za-z0-9+/=]+)',
+        fido2_pub_key,
+    )
+    key_comment = re.findall(
+        r"sk-ssh-ed25519@openssh.com\s+[A-Za-z0-9+/=]+\s+([A-Za-z0-9+/=.@-]+)",
+        fido2_pub_key,
+    )
+    if not ssh_key:
+        return None
+    decoded_key = base64.b64decode(ssh_key[0])[4:]
+    null_index = decoded_key.find(b"\x00")
+    if null_index >= 0:
+        decoded_key = decoded_key[:null_index]
+    match = re.search(r"sk-ssh-ed25519@openssh.com", decoded_key.decode("utf-8"))
+    if match:
+        return match[0], ssh_key[0], key_comment[0]
+    return None
+
+
+def legacy_rewrite(line):
+    """Former print loop of bwidm_rest_ssh.py."""
+    key = legacy_decode_fido2_public_key(line)
+    return " ".join(key) if key else line
+
+
+def blob(key_type, size):
+    """Returns base64 wire format key of 'key_type' with 'size' random bytes."""
+    data = key_type.encode()
+    return base64.b64encode(
+        struct.pack(">I", len(data))
+        + data
+        + struct.pack(">I", size)
+        + random.randbytes(size)
+    ).decode()
+
+
+def key_lines(count):
+    """Returns a mix of plain, RSA and FIDO2 command key lines."""
+    lines = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            lines.append(f"ssh-ed25519 {blob('ssh-ed25519', 36)} user{i}@host")
+        elif kind == 1:
+            lines.append(f"ssh-rsa {blob('ssh-rsa', 400)} user{i}@host")
+        else:
+            lines.append(
+                f'command="{FIDO2_KEY_NAME}",from="10.0.0.0/8" sk-ssh-ed25519@openssh.com '
+                f"{blob('sk-ssh-ed25519@openssh.com', 50)} user{i}@host"
+            )
+    return lines
+
+
+def keys_per_second(rewrite, lines, repeat, cold=False):
+    """
+    Returns keys/s of 'rewrite' over 'lines', 'repeat' times.
+    If 'cold', memoized results are cleared before each pass.
+    """
+    seconds = 0
+    for _ in range(repeat):
+        if cold:
+            keys.parse_key.cache_clear()
+            keys.wire_key_type.cache_clear()
+        start = time.perf_counter()
+        for line in lines:
+            rewrite(line)
+        seconds += time.perf_counter() - start
+    return len(lines) * repeat / seconds
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument(
+    "-n",
+    "--keys",
+    type=int,
+    default=3000,
+    help="Distinct keys, at most the parse cache size",
+)
+parser.add_argument("-r", "--repeat", type=int, default=10, help="Passes over keys")
+args = parser.parse_args()
+
+random.seed(1)
+key_list = key_lines(args.keys)
+for key_line in key_list:
+    if legacy_rewrite(key_line) != keys.rewrite_fido2_key(key_line):
+        sys.exit(f"Results differ for: {key_line}")
+
+
+legacy = keys_per_second(legacy_rewrite, key_list, args.repeat)
+cold = keys_per_second(keys.rewrite_fido2_key, key_list, args.repeat, cold=True)
+warm = keys_per_second(keys.rewrite_fido2_key, key_list, args.repeat)
+print(f"{'implementation':<22} {'keys/s':>12} {'speedup':>8}")
+for name, rate in (
+    ("regex (before)", legacy),
+    ("parser, cold", cold),
+    ("parser, memoized", warm),
+):
+    print(f"{name:<22} {rate:>12,.0f} {rate / legacy:>7.1f}x")
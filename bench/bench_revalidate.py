@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Measures conditional revalidation of cached key lists against the mock Reg-App.
+
+A refresh process fills an empty key cache for each variant, then the keys
+of '--churn' of the users change and each variant refreshes the key lists
+of all users again, like the bulk sync and background refreshes do. Reports
+requests, 304 answers, transferred bytes and CPU time of the refresh loop
+(fetch, decoding and cache writes, without interpreter startup):
+
+  unconditional  '[CACHE] revalidate = no', every refresh transfers the keys
+  etag           the Reg-App sends ETag and Last-Modified, unchanged keys 304
+  hash           no validators, unchanged keys are recognized by their hash
+
+All variants have to end with the same cached keys.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from mock_regapp import (
+    FIRST_UID,
+    VALIDATORS,
+    add_mock_arguments,
+    make_cert,
+    mock_options,
+    start_mock,
+)
+
+LIB_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "usr", "local", "lib"
+)
+
+CONFIG = """\
+[REST]
+reg_host = localhost:{port}
+rest_user = user
+rest_pw = secret
+transport = {transport}
+failure_threshold = 0
+
+[SSN]
+ssn = service
+
+[CACHE]
+cache_dir = {work_dir}/cache-{name}
+lock_dir = {work_dir}/locks
+ttl = 0
+stale_ttl = 0
+revalidate = {revalidate}
+revoked =
+
+[METRICS]
+spool =
+
+[WARM]
+history =
+"""
+
+# Refreshes the keys of all users, prints CPU seconds and a hash of the keys
+REFRESH = """\
+import hashlib, sys, time
+sys.path.insert(0, {lib_dir!r})
+from bwidm_rest.cache import refresh
+from bwidm_rest.config import read_config
+from bwidm_rest.lookup import Resolver
+from bwidm_rest.pipeline import lookup_settings
+conf = read_config({config_file!r})
+resolver = Resolver(conf, refresh)
+settings = lookup_settings({mode!r}, conf.lookup)
+digest = hashlib.sha256()
+start = time.process_time()
+for user_id in range({first_uid}, {first_uid} + {users}):
+    digest.update(resolver.key_text(settings, user_id).encode())
+print(time.process_time() - start, digest.hexdigest())
+"""
+
+# Name, '[CACHE] revalidate' and validators of the mock
+VARIANTS = (
+    ("unconditional", "no", VALIDATORS),
+    ("etag", "yes", VALIDATORS),
+    ("hash", "yes", ()),
+)
+
+
+def run_refresh(code, env, server):
+    """Runs one refresh of all users, returns CPU s, keys hash and counters."""
+    before = server.stats()
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode:
+        sys.exit(f"Refresh failed:\n{result.stderr}")
+    after = server.stats()
+    cpu, digest = result.stdout.split()
+    counts = {name: after.get(name, 0) - before.get(name, 0) for name in after}
+    return float(cpu), digest, counts
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--mode", default="jumphost2", help="Lookup mode")
+parser.add_argument("--transport", default="stdlib", help="[REST] transport")
+parser.add_argument("--churn", type=float, default=0.05, help="Users with changes")
+add_mock_arguments(parser)
+parser.set_defaults(latency=0, jitter=0, keys_per_user=20)
+args = parser.parse_args()
+
+work_dir = tempfile.mkdtemp(prefix="bwidm-bench-")
+try:
+    cert, key = make_cert(work_dir)
+    options = mock_options(args)
+    population = options["population"]
+    server = start_mock(cert, key, **options)
+    env = {**os.environ, "REQUESTS_CA_BUNDLE": cert}
+
+    refreshes = {}
+    for name, revalidate, validators in VARIANTS:
+        config_file = os.path.join(work_dir, f"{name}.conf")
+        with open(config_file, "w", encoding="utf-8") as config:
+            config.write(
+                CONFIG.format(
+                    port=server.server_address[1],
+                    transport=args.transport,
+                    work_dir=work_dir,
+                    name=name,
+                    revalidate=revalidate,
+                )
+            )
+        refreshes[name] = REFRESH.format(
+            lib_dir=LIB_DIR,
+            config_file=config_file,
+            mode=args.mode,
+            first_uid=FIRST_UID,
+            users=args.users,
+        )
+        server.response_validators = validators
+        run_refresh(refreshes[name], env, server)
+    changed = population.churn(args.churn, random.Random(args.seed))
+
+    print(
+        f"{args.users} users, mode {args.mode}, about {args.keys_per_user} keys "
+        f"per user, refresh after keys of {changed} users changed"
+    )
+    print(
+        f"{'refresh':<14} {'requests':>9} {'304':>6} {'KiB':>9} {'B/user':>8} "
+        f"{'CPU s':>7} {'CPU us/user':>12}"
+    )
+    digests = set()
+    for name, _, validators in VARIANTS:
+        server.response_validators = validators
+        cpu, digest, counts = run_refresh(refreshes[name], env, server)
+        digests.add(digest)
+        size = counts.get("bytes", 0)
+        print(
+            f"{name:<14} {counts.get('total', 0):>9} "
+            f"{counts.get('not-modified', 0):>6} {size / 1024:>9.0f} "
+            f"{size / args.users:>8.0f} {cpu:>7.2f} {cpu * 1e6 / args.users:>12.0f}"
+        )
+    if len(digests) != 1:
+        sys.exit("Variants cached different keys")
+finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Measures startup time and memory of the key lookup path.
+Each variant is started as a new interpreter, like sshd does for every login.
+Reports median wall time and peak RSS, an '-X importtime' breakdown and checks
+that the stdlib transport stays within the startup budget.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+LIB_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "usr", "local", "lib"
+)
+TRANSPORT_ARGS = "'reg.example.org', 'user', 'pw', 10"
+
+VARIANTS = {
+    "interpreter": "pass",
+    "daemon client": "import bwidm_rest.client",
+    "import requests": "import requests",
+    "lookup (requests)": "import bwidm_rest.lookup\n"
+    "from bwidm_rest.transport import RequestsTransport\n"
+    f"RequestsTransport({TRANSPORT_ARGS})",
+    "lookup (stdlib)": "import bwidm_rest.lookup\n"
+    "from bwidm_rest.transport import StdlibTransport\n"
+    f"StdlibTransport({TRANSPORT_ARGS})",
+}
+
+
+def run_once(code, extra_args=()):
+    """Runs 'code' in a new interpreter, returns wall seconds, peak RSS in KiB."""
+    start = time.perf_counter()
+    with subprocess.Popen(
+        [sys.executable, *extra_args, "-c", code],
+        env={**os.environ, "PYTHONPATH": LIB_DIR},
+        stderr=subprocess.PIPE,
+    ) as proc:
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        stderr = proc.stderr.read().decode()
+    if proc.returncode:
+        sys.exit(f"Variant failed: {code}\n{stderr}")
+    return time.perf_counter() - start, usage.ru_maxrss, stderr
+
+
+def import_times(code, top):
+    """Returns the 'top' imports of 'code' by cumulative import time in ms."""
+    _, _, stderr = run_once(code, ["-X", "importtime"])
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # Only top level imports, nested ones are part of their cumulative time
+        if not name.startswith("  "):
+            times[name.strip()] = int(cumulative) / 1000
+    return sorted(times.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--runs", type=int, default=20, help="Runs per variant")
+parser.add_argument("--top", type=int, default=8, help="Imports per breakdown")
+parser.add_argument(
+    "--budget-ms",
+    type=float,
+    default=60,
+    help="Allowed startup of 'lookup (stdlib)' on top of the bare interpreter",
+)
+args = parser.parse_args()
+
+results = {}
+print(f"{'variant':<20} {'wall ms':>9} {'RSS MiB':>9}")
+for variant, variant_code in VARIANTS.items():
+    runs = [run_once(variant_code) for _ in range(args.runs)]
+    wall = statistics.median(run[0] for run in runs) * 1000
+    rss = statistics.median(run[1] for run in runs) / 1024
+    results[variant] = wall
+    print(f"{variant:<20} {wall:>9.1f} {rss:>9.1f}")
+
+for variant in ("lookup (requests)", "lookup (stdlib)"):
+    print(f"\n-X importtime, {variant}:")
+    for name, ms in import_times(VARIANTS[variant], args.top):
+        print(f"  {name:<30} {ms:>8.1f} ms")
+
+overhead = results["lookup (stdlib)"] - results["interpreter"]
+print(f"\nstdlib lookup startup: {overhead:.1f} ms (budget {args.budget_ms:.0f} ms)")
+sys.exit(0 if overhead <= args.budget_ms else 1)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Lookup benchmark of the key store (bwidm_rest.store) with a large population.
+
+Builds the key cache entries, the per-user files of the bulk sync and the key
+store for '--users' users of the mock population, then times random lookups
+the way a login process does them:
+
+  cache   read JSON cache entry, json.loads, filter pipeline, render
+  file    read the synced file of the user
+  store   open and mmap the key store, hash lookup, slice
+  mapped  hash lookup in an already mapped store (resolver daemon)
+
+Finally '--logins' script runs of the store fast path and of a warm cache
+lookup compare the wall time of a login including interpreter startup.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_regapp import FIRST_UID, Population
+
+LIB_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "usr", "local", "lib"
+)
+sys.path.insert(0, LIB_DIR)
+# pylint: disable=wrong-import-position
+from bwidm_rest.cache import cache_path, write_cache
+from bwidm_rest.pipeline import lookup_settings, parse_records, run_pipeline
+from bwidm_rest.store import KeyStore, write_store
+
+# Store lookup of the fast path of bwidm_rest.cli, without config file
+STORE_LOGIN = """\
+import sys
+sys.path.insert(0, {lib_dir!r})
+from bwidm_rest.store import stored_keys
+keys = stored_keys({store!r}, 3600, {mode!r}, sys.argv[1])
+if keys is None:
+    sys.exit(1)
+sys.stdout.buffer.write(keys)
+"""
+
+# Login with a warm key cache, as run_lookup does it without the Reg-App
+CACHE_LOGIN = """\
+import sys
+sys.path.insert(0, {lib_dir!r})
+from bwidm_rest.cache import read_cache
+from bwidm_rest.pipeline import lookup_settings, parse_records, run_pipeline
+settings = lookup_settings({mode!r}, {{}})
+_, text = read_cache(sys.argv[2])
+for line in run_pipeline(parse_records(text, settings, sys.argv[1]), settings):
+    print(line)
+"""
+
+
+def microseconds(values):
+    """Returns p50 and p99 in microseconds."""
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return cuts[49] * 1e6, cuts[98] * 1e6
+
+
+def time_lookups(lookup, names):
+    """Returns durations of 'lookup(name)' for all 'names'."""
+    durations = []
+    for name in names:
+        start = time.perf_counter()
+        lookup(name)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def time_logins(command, arguments, env):
+    """Returns wall time of script runs, one per argument list."""
+    durations = []
+    for args in arguments:
+        start = time.perf_counter()
+        subprocess.run(
+            [*command, *args], env=env, stdout=subprocess.DEVNULL, check=True
+        )
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--users", type=int, default=100000, help="Number of users")
+parser.add_argument("--keys-per-user", type=int, default=3, help="Mean keys")
+parser.add_argument("--mode", default="jumphost2", help="Lookup mode")
+parser.add_argument("-n", "--lookups", type=int, default=20000, help="Lookups")
+parser.add_argument("--logins", type=int, default=50, help="Script runs")
+parser.add_argument("--seed", type=int, default=0, help="Population seed")
+args = parser.parse_args()
+
+settings = lookup_settings(args.mode, {})
+if settings.keys == "service":
+    sys.exit("Use a mode with a key list, e.g. jumphost2")
+population = Population(args.users, args.keys_per_user, seed=args.seed)
+work_dir = tempfile.mkdtemp(prefix="bwidm-bench-")
+try:
+    cache_dir = os.path.join(work_dir, "cache")
+    output_dir = os.path.join(work_dir, "authorized_keys")
+    os.makedirs(output_dir)
+    store_path = os.path.join(work_dir, "keys.store")
+    kind = f"list-{settings.keys}"
+    fields = ("name", "keyType", "encodedKey", "keyStatus", "createdAt")
+
+    start = time.perf_counter()
+    records = []
+    for number in range(args.users):
+        ssh_user, uid = f"user{number}", FIRST_UID + number
+        text = json.dumps(
+            [{field: key[field] for field in fields} for key in population.keys(number)]
+        )
+        write_cache(cache_path(cache_dir, kind, "service", uid), text)
+        keys = "".join(
+            f"{line}\n"
+            for line in run_pipeline(parse_records(text, settings, ssh_user), settings)
+        ).encode()
+        with open(os.path.join(output_dir, ssh_user), "wb") as file:
+            file.write(keys)
+        records.append((ssh_user, uid, keys))
+    print(f"{args.users} users generated in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    write_store(store_path, settings.mode, records)
+    print(
+        f"Key store built in {time.perf_counter() - start:.2f} s, "
+        f"{os.path.getsize(store_path) / 1024 / 1024:.1f} MiB"
+    )
+
+    rng = random.Random(args.seed)
+    numbers = [rng.randrange(args.users) for _ in range(args.lookups)]
+    names = [f"user{number}" for number in numbers]
+
+    def cache_lookup(ssh_user):
+        """Lookup from the JSON cache entry."""
+        path = cache_path(cache_dir, kind, "service", int(ssh_user[4:]) + FIRST_UID)
+        with open(path, "r", encoding="utf-8") as file:
+            text = json.load(file)["text"]
+        return "".join(
+            f"{line}\n"
+            for line in run_pipeline(parse_records(text, settings, ssh_user), settings)
+        ).encode()
+
+    def file_lookup(ssh_user):
+        """Lookup of the synced file."""
+        with open(os.path.join(output_dir, ssh_user), "rb") as file:
+            return file.read()
+
+    def store_lookup(ssh_user):
+        """Lookup in a store opened for this lookup, as a login process does."""
+        store = KeyStore(store_path)
+        keys = store.find(ssh_user)[1]
+        store.close()
+        return keys
+
+    mapped = KeyStore(store_path)
+    for name in names[:100]:
+        if not cache_lookup(name) == file_lookup(name) == store_lookup(name):
+            sys.exit(f"Different keys for {name}")
+
+    print(f"{args.lookups} lookups, mode {args.mode}")
+    print(f"{'lookup':<8} {'p50 us':>9} {'p99 us':>9} {'lookups/s':>10}")
+    for name, lookup in (
+        ("cache", cache_lookup),
+        ("file", file_lookup),
+        ("store", store_lookup),
+        ("mapped", lambda ssh_user: mapped.find(ssh_user)),
+    ):
+        durations = time_lookups(lookup, names)
+        p50, p99 = microseconds(durations)
+        print(f"{name:<8} {p50:>9.1f} {p99:>9.1f} {len(names) / sum(durations):>10.0f}")
+    mapped.close()
+
+    if args.logins:
+        env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+        logins = names[: args.logins]
+        options = {"lib_dir": LIB_DIR, "store": store_path, "mode": settings.mode}
+        store_script = [sys.executable, "-c", STORE_LOGIN.format(**options)]
+        cache_script = [sys.executable, "-c", CACHE_LOGIN.format(**options)]
+        print(f"{args.logins} logins including interpreter startup")
+        print(f"{'login':<8} {'p50 ms':>9} {'p99 ms':>9}")
+        for name, command, arguments in (
+            ("store", store_script, [[ssh_user] for ssh_user in logins]),
+            (
+                "cache",
+                cache_script,
+                [
+                    [
+                        ssh_user,
+                        cache_path(
+                            cache_dir, kind, "service", int(ssh_user[4:]) + FIRST_UID
+                        ),
+                    ]
+                    for ssh_user in logins
+                ],
+            ),
+        ):
+            p50, p99 = microseconds(time_logins(command, arguments, env))
+            print(f"{name:<8} {p50 / 1000:>9.1f} {p99 / 1000:>9.1f}")
+finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Login storm against a local mock Reg-App (see mock_regapp.py): starts
+'--concurrency' logins of a script at once, like sshd after a maintenance
+window or for hundreds of workflow-triggered ssh connections.
+
+The users of a storm are drawn from a distribution:
+
+  zipf      few users with many logins, many with few (exponent '--zipf-s')
+  same      all logins of one user
+  distinct  every login of another user
+
+Every storm runs with an empty cache (cold) and then again with the cache
+it left (warm). Reports throughput, p50/p99/max latency, peak aggregate RSS
+of the concurrent processes and upstream requests per login, to see whether
+caching and coalescing flatten the storm.
+"""
+
+import argparse
+import itertools
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from logins import BIN_DIR, GECOS_SCRIPTS, gecos_users, login_args, scripts
+from mock_regapp import add_mock_arguments, make_cert, mock_options, start_mock
+
+CONFIG = """\
+[DEFAULT]
+max_time = {max_time}
+
+[REST]
+reg_host = localhost:{port}
+rest_user = user
+rest_pw = secret
+transport = {transport}
+failure_threshold = 0
+
+[SSN]
+ssn = service
+
+[CACHE]
+cache_dir = {work_dir}/cache
+lock_dir = {work_dir}/locks
+
+[METRICS]
+spool =
+
+[WARM]
+history =
+"""
+
+DISTRIBUTIONS = ("zipf", "same", "distinct")
+# Seconds between RSS samples of the running logins
+RSS_INTERVAL = 0.005
+
+
+def storm_users(distribution, logins, users, zipf_s, rng):
+    """Returns user numbers of 'logins' logins drawn from 'distribution'."""
+    if distribution == "same":
+        return [rng.randrange(users)] * logins
+    if distribution == "distinct":
+        numbers = rng.sample(range(users), min(logins, users))
+        return list(itertools.islice(itertools.cycle(numbers), logins))
+    ranks = list(range(users))
+    rng.shuffle(ranks)
+    weights = list(itertools.accumulate(1 / (rank + 1) ** zipf_s for rank in ranks))
+    return rng.choices(range(users), cum_weights=weights, k=logins)
+
+
+def rss_kib(pid):
+    """Returns resident set size of process 'pid' in KiB, 0 if it is gone."""
+    try:
+        with open(f"/proc/{pid}/status", "rb") as file:
+            for line in file:
+                if line.startswith(b"VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+class RssSampler(threading.Thread):
+    """Samples the summed RSS of the running logins, keeps the peak."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.pids = set()
+        self.peak = 0
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(RSS_INTERVAL):
+            self.peak = max(self.peak, sum(rss_kib(pid) for pid in list(self.pids)))
+
+
+def run_storm(commands, env, server):
+    """
+    Starts all 'commands' at once, returns wall time, latencies in s,
+    peak aggregate RSS in KiB, upstream requests and failed logins.
+    """
+    requests_before = server.stats().get("total", 0)
+    sampler = RssSampler()
+    sampler.start()
+    started = {}
+    start = time.perf_counter()
+    for command in commands:
+        proc = subprocess.Popen(
+            command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        started[proc.pid] = time.perf_counter()
+        sampler.pids.add(proc.pid)
+    latencies, failed = [], 0
+    # Logins are reaped in the order they finish
+    while started:
+        pid, status, _ = os.wait4(-1, 0)
+        if pid not in started:
+            continue
+        latencies.append(time.perf_counter() - started.pop(pid))
+        sampler.pids.discard(pid)
+        if os.waitstatus_to_exitcode(status):
+            failed += 1
+    wall = time.perf_counter() - start
+    sampler.done.set()
+    sampler.join()
+    requests = server.stats().get("total", 0) - requests_before
+    return wall, latencies, sampler.peak, requests, failed
+
+
+def report(script, distribution, users, cache, result):
+    """Prints one result line."""
+    wall, latencies, peak, requests, failed = result
+    latencies = [latency * 1000 for latency in latencies]
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p99 = cuts[49], cuts[98]
+    else:
+        p50 = p99 = latencies[0]
+    print(
+        f"{script:<28} {distribution:<8} {users:>5} {cache:<5} "
+        f"{len(latencies) / wall:>8.1f} {p50:>8.0f} {p99:>8.0f} "
+        f"{max(latencies):>8.0f} {peak / 1024:>8.0f} "
+        f"{requests / len(latencies):>9.2f} {failed:>6}"
+    )
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument(
+    "-n", "--concurrency", type=int, default=100, help="Logins of a storm"
+)
+parser.add_argument(
+    "--distribution",
+    nargs="+",
+    choices=DISTRIBUTIONS,
+    default=list(DISTRIBUTIONS),
+    help="User distributions",
+)
+parser.add_argument("--zipf-s", type=float, default=1.1, help="Zipf exponent")
+parser.add_argument(
+    "--transport", choices=["requests", "stdlib"], default="stdlib", help="Transport"
+)
+parser.add_argument("--max-time", type=int, default=10, help="Request timeout")
+parser.add_argument("--scripts", nargs="*", help="Only these scripts")
+add_mock_arguments(parser)
+parser.set_defaults(latency=50)
+args = parser.parse_args()
+
+work_dir = tempfile.mkdtemp(prefix="bwidm-bench-")
+try:
+    cert, key = make_cert(work_dir)
+    options = mock_options(args)
+    gecos = gecos_users(args.users)
+    if gecos:
+        options["population"].extra_eppns = {
+            entry.pw_gecos: number for number, entry in enumerate(gecos)
+        }
+    server = start_mock(cert, key, **options)
+    config_file = os.path.join(work_dir, "bwidm_rest_ssh.conf")
+    with open(config_file, "w", encoding="utf-8") as file:
+        file.write(
+            CONFIG.format(
+                max_time=args.max_time,
+                port=server.server_address[1],
+                transport=args.transport,
+                work_dir=work_dir,
+            )
+        )
+    env = {**os.environ, "REQUESTS_CA_BUNDLE": cert}
+    cache_dir = os.path.join(work_dir, "cache")
+
+    print(
+        f"Storms of {args.concurrency} concurrent logins, {args.users} users, "
+        f"latency {args.latency:.0f}+{args.jitter:.0f} ms, "
+        f"transport {args.transport}, {os.cpu_count()} CPUs"
+    )
+    print(
+        f"{'script':<28} {'dist.':<8} {'users':>5} {'cache':<5} {'logins/s':>8} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'RSS MiB':>8} "
+        f"{'req/login':>9} {'failed':>6}"
+    )
+    for script in scripts(args.scripts):
+        if script in GECOS_SCRIPTS and not gecos:
+            print(f"{script:<28} skipped, no local users with a gecos field")
+            continue
+        for distribution in args.distribution:
+            # Same storm for every script
+            numbers = storm_users(
+                distribution,
+                args.concurrency,
+                args.users,
+                args.zipf_s,
+                random.Random(args.seed),
+            )
+            commands = [
+                [
+                    sys.executable,
+                    os.path.join(BIN_DIR, script),
+                    "-c",
+                    config_file,
+                    *login_args(script, number, gecos),
+                ]
+                for number in numbers
+            ]
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            for cache in ("cold", "warm"):
+                result = run_storm(commands, env, server)
+                report(script, distribution, len(set(numbers)), cache, result)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Compares the incremental bulk sync with a full sync against the mock Reg-App.
+
+After an initial sync, the keys of '--churn' of the users change and the
+sync runs again, once with '--full' and once incrementally with the key
+states of the initial sync. Reports wall and CPU time, requests and
+transferred bytes, both syncs have to write the same files.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_regapp import (
+    FIRST_UID,
+    add_mock_arguments,
+    make_cert,
+    mock_options,
+    start_mock,
+)
+
+SYNC = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)),
+    "..",
+    "usr",
+    "local",
+    "sbin",
+    "bwidm_rest_sync.py",
+)
+
+CONFIG = """\
+[REST]
+reg_host = localhost:{port}
+rest_user = user
+rest_pw = secret
+transport = stdlib
+failure_threshold = 0
+
+[SSN]
+ssn = service
+
+[CACHE]
+cache_dir = {work_dir}/cache
+lock_dir = {work_dir}/locks
+
+[METRICS]
+spool =
+
+[SYNC]
+mode = {mode}
+workers = {workers}
+store = {work_dir}/keys.store
+"""
+
+
+def run_sync(config_file, output_dir, state_dir, users_file, env, server, full):
+    """Runs one sync, returns wall s, CPU s, requests, bytes and its report."""
+    # The state directory of the config is replaced per run
+    with open(config_file, "a", encoding="utf-8") as file:
+        file.write(f"state_dir = {state_dir}\n")
+    before = server.stats()
+    start = time.perf_counter()
+    with subprocess.Popen(
+        [
+            sys.executable,
+            SYNC,
+            "-c",
+            config_file,
+            "--output-dir",
+            output_dir,
+            "--users",
+            users_file,
+            *(["--full"] if full else []),
+        ],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    ) as proc:
+        _, status, usage = os.wait4(proc.pid, 0)
+        output = proc.stdout.read().decode()
+    wall = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status):
+        sys.exit(f"Sync failed:\n{output}")
+    after = server.stats()
+    return (
+        wall,
+        usage.ru_utime + usage.ru_stime,
+        after.get("total", 0) - before.get("total", 0),
+        after.get("bytes", 0) - before.get("bytes", 0),
+        output.strip(),
+    )
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--mode", default="jumphost2", help="Lookup mode of the sync")
+parser.add_argument("--workers", type=int, default=8, help="Concurrent requests")
+parser.add_argument("--churn", type=float, default=0.05, help="Users with changes")
+add_mock_arguments(parser)
+parser.set_defaults(latency=2, jitter=2, keys_per_user=20, expired_share=0.5)
+args = parser.parse_args()
+
+work_dir = tempfile.mkdtemp(prefix="bwidm-bench-")
+try:
+    cert, key = make_cert(work_dir)
+    options = mock_options(args)
+    population = options["population"]
+    server = start_mock(cert, key, **options)
+    env = {**os.environ, "REQUESTS_CA_BUNDLE": cert}
+    users_file = os.path.join(work_dir, "users")
+    with open(users_file, "w", encoding="utf-8") as file:
+        for number in range(args.users):
+            file.write(f"user{number} {FIRST_UID + number}\n")
+    config_file = os.path.join(work_dir, "bwidm_rest_ssh.conf")
+
+    def sync(name, state_dir, full):
+        """Runs a sync with a fresh copy of the config, prints the result."""
+        with open(config_file, "w", encoding="utf-8") as config:
+            config.write(
+                CONFIG.format(
+                    port=server.server_address[1],
+                    work_dir=work_dir,
+                    mode=args.mode,
+                    workers=args.workers,
+                )
+            )
+        wall, cpu, requests, size, output = run_sync(
+            config_file,
+            os.path.join(work_dir, f"out-{name}"),
+            state_dir,
+            users_file,
+            env,
+            server,
+            full,
+        )
+        print(f"{name:<12} {wall:>8.2f} {cpu:>8.2f} {requests:>9} {size / 1024:>9.0f}")
+        for line in output.splitlines():
+            print(f"  {line}")
+
+    state = os.path.join(work_dir, "state")
+    print(
+        f"{args.users} users, mode {args.mode}, about {args.keys_per_user} keys "
+        f"per user, {args.expired_share:.0%} expired"
+    )
+    print(f"{'sync':<12} {'wall s':>8} {'CPU s':>8} {'requests':>9} {'KiB':>9}")
+    sync("initial", state, False)
+    shutil.copytree(os.path.join(work_dir, "out-initial"), f"{work_dir}/out-full")
+    shutil.copytree(
+        os.path.join(work_dir, "out-initial"), f"{work_dir}/out-incremental"
+    )
+    changed = population.churn(args.churn, random.Random(args.seed))
+    print(f"Keys of {changed} users changed")
+    sync("full", os.path.join(work_dir, "unused"), True)
+    sync("incremental", state, False)
+
+    # Both syncs have to produce the same files
+    for name in sorted(os.listdir(f"{work_dir}/out-full")):
+        with open(f"{work_dir}/out-full/{name}", "rb") as full_file, open(
+            f"{work_dir}/out-incremental/{name}", "rb"
+        ) as incremental_file:
+            if full_file.read() != incremental_file.read():
+                sys.exit(f"Different keys for {name}")
+finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
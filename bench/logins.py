@@ -0,0 +1,41 @@
+"""
+Logins of the AuthorizedKeysCommand scripts in usr/local/bin for the
+benchmarks: command line arguments of the users of the mock Reg-App.
+"""
+
+import os
+import pwd
+
+from mock_regapp import FIRST_UID
+
+BIN_DIR = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), "..", "usr", "local", "bin"
+)
+# Scripts with the uidNumber as second argument, ssh3 reads the EPPN from passwd
+WITH_USER_ID = ("bwidm_rest_ssh.py", "bwidm_rest_ssh2.py")
+GECOS_SCRIPTS = ("bwidm_rest_ssh3.py",)
+
+
+def gecos_users(count):
+    """Returns local users with a gecos field, for lookups by EPPN from passwd."""
+    users = []
+    for entry in pwd.getpwall():
+        if entry.pw_gecos and len(entry.pw_name) <= 12 and entry.pw_name.isalnum():
+            users.append(entry)
+        if len(users) == count:
+            break
+    return users
+
+
+def login_args(script, number, gecos):
+    """Returns command line arguments of a login of user 'number'."""
+    if script in WITH_USER_ID:
+        return [f"user{number}", str(FIRST_UID + number)]
+    if script in GECOS_SCRIPTS:
+        return [gecos[number % len(gecos)].pw_name]
+    return [f"user{number}"]
+
+
+def scripts(names=None):
+    """Returns the scripts 'names', all scripts in BIN_DIR without names."""
+    return names or sorted(name for name in os.listdir(BIN_DIR) if name.endswith(".py"))
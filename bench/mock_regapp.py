@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Mock Reg-App for benchmarks, an HTTPS server with the REST endpoints used by
+the scripts and a synthetic population of users and keys:
+
+  /rest/attrq/eppn/<ssn>/<eppn>
+  /rest/ssh-key/auth/all/<ssn>/uidnumber/<uidNumber>
+  /rest/ssh-key/list/uidnumber/<uidNumber>/all|key-status/ACTIVE
+  /stats  (request counters, not part of the Reg-App)
+
+Users are named 'user<n>' with EPPN 'user<n>@<eppn_domain>' and uidNumber
+900001 + n. Keys are generated from the seed when requested, so large
+populations need no memory. With several services, each service has a part
+of the keys of a user and all of them the first key. Latency, tail latency
+(a share of slow requests), responses that trickle in, error rate and the
+share of FIDO2 command keys and expired keys are configurable.
+
+Key responses carry an ETag (hash of the body) and Last-Modified (last key
+change of the user), conditional requests get 304 Not Modified.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIRST_UID = 900001
+EPPN_DOMAIN = "uni-freiburg.de"
+SSN = "service"
+KEY_NAME = "UNIFR-JUMPHOST"
+FIDO2_TYPE = "sk-ssh-ed25519@openssh.com"
+VALID_DAYS = 365
+TRICKLE_CHUNK = 64
+VALIDATORS = ("etag", "last-modified")
+
+
+def wire_string(data):
+    """Returns 'data' as SSH wire format string (uint32 length and bytes)."""
+    return len(data).to_bytes(4, "big") + data
+
+
+def key_blob(key_type, rng):
+    """Returns base64 encoded key blob in SSH wire format."""
+    blob = wire_string(key_type.encode()) + wire_string(rng.randbytes(32))
+    if key_type == FIDO2_TYPE:
+        blob += wire_string(b"ssh:")
+    return base64.b64encode(blob).decode()
+
+
+class Population:
+    """Synthetic users and keys, derived from 'seed' and the user number."""
+
+    def __init__(
+        self,
+        users=1000,
+        keys_per_user=3,
+        fido2_share=0.2,
+        expired_share=0.2,
+        seed=0,
+        eppn_domain=EPPN_DOMAIN,
+        extra_eppns=None,
+    ):
+        self.users = users
+        self.keys_per_user = keys_per_user
+        self.fido2_share = fido2_share
+        self.expired_share = expired_share
+        self.seed = seed
+        self.eppn_domain = eppn_domain
+        # Other EPPNs mapped to user numbers, e.g. gecos of local users
+        self.extra_eppns = extra_eppns or {}
+        self.now = datetime.now(timezone.utc)
+        # Generation of the keys of users that changed their keys
+        self.generations = {}
+        # Time of the last change of users that changed their keys
+        self.changed = {}
+
+    def churn(self, share, rng):
+        """Changes the keys of a 'share' of the users, returns their number."""
+        changed = rng.sample(range(self.users), int(self.users * share))
+        now = time.time()
+        for number in changed:
+            self.generations[number] = self.generations.get(number, 0) + 1
+            self.changed[number] = now
+        return len(changed)
+
+    def modified(self, number):
+        """Returns time of the last key change of user 'number'."""
+        return self.changed.get(number, self.now.timestamp())
+
+    def user_by_eppn(self, eppn):
+        """Returns user number of 'eppn', None if unknown."""
+        if eppn in self.extra_eppns:
+            return self.extra_eppns[eppn]
+        match = re.fullmatch(rf"user(\d+)@{re.escape(self.eppn_domain)}", eppn)
+        if match and int(match[1]) < self.users:
+            return int(match[1])
+        return None
+
+    def user_by_uid(self, uid):
+        """Returns user number of uidNumber 'uid', None if unknown."""
+        number = uid - FIRST_UID
+        return number if 0 <= number < self.users else None
+
+    def new_key(self, index, rng, age=None):
+        """Returns a random key, 'age' in days is random if not given."""
+        fido2 = rng.random() < self.fido2_share
+        expired = age is None and rng.random() < self.expired_share
+        key_type = FIDO2_TYPE if fido2 else rng.choice(["ssh-ed25519", "ssh-rsa"])
+        if age is None:
+            age = (
+                rng.randint(VALID_DAYS + 1, 3 * VALID_DAYS)
+                if expired
+                else rng.randint(0, VALID_DAYS - 1)
+            )
+        created = self.now - timedelta(days=age)
+        return {
+            "name": f"{KEY_NAME}-{index}" if index % 2 == 0 else f"key-{index}",
+            "keyType": key_type,
+            "encodedKey": key_blob(key_type, rng),
+            "keyStatus": "EXPIRED" if expired else "ACTIVE",
+            "createdAt": created.strftime("%Y-%m-%dT%H:%M:%S.%fZ[UTC]"),
+            "fido2": fido2,
+        }
+
+    def keys(self, number):
+        """Returns the keys of user 'number' as Reg-App key list."""
+        rng = random.Random(self.seed * 1000003 + number)
+        keys = [
+            self.new_key(index, rng)
+            for index in range(rng.randint(1, 2 * self.keys_per_user - 1))
+        ]
+        # Each change revokes a key and adds a new one
+        for generation in range(1, self.generations.get(number, 0) + 1):
+            rng = random.Random((self.seed * 1000003 + number) * 1009 + generation)
+            active = [key for key in keys if key["keyStatus"] == "ACTIVE"]
+            if active:
+                rng.choice(active)["keyStatus"] = "REVOKED"
+            keys.append(self.new_key(len(keys), rng, age=0))
+        return keys
+
+    def service_keys(self, number, part=0, parts=1):
+        """
+        Returns active keys of user 'number' as authorized_keys text,
+        only 'part' of 'parts' of the keys and the first one.
+        """
+        lines = []
+        for index, key in enumerate(self.keys(number)):
+            if key["keyStatus"] != "ACTIVE" or index % parts not in (0, part):
+                continue
+            if key["fido2"]:
+                # FIDO2 keys are submitted as command keys
+                lines.append(
+                    f'command="FIDO2",from="10.0.0.0/8" {key["keyType"]} '
+                    f'{key["encodedKey"]} {key["name"]}'
+                )
+            else:
+                lines.append(f'{key["keyType"]} {key["encodedKey"]} {key["name"]}')
+        return "".join(f"{line}\n" for line in lines)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Answers Reg-App requests from the population of the server."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, no delayed ACK on keep-alive
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Handles a GET request."""
+        server = self.server
+        path = self.path.split("?", 1)[0]
+        if path == "/stats":
+            self.reply(200, json.dumps(server.stats()), "application/json")
+            return
+        server.count(path)
+        if server.latency or server.jitter:
+            time.sleep((server.latency + random.uniform(0, server.jitter)) / 1000)
+        if random.random() < server.slow_share:
+            time.sleep(server.slow_latency / 1000)
+        if random.random() < server.error_rate:
+            self.reply(503, "Service Unavailable")
+            return
+        if self.headers.get("Authorization") != server.authorization:
+            self.reply(401, "Unauthorized")
+            return
+        status, text = server.answer(path)
+        headers = server.validators(path, text) if status == 200 else {}
+        if headers and self.not_modified(headers):
+            server.count_not_modified()
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        server.count_bytes(len(text.encode()))
+        self.reply(status, text, headers=headers)
+
+    def not_modified(self, headers):
+        """Returns True if the conditional request matches the 'headers'."""
+        # If-None-Match takes precedence over If-Modified-Since
+        if "If-None-Match" in self.headers:
+            return self.headers["If-None-Match"] == headers.get("ETag")
+        since = self.headers.get("If-Modified-Since")
+        if since and "Last-Modified" in headers:
+            try:
+                return parsedate_to_datetime(since) >= parsedate_to_datetime(
+                    headers["Last-Modified"]
+                )
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def reply(self, status, text, content_type="text/plain", headers=None):
+        """Sends response with 'status', body 'text' and extra 'headers'."""
+        body = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not self.server.trickle:
+            self.wfile.write(body)
+            return
+        # Every chunk arrives within the socket timeout of the client
+        try:
+            for start in range(0, len(body), TRICKLE_CHUNK):
+                time.sleep(self.server.trickle / 1000)
+                self.wfile.write(body[start : start + TRICKLE_CHUNK])
+        except OSError:
+            # The client gave up (deadline)
+            self.close_connection = True
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Requests are counted, not logged."""
+
+
+class MockRegApp(ThreadingHTTPServer):
+    """HTTPS server that behaves like the REST API of the Reg-App."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        population,
+        ssns=(SSN,),
+        rest_user="user",
+        rest_pw="secret",
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        slow_share=0.0,
+        slow_latency=0.0,
+        trickle=0.0,
+        validators=VALIDATORS,
+    ):
+        super().__init__(address, MockHandler)
+        self.population = population
+        self.ssns = tuple(ssns)
+        credentials = base64.b64encode(f"{rest_user}:{rest_pw}".encode()).decode()
+        self.authorization = f"Basic {credentials}"
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # Tail latency: a share of the requests is slower
+        self.slow_share = slow_share
+        self.slow_latency = slow_latency
+        # Milliseconds between chunks of the response bodies
+        self.trickle = trickle
+        # Validators of key responses, 'etag' and 'last-modified'
+        self.response_validators = tuple(validators)
+        self.counts = Counter()
+        self.counts_lock = threading.Lock()
+
+    def count(self, path):
+        """Counts a request by endpoint."""
+        with self.counts_lock:
+            self.counts["total"] += 1
+            self.counts["/".join(path.split("/")[:4])] += 1
+
+    def count_bytes(self, size):
+        """Counts bytes of response bodies."""
+        with self.counts_lock:
+            self.counts["bytes"] += size
+
+    def count_not_modified(self):
+        """Counts 304 responses."""
+        with self.counts_lock:
+            self.counts["not-modified"] += 1
+
+    def stats(self):
+        """Returns copy of the request counters."""
+        with self.counts_lock:
+            return dict(self.counts)
+
+    def validators(self, path, text):
+        """Returns validator headers of the response 'text' to 'path'."""
+        parts = path.strip("/").split("/")
+        if parts[:2] != ["rest", "ssh-key"]:
+            return {}
+        headers = {}
+        if "etag" in self.response_validators:
+            headers["ETag"] = f'"{hashlib.sha1(text.encode()).hexdigest()}"'
+        if "last-modified" in self.response_validators:
+            uid = parts[-1] if parts[2] == "auth" else parts[4]
+            number = self.population.user_by_uid(int(uid))
+            headers["Last-Modified"] = formatdate(
+                self.population.modified(number), usegmt=True
+            )
+        return headers
+
+    def answer(self, path):
+        """Returns status and body for the REST request 'path'."""
+        population = self.population
+        parts = path.strip("/").split("/")
+        if parts[:3] == ["rest", "attrq", "eppn"] and len(parts) == 5:
+            number = population.user_by_eppn(parts[4])
+            if parts[3] not in self.ssns or number is None:
+                return 404, "Not Found"
+            return 200, json.dumps({"eppn": parts[4], "uidNumber": FIRST_UID + number})
+        if parts[:4] == ["rest", "ssh-key", "auth", "all"] and len(parts) == 7:
+            number = population.user_by_uid(int(parts[6]))
+            if parts[4] not in self.ssns or number is None:
+                return 404, "Not Found"
+            return 200, population.service_keys(
+                number, self.ssns.index(parts[4]), len(self.ssns)
+            )
+        if parts[:4] == ["rest", "ssh-key", "list", "uidnumber"] and len(parts) >= 6:
+            number = population.user_by_uid(int(parts[4]))
+            if number is None:
+                return 404, "Not Found"
+            keys = population.keys(number)
+            if parts[5:] == ["key-status", "ACTIVE"]:
+                keys = [key for key in keys if key["keyStatus"] == "ACTIVE"]
+            elif parts[5:] != ["all"]:
+                return 404, "Not Found"
+            fields = ("name", "keyType", "encodedKey", "keyStatus", "createdAt")
+            return 200, json.dumps(
+                [{field: key[field] for field in fields} for key in keys]
+            )
+        return 404, "Not Found"
+
+
+def make_cert(directory):
+    """Creates a self-signed certificate for localhost, returns cert and key path."""
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    if not os.path.exists(cert):
+        subprocess.run(
+            [
+                "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+                "-days", "30", "-subj", "/CN=localhost",
+                "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+                "-keyout", key, "-out", cert,
+            ],
+            check=True,
+            capture_output=True,
+        )  # fmt: skip
+    return cert, key
+
+
+def start_mock(cert, key, port=0, **kwargs):
+    """Starts a mock Reg-App in a thread, returns the server."""
+    # pylint: disable-next=import-outside-toplevel
+    import ssl
+
+    server = MockRegApp(("127.0.0.1", port), **kwargs)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_mock_arguments(parser):
+    """Adds options of the mock Reg-App to 'parser'."""
+    parser.add_argument("--users", type=int, default=1000, help="Number of users")
+    parser.add_argument("--keys-per-user", type=int, default=3, help="Mean keys")
+    parser.add_argument("--fido2-share", type=float, default=0.2, help="FIDO2 keys")
+    parser.add_argument("--expired-share", type=float, default=0.2, help="Expired")
+    parser.add_argument("--latency", type=float, default=20, help="Latency in ms")
+    parser.add_argument("--jitter", type=float, default=10, help="Extra latency ms")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of 503")
+    parser.add_argument(
+        "--slow-share", type=float, default=0, help="Share of slow requests"
+    )
+    parser.add_argument(
+        "--slow-latency", type=float, default=500, help="Extra ms of slow requests"
+    )
+    parser.add_argument(
+        "--trickle", type=float, default=0, help="ms between body chunks"
+    )
+    parser.add_argument(
+        "--validators",
+        nargs="*",
+        choices=VALIDATORS,
+        default=list(VALIDATORS),
+        help="Validators of key responses",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Population seed")
+    parser.add_argument("--ssn", nargs="+", default=[SSN], help="Service names")
+
+
+def mock_options(args):
+    """Returns keyword arguments of 'start_mock' from parsed options."""
+    return {
+        "population": Population(
+            args.users,
+            args.keys_per_user,
+            args.fido2_share,
+            args.expired_share,
+            args.seed,
+        ),
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "slow_share": args.slow_share,
+        "slow_latency": args.slow_latency,
+        "trickle": args.trickle,
+        "validators": args.validators,
+        "ssns": args.ssn,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8443, help="HTTPS port")
+    parser.add_argument(
+        "--cert-dir", default=".", help="Directory of cert.pem and key.pem"
+    )
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    cert_file, key_file = make_cert(args.cert_dir)
+    mock = start_mock(cert_file, key_file, args.port, **mock_options(args))
+    print(
+        f"Mock Reg-App on https://localhost:{mock.server_address[1]}, "
+        f"REQUESTS_CA_BUNDLE={os.path.abspath(cert_file)}",
+        file=sys.stderr,
+    )
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
@@ -5,157 +5,15 @@ All keys are used even if they are no longer valid in bwIDM.
 SSH validity days can be freely defined.
 """
 
-import argparse
-import configparser
-import json
 import os
-import re
 import sys
-from datetime import datetime, timedelta
 
-import requests
-
-# Config file location
-CONFIG_FILE = "/usr/local/etc/bwidm_rest_ssh.conf"
-SSH_KEY_NAME = "UNIFR-JUMPHOST"
-SSH_VALID_DAYS = 365
-
-
-def exit_with_msg(exit_code, *messages):
-    """Function prints message and exits."""
-    for msg in messages:
-        print(msg, file=sys.stderr)
-    sys.exit(exit_code)
-
-
-def check_user_name(ssh_usr):
-    """Function checks if username is valid."""
-    if not re.fullmatch(r"\w{1,12}", ssh_usr):
-        exit_with_msg(41, f"Not a valid user name: {ssh_usr}")
-    return ssh_usr
-
-
-def get_user_id(rest_u, rest_p, max_t, reg_h, sn, ssh_u):
-    """Function takes username and returns user info."""
-    try:
-        response_u = requests.get(
-            f"https://{reg_h}/rest/attrq/eppn/{sn}/{ssh_u}@uni-freiburg.de",
-            auth=(rest_u, rest_p),
-            timeout=max_t,
-        )
-        response_u.raise_for_status()
-    except requests.exceptions.RequestException as r:
-        exit_with_msg(31, f"Access denied ({r})")
-
-    http_code_d = response_u.status_code
-    if http_code_d == 200:
-        user_info_d = response_u.text
-        return user_info_d
-    if http_code_d != 200:
-        exit_with_msg(32, f"Access denied ({http_code_d})")
-    return None
-
-
-def ssh_key_valid(ssh_k_date, ssh_valid_days):
-    """Function takes SSH key date and checks if it is less than SSH_VALID_DAYS old."""
-    try:
-        # Parse the given date
-        original_date = datetime.strptime(ssh_k_date, "%Y-%m-%dT%H:%M:%S.%fZ[UTC]")
-        # Add the specified number of years
-        new_date = original_date + timedelta(days=ssh_valid_days)
-        # Get the current date and time
-        current_date = datetime.utcnow()
-        # print(original_date, new_date, current_date)
-        # Check if the new date has expired
-        if new_date > current_date:
-            return True
-        else:
-            return False
-    except ValueError:
-        # If the date cannot be parsed correctly
-        return False
-
-
-# Command line variables
-parser = argparse.ArgumentParser(description="Process some stuff.")
-parser.add_argument("ssh_user", type=check_user_name, help="SSH User Name")
-args = parser.parse_args()
-ssh_user: str
-ssh_user = args.ssh_user
-
-# Local user, skip AttributeQuery (Access granted)
-authorized_keys_path = f"/etc/ssh/authorized_keys.d/{ssh_user}"
-if os.path.exists(authorized_keys_path):
-    with open(authorized_keys_path, "r", encoding="utf-8") as file:
-        print(file.read())
-    sys.exit(0)
-
-# Config file example:
-## [DEFAULT]
-## max_time = 10
-##
-## [REST]
-## reg_host = registration_host
-## rest_pw = rest_pw
-## rest_user = rest_user
-##
-## [SSN]
-## ssn = service_name
-
-# Read config file
-config = configparser.ConfigParser()
-try:
-    with open(CONFIG_FILE, "r", encoding="utf-8") as conf:
-        max_time: int
-        reg_host: str
-        rest_user: str
-        rest_pw: str
-        ssn: str
-        config.read_file(conf)
-        max_time = config.getint("DEFAULT", "max_time", fallback=10)
-        reg_host = config["REST"]["reg_host"]
-        rest_user = config["REST"]["rest_user"]
-        rest_pw = config["REST"]["rest_pw"]
-        ssn = config["SSN"]["ssn"]
-except OSError:
-    exit_with_msg(21, f"Can not read config file {CONFIG_FILE}")
-
-if not reg_host:
-    exit_with_msg(22, "Config variable reg_host is empty")
-elif not rest_user:
-    exit_with_msg(23, "Config variable rest_user is empty")
-elif not rest_pw:
-    exit_with_msg(24, "Config variable rest_pw is empty")
-elif not ssn:
-    exit_with_msg(25, "Config variable SID is empty")
-
-user_info = json.loads(
-    get_user_id(rest_user, rest_pw, max_time, reg_host, ssn, ssh_user)
+# Shared library location (/usr/local/lib/bwidm_rest)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "lib")
 )
-user_id = user_info["uidNumber"]
-
-try:
-    response = requests.get(
-        # For active keys change to "/key-status/ACTIVE" (valid 3 months)
-        f"https://{reg_host}/rest/ssh-key/list/uidnumber/{user_id}/all",
-        auth=(rest_user, rest_pw),
-        timeout=max_time,
-    )
-    response.raise_for_status()
-except requests.exceptions.RequestException as e:
-    exit_with_msg(11, f"Access was not granted (Access denied). {e}")
+# pylint: disable-next=wrong-import-position
+from bwidm_rest.cli import main
 
-http_code = response.status_code
-if http_code == 200:
-    ssh_keys = json.loads(response.text)
-    for key in ssh_keys:
-        # When "/key-status/ACTIVE" remove "re.match"
-        if re.search(SSH_KEY_NAME, key["name"]) and re.match(
-            r"ACTIVE|EXPIRED", key["keyStatus"]
-        ):
-            ssh_key_date = key["createdAt"]
-            if ssh_key_valid(ssh_key_date, SSH_VALID_DAYS):
-                print(key["keyType"], key["encodedKey"], ssh_user)
-    sys.exit(0)
-elif http_code != 200:
-    exit_with_msg(12, f"Access denied ({http_code})")
+# Lookup mode, see bwidm_rest.pipeline, [LOOKUP] in the config file overrides it
+main("jumphost2")
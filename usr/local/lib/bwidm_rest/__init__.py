@@ -0,0 +1,3 @@
+"""
+Shared code of the bwIDM REST API scripts.
+"""
@@ -0,0 +1,161 @@
+"""
+Key audit of a user population.
+
+Fetches the key lists of many users with a bounded number of concurrent
+requests, a shared connection pool and a rate limit toward the Reg-App, and
+yields one row per key of the full key list: name, type, FIDO2 or plain, key
+name prefix, status, expiry, whether the lookup mode serves the key and
+whether it is revoked. Served keys are found like a lookup does: the key
+source and the filters of the mode without the keys in the revocation set.
+"""
+
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from .defaults import AUDIT_WORKERS
+from .errors import LookupFailed
+from .keys import FIDO2_KEY_TYPE, key_expiry, key_fingerprint, parse_key
+from .pipeline import parse_records
+
+AUDIT_FIELDS = (
+    "user",
+    "uid",
+    "name",
+    "type",
+    "fido2",
+    "prefix",
+    "status",
+    "created",
+    "expires",
+    "days_left",
+    "served",
+    "revoked",
+    "fingerprint",
+    "error",
+)
+
+
+class RateLimiter:
+    """Spaces calls of 'acquire' over all threads to 'rate' per second."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Waits for the next free slot."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next, now)
+            self.next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def iso_time(timestamp):
+    """Returns POSIX 'timestamp' as ISO 8601 UTC time, '' if unknown."""
+    if timestamp is None:
+        return ""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%SZ"
+    )
+
+
+def served_keys(resolver, settings, ssh_user, user_id, text=None):
+    """
+    Returns blobs of the keys that a lookup of 'settings' serves, 'text' is
+    the response of its key source if it was fetched already.
+    """
+    if text is None:
+        text = resolver.key_text(settings, user_id)
+    lines = resolver.run_pipeline(parse_records(text, settings, ssh_user), settings)
+    return {key.blob for key in map(parse_key, lines) if key}
+
+
+def key_rows(ssh_user, user_id, keys, settings, served, revocations, now):
+    """
+    Returns audit rows of the Reg-App key list of a user, 'served' are the
+    blobs of the keys the lookup mode serves.
+    """
+    rows = []
+    for key in keys:
+        expires = key_expiry(key.get("createdAt", ""), settings.valid_days)
+        fingerprint = key_fingerprint(key.get("encodedKey") or "") or ""
+        rows.append(
+            {
+                "user": ssh_user,
+                "uid": user_id,
+                "name": key.get("name") or "",
+                "type": key.get("keyType") or "",
+                "fido2": key.get("keyType") == FIDO2_KEY_TYPE,
+                "prefix": bool(re.search(settings.key_name, key.get("name") or "")),
+                "status": key.get("keyStatus") or "",
+                "created": key.get("createdAt") or "",
+                "expires": iso_time(expires),
+                "days_left": (
+                    None if expires is None else int((expires - now) // 86400)
+                ),
+                "served": key.get("encodedKey") in served,
+                "revoked": revocations.revoked(fingerprint),
+                "fingerprint": fingerprint,
+                "error": "",
+            }
+        )
+    return rows
+
+
+def audit_user(resolver, settings, user, now):
+    """
+    Returns audit rows of the keys of one user, a row with the error
+    if the lookup failed. Users with uidNumber skip the AttributeQuery.
+    Modes with another key source than the full key list fetch it as well.
+    """
+    ssh_user, user_id = user
+    # Name, status and creation date are only in the full key list
+    list_settings = SimpleNamespace(**{**vars(settings), "keys": "all"})
+
+    def fetch(uid):
+        text = resolver.key_text(list_settings, uid)
+        source = text if settings.keys == "all" else None
+        return uid, text, served_keys(resolver, settings, ssh_user, uid, source)
+
+    try:
+        if user_id is None:
+            user_id, text, served = resolver.with_user_id(
+                settings, ssh_user, None, fetch
+            )
+        else:
+            user_id, text, served = fetch(user_id)
+        return key_rows(
+            ssh_user,
+            user_id,
+            json.loads(text),
+            settings,
+            served,
+            resolver.revocations,
+            now,
+        )
+    except (LookupFailed, ValueError) as e:
+        message = " ".join(e.messages) if isinstance(e, LookupFailed) else str(e)
+        row = dict.fromkeys(AUDIT_FIELDS, "")
+        row.update(user=ssh_user, uid=user_id, error=message)
+        return [row]
+
+
+def audit_keys(resolver, settings, users, workers=AUDIT_WORKERS):
+    """
+    Yields audit rows of all 'users' in order, with a bounded number of
+    concurrent lookups.
+    """
+    now = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for rows in executor.map(
+            lambda user: audit_user(resolver, settings, user, now), users
+        ):
+            yield from rows
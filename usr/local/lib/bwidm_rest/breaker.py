@@ -0,0 +1,172 @@
+"""
+Circuit breaker for requests to the Reg-App, shared by all processes.
+
+The state is kept in a small file per Reg-App host. After 'failure_threshold'
+consecutive failures (connection errors, timeouts, 5xx) the breaker opens and
+requests fail immediately with 'Unreachable', so logins do not hang for
+'max_time' and the key cache can serve last-known-good keys.
+After 'reset_timeout' seconds one process sends a probe request (half-open),
+which closes the breaker on any HTTP answer, also a client error (4xx), and
+opens it again on failure.
+"""
+
+import fcntl
+import json
+import os
+import re
+import sys
+import time
+
+from .defaults import FAILURE_THRESHOLD, RESET_TIMEOUT
+from .errors import RestError, Unreachable
+
+
+def log(message):
+    """Logs breaker transitions to syslog (sshd discards stderr) and stderr."""
+    import syslog  # pylint: disable=import-outside-toplevel
+
+    syslog.openlog("bwidm_rest_ssh", syslog.LOG_PID, syslog.LOG_AUTH)
+    syslog.syslog(syslog.LOG_WARNING, message)
+    print(message, file=sys.stderr)
+
+
+class CircuitBreaker:
+    """Circuit breaker of one Reg-App host, state in 'breaker_dir'."""
+
+    def __init__(
+        self,
+        breaker_dir,
+        host,
+        failure_threshold=FAILURE_THRESHOLD,
+        reset_timeout=RESET_TIMEOUT,
+    ):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.path = None
+        if breaker_dir and failure_threshold > 0:
+            name = re.sub(r"[^\w.-]", "_", host)
+            self.path = os.path.join(breaker_dir, f"breaker-{name}.json")
+
+    def read(self):
+        """Returns number of consecutive failures and open time (0 if closed)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+            return int(state["failures"]), float(state["opened"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, 0.0
+
+    def write(self, failures, opened):
+        """Writes state atomically, a closed breaker has no state file."""
+        if not failures and not opened:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump({"failures": failures, "opened": opened}, file)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def lock(self, suffix, flags=0):
+        """Returns fd holding the lock file 'suffix', None if it is taken."""
+        try:
+            os.makedirs(os.path.dirname(self.path), mode=0o755, exist_ok=True)
+            fd = os.open(f"{self.path}.{suffix}", os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | flags)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def update(self, change):
+        """Replaces state by 'change(failures, opened)' under the state lock."""
+        fd = self.lock("lock")
+        if fd is None:
+            return
+        try:
+            state = self.read()
+            new_state = change(*state)
+            if new_state != state:
+                self.write(*new_state)
+        finally:
+            os.close(fd)
+
+    def is_open(self):
+        """Returns True while the breaker is open and no probe is due."""
+        if self.path is None:
+            return False
+        _, opened = self.read()
+        return bool(opened) and time.time() - opened < self.reset_timeout
+
+    def failed(self, failures, opened, probe=False):
+        """Returns state after a failed request."""
+        failures += 1
+        if opened and probe:
+            log(f"Circuit breaker for {self.host} stays open, probe request failed")
+            return failures, time.time()
+        if not opened and failures >= self.failure_threshold:
+            log(f"Circuit breaker for {self.host} opened after {failures} failures")
+            return failures, time.time()
+        return failures, opened
+
+    def succeeded(self, failures, opened):
+        """Returns state after a successful request."""
+        if opened:
+            log(f"Circuit breaker for {self.host} closed, probe request succeeded")
+        return 0, 0.0
+
+    def fail_fast(self, opened):
+        """Raises 'Unreachable' for requests while the breaker is open."""
+        remaining = max(0, opened + self.reset_timeout - time.time())
+        raise Unreachable(
+            f"Circuit breaker open, {self.host} not contacted "
+            f"(next probe in {remaining:.0f} s)"
+        )
+
+    def call(self, request):
+        """
+        Calls 'request' unless the breaker is open and records the result,
+        'RestError' (an answer of the endpoint) counts as success.
+        """
+        if self.path is None:
+            return request()
+        failures, opened = self.read()
+        probe_fd = None
+        if opened:
+            if time.time() - opened < self.reset_timeout:
+                self.fail_fast(opened)
+            # Half-open: only one process sends the probe request
+            probe_fd = self.lock("probe", fcntl.LOCK_NB)
+            if probe_fd is None:
+                self.fail_fast(opened)
+            # Another process may have probed while we were checking
+            failures, opened = self.read()
+            if opened and time.time() - opened < self.reset_timeout:
+                os.close(probe_fd)
+                self.fail_fast(opened)
+        try:
+            result = request()
+        except Unreachable:
+            probe = probe_fd is not None
+            self.update(lambda f, o: self.failed(f, o, probe))
+            raise
+        except RestError:
+            if failures or opened:
+                self.update(self.succeeded)
+            raise
+        else:
+            if failures or opened:
+                self.update(self.succeeded)
+        finally:
+            if probe_fd is not None:
+                os.close(probe_fd)
+        return result
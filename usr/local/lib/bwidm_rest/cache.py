@@ -0,0 +1,325 @@
+"""
+On-disk cache for responses of the Reg-App.
+Entries are keyed by service name and uidNumber (or EPPN).
+
+Fresh entries (younger than 'ttl') are served without touching the network.
+Stale entries (younger than 'stale_ttl') are served and refreshed in the
+background: by a thread in the resolver daemon, by a process forked after
+the lookup in the scripts.
+Older entries are only served if the Reg-App can not be reached,
+never if they are older than 'max_age'.
+
+Entries keep the validators of the response (ETag, Last-Modified or a hash
+of the text). Fetches get the validators of the entry and may answer that
+the response did not change (HTTP 304). The entry is then only touched,
+the modification time of entries with validators is the time of their
+last revalidation.
+
+Fetches are coalesced (single-flight): sshd often runs the lookup several
+times at once for the same user. The first process takes a lock in
+'lock_dir' and fetches, the others wait for the lock and read its entry.
+"""
+
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import quote
+
+from .errors import Unreachable
+
+# Entries already read or written by this process (resolver daemon)
+_memory = {}
+# Entries refreshed by threads of this process
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+# Refreshes queued for the process forked by refresh_pending
+_pending = []
+
+
+def cache_path(cache_dir, kind, ssn, uid):
+    """Returns path of the cache entry for service 'ssn' and user 'uid'."""
+    ssn = re.sub(r"[^\w.-]", "_", ssn)
+    # EPPNs may contain any character, do not allow "/" or ".."
+    uid = quote(str(uid), safe="@").replace(".", "%2E")
+    return os.path.join(cache_dir, kind, ssn, f"{uid}.json")
+
+
+def read_entry(path):
+    """
+    Returns age in seconds, cached text and validators of the response
+    (None if there are none), or None if there is no entry.
+    """
+    # The entry may have been rewritten or removed by another process
+    try:
+        stat = os.stat(path)
+    except OSError:
+        _memory.pop(path, None)
+        return None
+    entry = _memory.get(path)
+    if entry is None or entry[0] != stat.st_mtime_ns:
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            fetched = float(data["fetched"])
+            validators = data.get("validators")
+            if validators:
+                fetched = max(fetched, stat.st_mtime)
+            entry = (
+                stat.st_mtime_ns,
+                fetched,
+                str(data["text"]),
+                dict(validators) if validators else None,
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        _memory[path] = entry
+    return time.time() - entry[1], entry[2], entry[3]
+
+
+def read_cache(path):
+    """Returns age in seconds and cached text, or None if there is no entry."""
+    entry = read_entry(path)
+    return None if entry is None else entry[:2]
+
+
+def write_cache(path, text, validators=None):
+    """Writes cache entry atomically, errors are ignored."""
+    fetched = time.time()
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    data = {"fetched": fetched, "text": text}
+    if validators:
+        data["validators"] = validators
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
+        _memory[path] = (os.stat(path).st_mtime_ns, fetched, text, validators)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def touch_cache(path, text, validators):
+    """
+    Starts the lifetime of the unchanged entry 'path' with 'validators'
+    again, rewrites it if it can not be touched.
+    """
+    try:
+        os.utime(path)
+        stat = os.stat(path)
+        _memory[path] = (stat.st_mtime_ns, stat.st_mtime, text, validators)
+    except OSError:
+        write_cache(path, text, validators)
+
+
+def remove_cache(path):
+    """Removes cache entry, e.g. if access was revoked."""
+    _memory.pop(path, None)
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def flush_cache(cache_dir, kind=None):
+    """Removes all cache entries, or all entries of 'kind'."""
+    _memory.clear()
+    top = os.path.join(cache_dir, kind) if kind else cache_dir
+    for dir_path, _, file_names in os.walk(top):
+        for file_name in file_names:
+            if file_name.endswith(".json"):
+                remove_cache(os.path.join(dir_path, file_name))
+
+
+def open_lock(lock_dir, path):
+    """Returns fd of the lock file of cache entry 'path', None if not possible."""
+    if not lock_dir:
+        return None
+    name = path.strip(os.sep).replace(os.sep, "_")
+    try:
+        os.makedirs(lock_dir, mode=0o700, exist_ok=True)
+        return os.open(
+            os.path.join(lock_dir, f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600
+        )
+    except OSError:
+        return None
+
+
+def try_lock(fd):
+    """Takes the lock without waiting, returns False if somebody else holds it."""
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def wait_lock(fd, timeout):
+    """Waits up to 'timeout' seconds for the lock, returns False on timeout."""
+    deadline = time.monotonic() + timeout
+    delay = 0.002
+    while not try_lock(fd):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+    return True
+
+
+def fetch_entry(fetch, path, cached):
+    """
+    Calls 'fetch' with the validators of the 'cached' entry and writes the
+    entry 'path', returns text and 'miss', or 'revalidated' if the
+    response did not change.
+    """
+    validators = cached[2] if cached is not None else None
+    fetched = fetch(validators)
+    if fetched is None:
+        touch_cache(path, cached[1], validators)
+        return cached[1], "revalidated"
+    text, validators = fetched
+    write_cache(path, text, validators)
+    return text, "miss"
+
+
+def single_flight(fetch, path, lock_dir, timeout, cached=None):
+    """
+    Fetches and writes the cache entry 'path' (see fetch_entry), 'cached'
+    is the entry read before. If another process or thread is already
+    fetching 'path', waits up to 'timeout' seconds and returns its entry
+    and 'coalesced' instead.
+    """
+    fd = open_lock(lock_dir, path)
+    try:
+        if fd is not None and not try_lock(fd):
+            started = time.time()
+            if wait_lock(fd, timeout):
+                written = read_cache(path)
+                # Only use an entry written while waiting, if the leader
+                # failed the entry is missing or old and we fetch ourselves
+                if written and written[0] <= time.time() - started:
+                    return written[1], "coalesced"
+        return fetch_entry(fetch, path, cached)
+    finally:
+        # Closing the fd releases the lock
+        if fd is not None:
+            os.close(fd)
+
+
+def refresh(fetch, path, lock_dir=None):
+    """Refreshes the cache entry 'path', removes it if access was denied."""
+    fd = open_lock(lock_dir, path)
+    try:
+        # Somebody else is already fetching the entry
+        if fd is not None and not try_lock(fd):
+            return
+        fetch_entry(fetch, path, read_entry(path))
+    except Unreachable:
+        pass
+    except Exception:  # pylint: disable=broad-exception-caught
+        # Access denied, do not serve the old entry again
+        remove_cache(path)
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+def refresh_in_background(fetch, path, lock_dir=None):
+    """Queues a refresh of the cache entry 'path' for refresh_pending."""
+    _pending.append((fetch, path, lock_dir))
+
+
+def refresh_pending(quiet=lambda: True):
+    """
+    Forks a detached process that refreshes the queued cache entries.
+    sshd waits for EOF on stdout, so the child closes all standard streams.
+    The child only has the forking thread, locks held by other threads
+    would never be released there: while 'quiet()' returns False the queue
+    is dropped, a later lookup of the stale entries queues them again.
+    """
+    pending = list(_pending)
+    _pending.clear()
+    if not pending or not quiet():
+        return
+    try:
+        pid = os.fork()
+    except OSError:
+        return
+    if pid:
+        return
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    for fetch, path, lock_dir in pending:
+        refresh(fetch, path, lock_dir)
+    os._exit(0)
+
+
+def refresh_in_thread(fetch, path, lock_dir=None):
+    """Refreshes the cache entry 'path' in a thread (resolver daemon)."""
+    with _refreshing_lock:
+        if path in _refreshing:
+            return
+        _refreshing.add(path)
+
+    def run():
+        try:
+            refresh(fetch, path, lock_dir)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(path)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def cached_fetch(
+    fetch,
+    path,
+    ttl,
+    stale_ttl,
+    max_age,
+    background=refresh_in_background,
+    lock_dir=None,
+    lock_timeout=10,
+    on_outcome=None,
+):
+    """
+    Returns text of cache entry 'path', calls 'fetch' only when needed.
+    'fetch' gets the validators of the entry (None if there are none),
+    returns the text and the validators of the response, None if it did
+    not change, and raises 'Unreachable' if the Reg-App is down.
+    Concurrent fetches of 'path' are coalesced with a lock in 'lock_dir'.
+    'on_outcome' is called with 'hit', 'stale', 'miss', 'revalidated',
+    'coalesced' or 'fallback' (served because the Reg-App is down).
+    """
+    report = on_outcome or (lambda outcome: None)
+    cached = read_entry(path)
+    if cached:
+        age, text, _ = cached
+        if age < ttl:
+            report("hit")
+            return text
+        if age < stale_ttl:
+            background(fetch, path, lock_dir)
+            report("stale")
+            return text
+    try:
+        text, outcome = single_flight(fetch, path, lock_dir, lock_timeout, cached)
+    except Unreachable:
+        # Serve last-known-good keys
+        if cached and cached[0] < max_age:
+            report("fallback")
+            return cached[1]
+        raise
+    except Exception:
+        remove_cache(path)
+        raise
+    report(outcome)
+    return text
@@ -0,0 +1,149 @@
+"""
+Command line of the AuthorizedKeysCommand scripts in /usr/local/bin.
+Only reads the config and the key store until the lookup runs in this
+process.
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+from .client import query_daemon
+from .config import CONFIG_FILE, read_config
+from .deadline import lookup_deadline
+from .errors import LookupFailed, exit_with_msg
+from .keys import key_fingerprint
+from .metrics import Metrics, process_age
+from .pipeline import lookup_settings
+from .revoked import RevocationSet
+from .store import stored_keys
+from .warm import record_login
+
+MIN_USER_ID = 900000
+LOCAL_KEYS_DIR = "/etc/ssh/authorized_keys.d"
+
+
+def check_user_name(ssh_usr):
+    """Function checks if username is valid."""
+    if not re.fullmatch(r"\w{1,12}", ssh_usr):
+        exit_with_msg(41, f"Not a valid user name: {ssh_usr}")
+    return ssh_usr
+
+
+def check_user_id(uid):
+    """Check if user ID is within range."""
+    if re.fullmatch(r"\d{6}", uid):
+        uid = int(uid)
+        if uid > MIN_USER_ID:
+            return uid
+    exit_with_msg(31, f"Not a bwIDM User ID: {uid}")
+
+
+def check_fingerprint(key):
+    """
+    Returns SHA256 fingerprint of the key offered by the client, given as
+    fingerprint (sshd token %f) or base64 key blob (%k).
+    """
+    if re.fullmatch(r"SHA256:[A-Za-z0-9+/]{43}", key):
+        return key
+    fingerprint = key_fingerprint(key)
+    if fingerprint is None:
+        exit_with_msg(42, f"Not a key or fingerprint: {key}")
+    return fingerprint
+
+
+def serve_stored_keys(conf, mode, ssh_user, user_id, fingerprint, phases):
+    """
+    Prints the keys of 'ssh_user' from the key store of the bulk sync
+    ('[SYNC] store' for the '[LOOKUP] mode' of 'mode') and exits, returns
+    if the store does not have them. The login is recorded in the metrics
+    spool (cache kind 'store') and the login history like other lookups.
+    """
+    if not conf.sync_store:
+        return
+    keys = stored_keys(
+        conf.sync_store,
+        conf.sync_store_max_age,
+        lookup_settings(mode, conf.lookup).mode,
+        ssh_user,
+        user_id,
+        RevocationSet(conf.cache_revoked),
+        fingerprint,
+    )
+    if keys is None:
+        return
+    sys.stdout.buffer.write(keys)
+    sys.stdout.flush()
+    metrics = Metrics(conf.metrics_spool)
+    metrics.begin(mode, phases)
+    metrics.cache("store", "hit")
+    metrics.finish(0)
+    if conf.warm_history:
+        record_login(conf.warm_history, mode, ssh_user, user_id)
+    sys.exit(0)
+
+
+def main(mode, with_user_id=False):
+    """
+    Prints the SSH keys of the user for lookup 'mode' and exits.
+    'with_user_id' scripts get the uidNumber as second argument.
+    The key store of the config file is tried first, with '--config' the
+    lookup then runs in this process, otherwise the resolver daemon is asked
+    before.
+    With '--fingerprint' only the lines of the key offered by the client
+    are printed.
+    """
+    # Command line variables
+    parser = argparse.ArgumentParser(description="Process some stuff.")
+    parser.add_argument("ssh_user", type=check_user_name, help="SSH User Name")
+    if with_user_id:
+        parser.add_argument("user_id", type=check_user_id, help="SSH User ID")
+    parser.add_argument("-c", "--config", help="Config file")
+    parser.add_argument(
+        "--fingerprint",
+        type=check_fingerprint,
+        help="Offered key, fingerprint (%%f) or key blob (%%k)",
+    )
+    args = parser.parse_args()
+    ssh_user: str
+    ssh_user = args.ssh_user
+    user_id = args.user_id if with_user_id else None
+    fingerprint = args.fingerprint
+
+    # Local user, skip AttributeQuery (Access granted)
+    authorized_keys_path = os.path.join(LOCAL_KEYS_DIR, ssh_user)
+    if os.path.exists(authorized_keys_path):
+        with open(authorized_keys_path, "r", encoding="utf-8") as file:
+            print(file.read())
+        sys.exit(0)
+
+    startup = process_age()
+    started = time.perf_counter()
+    try:
+        conf = read_config(args.config or CONFIG_FILE)
+        phases = {"config": time.perf_counter() - started}
+        if startup is not None:
+            phases["startup"] = startup
+        # The deadline counts from the start of the script
+        deadline = lookup_deadline(conf.deadline, (startup or 0) + phases["config"])
+        # Keys of the last bulk sync, returns if the store does not have them
+        serve_stored_keys(conf, mode, ssh_user, user_id, fingerprint, phases)
+    except LookupFailed as e:
+        exit_with_msg(e.exit_code, *e.messages)
+    if args.config is None:
+        # Ask the resolver daemon, returns only if it is not running
+        query_daemon(
+            mode,
+            ssh_user,
+            user_id,
+            fingerprint=fingerprint,
+            remaining=deadline.remaining(),
+        )
+
+    # Lookup in this process
+    # pylint: disable-next=import-outside-toplevel
+    from .lookup import run_lookup
+
+    run_lookup(mode, ssh_user, user_id, conf, phases, deadline, fingerprint)
@@ -0,0 +1,58 @@
+"""
+Client of the resolver daemon (bwidm_rest_sshd.py).
+Only uses the standard library to keep the start of the scripts fast.
+"""
+
+import json
+import socket
+import sys
+
+DAEMON_SOCKET = "/run/bwidm_rest_ssh/resolver.sock"
+# Seconds to wait for the daemon if the lookup has no deadline
+DAEMON_TIMEOUT = 30
+# Shares of the time left until the deadline: the lookup of the daemon gets
+# the first, the script waits for the answer a little longer and keeps the
+# rest for the lookup in its own process
+DAEMON_SHARE = 0.5
+DAEMON_WAIT = 0.6
+
+
+def query_daemon(
+    mode,
+    ssh_user,
+    user_id=None,
+    socket_path=DAEMON_SOCKET,
+    fingerprint=None,
+    remaining=None,
+):
+    """
+    Asks the resolver daemon for the keys of 'ssh_user' (only the key with
+    'fingerprint' if given), prints them and exits. With 'remaining'
+    seconds until the deadline of the lookup the daemon only gets part of
+    them.
+    Returns only if the daemon is not running or does not answer.
+    """
+    request = {"mode": mode, "ssh_user": ssh_user, "user_id": user_id}
+    if fingerprint is not None:
+        request["fingerprint"] = fingerprint
+    timeout = DAEMON_TIMEOUT
+    if remaining is not None:
+        request["deadline"] = remaining * DAEMON_SHARE
+        timeout = remaining * DAEMON_WAIT
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as reply_file:
+                reply = json.loads(reply_file.readline())
+        exit_code = int(reply["exit"])
+        keys = [str(key) for key in reply["keys"]]
+        messages = [str(msg) for msg in reply["messages"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return
+    for msg in messages:
+        print(msg, file=sys.stderr)
+    for key in keys:
+        print(key)
+    sys.exit(exit_code)
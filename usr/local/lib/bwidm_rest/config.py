@@ -0,0 +1,220 @@
+"""
+Config file handling of the bwIDM REST API scripts.
+"""
+
+# Config file example:
+## [DEFAULT]
+## max_time = 10
+## # seconds for a whole lookup, default max_time, see bwidm_rest.deadline
+## deadline = 10
+##
+## [REST]
+## reg_host = registration_host
+## # or several endpoints in order of preference, see bwidm_rest.endpoints
+## reg_host = registration_host, other_registration_host
+## hedge_percentile = 95
+## hedge_delay = 0.5
+## rest_pw = rest_pw
+## rest_user = rest_user
+## transport = requests
+## failure_threshold = 3
+## reset_timeout = 30
+## breaker_dir = /run/bwidm_rest_ssh
+##
+## [SSN]
+## ssn = service_name
+## # or several services, their keys are merged
+## ssn = service_name, other_service_name
+##
+## [CACHE]
+## cache_dir = /var/cache/bwidm_rest_ssh
+## ttl = 300
+## stale_ttl = 3600
+## max_age = 86400
+## revalidate = yes
+## uid_ttl = 86400
+## negative_ttl = 60
+## negative_max_entries = 10000
+## lock_dir = /run/bwidm_rest_ssh/locks
+## eppn_index = /var/lib/bwidm_rest_ssh/eppn.index
+## eppn_index_max_age = 3600
+## revoked = /var/lib/bwidm_rest_ssh/revoked.set
+##
+## [METRICS]
+## spool = /run/bwidm_rest_ssh/metrics.spool
+## textfile = /var/lib/node_exporter/textfile_collector/bwidm_rest_ssh.prom
+## state = /var/lib/bwidm_rest_ssh/metrics.json
+##
+## [LOOKUP]
+## mode = jumphost2
+## users = eppn
+## keys = all
+## filters = prefix, status, age
+## key_name = UNIFR-JUMPHOST
+## key_status = ACTIVE, EXPIRED
+## valid_days = 365
+## eppn_domain = uni-freiburg.de
+##
+## [SYNC]
+## mode = ssh
+## output_dir = /var/lib/bwidm_rest_ssh/authorized_keys
+## workers = 8
+## state_dir = /var/lib/bwidm_rest_ssh/sync-state
+## store = /var/lib/bwidm_rest_ssh/keys.store
+## store_max_age = 3600
+##
+## [AUDIT]
+## workers = 8
+## rate = 20
+##
+## [WARM]
+## history = /run/bwidm_rest_ssh/logins.spool
+## state = /var/lib/bwidm_rest_ssh/logins.json
+## days = 7
+## lead = 120
+## budget = 200
+## recent = 3600
+
+import configparser
+from types import SimpleNamespace
+
+from .defaults import (
+    AUDIT_RATE,
+    AUDIT_WORKERS,
+    BREAKER_DIR,
+    CACHE_DIR,
+    CACHE_LOCK_DIR,
+    CACHE_MAX_AGE,
+    CACHE_REVALIDATE,
+    CACHE_STALE_TTL,
+    CACHE_TTL,
+    CACHE_UID_TTL,
+    DELTA_DIR,
+    EPPN_INDEX,
+    EPPN_INDEX_MAX_AGE,
+    FAILURE_THRESHOLD,
+    HEDGE_DELAY,
+    HEDGE_PERCENTILE,
+    KEY_STORE,
+    METRICS_SPOOL,
+    METRICS_STATE,
+    METRICS_TEXTFILE,
+    NEGATIVE_MAX_ENTRIES,
+    NEGATIVE_TTL,
+    RESET_TIMEOUT,
+    REVOKED_SET,
+    STORE_MAX_AGE,
+    SYNC_DIR,
+    SYNC_WORKERS,
+    WARM_BUDGET,
+    WARM_DAYS,
+    WARM_HISTORY,
+    WARM_LEAD,
+    WARM_RECENT,
+    WARM_STATE,
+)
+from .errors import LookupFailed
+from .pipeline import LOOKUP_OPTIONS, split_list
+from .transport import TRANSPORTS
+
+# Config file location
+CONFIG_FILE = "/usr/local/etc/bwidm_rest_ssh.conf"
+
+
+def read_config(config_file=CONFIG_FILE):
+    """Reads config file and returns settings as namespace."""
+    config = configparser.ConfigParser()
+    try:
+        with open(config_file, "r", encoding="utf-8") as conf:
+            config.read_file(conf)
+            settings = SimpleNamespace(
+                max_time=config.getint("DEFAULT", "max_time", fallback=10),
+                deadline=config.getfloat(
+                    "DEFAULT",
+                    "deadline",
+                    fallback=config.getint("DEFAULT", "max_time", fallback=10),
+                ),
+                reg_hosts=split_list(config["REST"]["reg_host"]),
+                rest_user=config["REST"]["rest_user"],
+                rest_pw=config["REST"]["rest_pw"],
+                transport=config.get("REST", "transport", fallback="requests"),
+                failure_threshold=config.getint(
+                    "REST", "failure_threshold", fallback=FAILURE_THRESHOLD
+                ),
+                reset_timeout=config.getint(
+                    "REST", "reset_timeout", fallback=RESET_TIMEOUT
+                ),
+                breaker_dir=config.get("REST", "breaker_dir", fallback=BREAKER_DIR),
+                hedge_percentile=config.getint(
+                    "REST", "hedge_percentile", fallback=HEDGE_PERCENTILE
+                ),
+                hedge_delay=config.getfloat(
+                    "REST", "hedge_delay", fallback=HEDGE_DELAY
+                ),
+                ssns=split_list(config["SSN"]["ssn"]),
+                cache_dir=config.get("CACHE", "cache_dir", fallback=CACHE_DIR),
+                cache_ttl=config.getint("CACHE", "ttl", fallback=CACHE_TTL),
+                cache_stale_ttl=config.getint(
+                    "CACHE", "stale_ttl", fallback=CACHE_STALE_TTL
+                ),
+                cache_max_age=config.getint("CACHE", "max_age", fallback=CACHE_MAX_AGE),
+                cache_revalidate=config.getboolean(
+                    "CACHE", "revalidate", fallback=CACHE_REVALIDATE
+                ),
+                cache_uid_ttl=config.getint("CACHE", "uid_ttl", fallback=CACHE_UID_TTL),
+                cache_negative_ttl=config.getint(
+                    "CACHE", "negative_ttl", fallback=NEGATIVE_TTL
+                ),
+                cache_negative_max_entries=config.getint(
+                    "CACHE", "negative_max_entries", fallback=NEGATIVE_MAX_ENTRIES
+                ),
+                cache_lock_dir=config.get("CACHE", "lock_dir", fallback=CACHE_LOCK_DIR),
+                cache_eppn_index=config.get("CACHE", "eppn_index", fallback=EPPN_INDEX),
+                cache_eppn_index_max_age=config.getint(
+                    "CACHE", "eppn_index_max_age", fallback=EPPN_INDEX_MAX_AGE
+                ),
+                cache_revoked=config.get("CACHE", "revoked", fallback=REVOKED_SET),
+                metrics_spool=config.get("METRICS", "spool", fallback=METRICS_SPOOL),
+                metrics_textfile=config.get(
+                    "METRICS", "textfile", fallback=METRICS_TEXTFILE
+                ),
+                metrics_state=config.get("METRICS", "state", fallback=METRICS_STATE),
+                lookup={
+                    option: config.get("LOOKUP", option)
+                    for option in LOOKUP_OPTIONS
+                    if config.has_option("LOOKUP", option)
+                },
+                sync_mode=config.get("SYNC", "mode", fallback=None),
+                sync_dir=config.get("SYNC", "output_dir", fallback=SYNC_DIR),
+                sync_workers=config.getint("SYNC", "workers", fallback=SYNC_WORKERS),
+                sync_state_dir=config.get("SYNC", "state_dir", fallback=DELTA_DIR),
+                sync_store=config.get("SYNC", "store", fallback=KEY_STORE),
+                sync_store_max_age=config.getint(
+                    "SYNC", "store_max_age", fallback=STORE_MAX_AGE
+                ),
+                audit_workers=config.getint("AUDIT", "workers", fallback=AUDIT_WORKERS),
+                audit_rate=config.getfloat("AUDIT", "rate", fallback=AUDIT_RATE),
+                warm_history=config.get("WARM", "history", fallback=WARM_HISTORY),
+                warm_state=config.get("WARM", "state", fallback=WARM_STATE),
+                warm_days=config.getint("WARM", "days", fallback=WARM_DAYS),
+                warm_lead=config.getint("WARM", "lead", fallback=WARM_LEAD),
+                warm_budget=config.getint("WARM", "budget", fallback=WARM_BUDGET),
+                warm_recent=config.getint("WARM", "recent", fallback=WARM_RECENT),
+            )
+    except OSError as e:
+        raise LookupFailed(21, f"Can not read config file {config_file}") from e
+
+    if not settings.reg_hosts:
+        raise LookupFailed(22, "Config variable reg_host is empty")
+    settings.reg_host = settings.reg_hosts[0]
+    if not settings.rest_user:
+        raise LookupFailed(23, "Config variable rest_user is empty")
+    if not settings.rest_pw:
+        raise LookupFailed(24, "Config variable rest_pw is empty")
+    if not settings.ssns:
+        raise LookupFailed(25, "Config variable SID is empty")
+    # Cache entries and AttributeQuery of the first service
+    settings.ssn = settings.ssns[0]
+    if settings.transport not in TRANSPORTS:
+        raise LookupFailed(26, f"Not a valid transport: {settings.transport}")
+    return settings
@@ -0,0 +1,66 @@
+"""
+Deadline of a key lookup.
+
+'max_time' is the timeout of a single socket operation: a lookup with an
+AttributeQuery and a key fetch, redirects, retries or a response that
+trickles in may take many times 'max_time', longer than sshd waits for the
+AuthorizedKeysCommand (LoginGraceTime). A lookup gets one deadline
+('[DEFAULT] deadline' seconds after the start of the script), every step
+only waits for the time that is left, and requests that are still running
+at the deadline are abandoned. The lookup then serves cached keys or fails
+like for an unreachable Reg-App.
+"""
+
+import time
+
+from .errors import Unreachable
+
+
+class Deadline:
+    """
+    Point in time a lookup must be done, 'seconds' after a start 'elapsed'
+    seconds ago, never for 'seconds' None.
+    """
+
+    def __init__(self, seconds=None, elapsed=0.0):
+        self.seconds = seconds
+        self.end = None if seconds is None else time.monotonic() + seconds - elapsed
+
+    def bounded(self):
+        """Returns True if there is a deadline."""
+        return self.end is not None
+
+    def remaining(self):
+        """Returns seconds until the deadline, None without deadline."""
+        if self.end is None:
+            return None
+        return max(0.0, self.end - time.monotonic())
+
+    def expired(self):
+        """Returns True if the deadline has passed."""
+        return self.end is not None and time.monotonic() >= self.end
+
+    def exceeded(self):
+        """Returns the error of a lookup that ran out of time."""
+        return Unreachable(f"Deadline of {self.seconds:g} s exceeded")
+
+    def timeout(self, seconds=None):
+        """
+        Returns timeout of the next step: 'seconds', but at most the time
+        that is left (None: no timeout). Raises 'Unreachable' if no time is left.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return seconds
+        if remaining <= 0:
+            raise self.exceeded()
+        return remaining if seconds is None else min(seconds, remaining)
+
+
+# Bulk operations (sync, audit) only have the timeouts of each request
+NO_DEADLINE = Deadline()
+
+
+def lookup_deadline(seconds, elapsed=0.0):
+    """Returns deadline of a lookup, none for 'seconds' 0."""
+    return Deadline(seconds, elapsed) if seconds else NO_DEADLINE
@@ -0,0 +1,62 @@
+"""
+Defaults of the config file settings.
+
+read_config runs on every login, so the defaults are kept in this module
+without imports instead of the modules that use them.
+"""
+
+# [REST], see bwidm_rest.breaker and bwidm_rest.endpoints
+BREAKER_DIR = "/run/bwidm_rest_ssh"
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 30
+# Percentile of the response times after which a request is hedged, 0: never
+HEDGE_PERCENTILE = 95
+# Seconds until a request is hedged, while there are too few samples
+HEDGE_DELAY = 0.5
+
+# [CACHE], see bwidm_rest.cache, bwidm_rest.negative, bwidm_rest.eppn
+# and bwidm_rest.revoked
+CACHE_DIR = "/var/cache/bwidm_rest_ssh"
+CACHE_TTL = 300
+CACHE_STALE_TTL = 3600
+CACHE_MAX_AGE = 86400
+CACHE_UID_TTL = 86400
+# Conditional requests with the validators of cached responses
+CACHE_REVALIDATE = True
+CACHE_LOCK_DIR = "/run/bwidm_rest_ssh/locks"
+NEGATIVE_TTL = 60
+NEGATIVE_MAX_ENTRIES = 10000
+EPPN_INDEX = "/var/lib/bwidm_rest_ssh/eppn.index"
+# Seconds an index is used after it was built
+EPPN_INDEX_MAX_AGE = 3600
+REVOKED_SET = "/var/lib/bwidm_rest_ssh/revoked.set"
+
+# [METRICS], see bwidm_rest.metrics
+METRICS_SPOOL = "/run/bwidm_rest_ssh/metrics.spool"
+METRICS_TEXTFILE = "/var/lib/node_exporter/textfile_collector/bwidm_rest_ssh.prom"
+METRICS_STATE = "/var/lib/bwidm_rest_ssh/metrics.json"
+
+# [SYNC], see bwidm_rest.sync, bwidm_rest.delta and bwidm_rest.store
+SYNC_DIR = "/var/lib/bwidm_rest_ssh/authorized_keys"
+SYNC_WORKERS = 8
+DELTA_DIR = "/var/lib/bwidm_rest_ssh/sync-state"
+KEY_STORE = "/var/lib/bwidm_rest_ssh/keys.store"
+# Seconds a store is used after the sync that built it
+STORE_MAX_AGE = 3600
+
+# [AUDIT], see bwidm_rest.audit
+AUDIT_WORKERS = 8
+# Reg-App requests per second of an audit, 0 for no limit
+AUDIT_RATE = 20
+
+# [WARM], see bwidm_rest.warm
+WARM_HISTORY = "/run/bwidm_rest_ssh/logins.spool"
+WARM_STATE = "/var/lib/bwidm_rest_ssh/logins.json"
+# Days of login history
+WARM_DAYS = 7
+# Seconds before expiry an entry is refreshed, and prediction horizon
+WARM_LEAD = 120
+# Reg-App requests per run
+WARM_BUDGET = 200
+# Seconds after a login the user is expected to log in again
+WARM_RECENT = 3600
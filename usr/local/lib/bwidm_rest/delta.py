@@ -0,0 +1,304 @@
+"""
+Incremental synchronization of the keys of users.
+
+The state of each user holds the digest of the last Reg-App response, its keys
+with name, keyStatus, createdAt and expiry instant (computed once), the synced
+keys before the revocation set is applied and the time the output changes next because a key gets older than
+'valid_days'. The expiry of synced keys is also kept in an expiry index
+(see bwidm_rest.expiry). The Reg-App has no
+delta queries, so the response is still transferred, but an unchanged one is
+not parsed or filtered again, its keys are only compared with the synced
+file. Otherwise the changes are applied:
+new keys, status transitions and removed keys. Revoked and removed keys go
+to the revocation set (see bwidm_rest.revoked). The synced keys are filtered
+by the current revocation set on every sync, so keys removed from the set are
+synced again.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from .expiry import EXPIRY_INDEX, Expiry, ExpiryIndex, index_lock
+from .keys import key_expiry, key_fingerprint, line_fingerprint
+from .pipeline import parse_records, run_pipeline
+from .revoked import REVOKED_STATUS, SYNC_NOTE
+
+KEY_FIELDS = ("name", "keyType", "encodedKey", "keyStatus", "createdAt")
+
+
+def key_states(text, settings):
+    """Returns the keys of a Reg-App response by key blob (service keys by line)."""
+    if settings.keys == "service":
+        return {line: {} for line in text.splitlines() if line}
+    return {
+        key["encodedKey"]: {field: key.get(field) for field in KEY_FIELDS}
+        for key in json.loads(text)
+    }
+
+
+def diff_keys(old, new):
+    """Returns numbers of new keys, status transitions and removed keys."""
+    added = sum(1 for key_id in new if key_id not in old)
+    removed = sum(1 for key_id in old if key_id not in new)
+    changed = sum(
+        1
+        for key_id, key in new.items()
+        if key_id in old and old[key_id].get("keyStatus") != key.get("keyStatus")
+    )
+    return added, changed, removed
+
+
+def add_expiry(keys, old_keys, settings):
+    """
+    Adds expiry instant and fingerprint to new keys of a key list,
+    keys that are already known keep theirs.
+    """
+    if settings.keys == "service":
+        return
+    for key_id, key in keys.items():
+        old = old_keys.get(key_id)
+        if old and "expires" in old and old.get("createdAt") == key["createdAt"]:
+            key["expires"], key["fingerprint"] = old["expires"], old["fingerprint"]
+        else:
+            key["expires"] = key_expiry(key["createdAt"], settings.valid_days)
+            key["fingerprint"] = key_fingerprint(key_id)
+
+
+def revocations(ssh_user, old, new, settings):
+    """
+    Returns fingerprints of keys of a full key list that were revoked or
+    removed since the last sync with their note, and of keys that were
+    added or changed and are not revoked.
+    """
+    revoked, restored = {}, set()
+    if settings.keys != "all":
+        return revoked, restored
+    note = f"{SYNC_NOTE} {ssh_user}"
+    for key_id, key in old.items():
+        if key_id not in new and key.get("fingerprint"):
+            revoked[key["fingerprint"]] = note
+    for key_id, key in new.items():
+        old_key = old.get(key_id)
+        if not key.get("fingerprint") or (
+            old_key and old_key.get("keyStatus") == key.get("keyStatus")
+        ):
+            continue
+        if key.get("keyStatus") in REVOKED_STATUS:
+            revoked[key["fingerprint"]] = note
+        else:
+            restored.add(key["fingerprint"])
+    return revoked, restored
+
+
+def key_ids_fingerprints(keys):
+    """Returns fingerprints of the keys of a key state (service keys by line)."""
+    return {
+        key.get("fingerprint") or line_fingerprint(key_id)
+        for key_id, key in keys.items()
+    }
+
+
+def invalidate_states(state_dir, fingerprints):
+    """
+    Drops the digest of the key states with keys with 'fingerprints', so the
+    next sync processes their Reg-App responses again, e.g. when keys are
+    removed from the revocation set. Returns the users.
+    """
+    try:
+        file_names = os.listdir(state_dir)
+    except OSError:
+        return set()
+    users = set()
+    for file_name in file_names:
+        if not file_name.endswith(".json"):
+            continue
+        path = os.path.join(state_dir, file_name)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if "digest" not in state or not fingerprints & key_ids_fingerprints(
+            state.get("keys", {})
+        ):
+            continue
+        del state["digest"]
+        write_state(path, state)
+        users.add(file_name[:-5])
+    return users
+
+
+def write_state(path, state):
+    """Writes key state atomically, errors are ignored."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(state, file)
+        os.replace(tmp_path, path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def next_change(keys, settings, now):
+    """Returns the time the next key gets too old, None if keys do not age."""
+    if "age" not in settings.filters:
+        return None
+    expiry = [
+        key["expires"]
+        for key in keys.values()
+        if key.get("expires") is not None and key["expires"] > now
+    ]
+    return min(expiry, default=None)
+
+
+def output_expiry(ssh_user, keys, output, settings):
+    """Returns expiry index entries of the synced keys of a user."""
+    if "age" not in settings.filters:
+        return []
+    synced = {line.split()[1] for line in output if len(line.split()) > 1}
+    return [
+        Expiry(key["expires"], ssh_user, key["fingerprint"], key.get("name") or "")
+        for key_id, key in keys.items()
+        if key_id in synced and key.get("expires") is not None
+    ]
+
+
+class DeltaSync:
+    """Syncs keys of users incrementally, key states in 'state_dir'."""
+
+    def __init__(self, resolver, settings, state_dir):
+        self.resolver = resolver
+        self.settings = settings
+        self.state_dir = state_dir
+        # State of other lookup settings is not used
+        self.fingerprint = repr(sorted(vars(settings).items()))
+        self.stats = Counter()
+        # Expiry of synced keys of the users refreshed by this sync
+        self.expiries = []
+        self.refreshed = set()
+        # Changes of the revocation set
+        self.revoked = {}
+        self.restored = set()
+        self.stats_lock = threading.Lock()
+        os.makedirs(state_dir, mode=0o700, exist_ok=True)
+
+    def state_path(self, ssh_user):
+        """Returns path of the key state of 'ssh_user'."""
+        return os.path.join(self.state_dir, f"{ssh_user}.json")
+
+    def read_state(self, ssh_user):
+        """Returns key state of 'ssh_user', None if there is none."""
+        try:
+            with open(self.state_path(ssh_user), "r", encoding="utf-8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return state if state.get("settings") == self.fingerprint else None
+
+    def forget(self, ssh_user):
+        """Removes key state, e.g. if access was denied."""
+        with self.stats_lock:
+            self.refreshed.add(ssh_user)
+        try:
+            os.unlink(self.state_path(ssh_user))
+        except OSError:
+            pass
+
+    def prune(self, user_names):
+        """Removes key states of users that are no longer synced."""
+        for file_name in os.listdir(self.state_dir):
+            if file_name.endswith(".json") and file_name[:-5] not in user_names:
+                self.forget(file_name[:-5])
+
+    def count(self, ssh_user, counts, expiries, revoked=None, restored=()):
+        """Adds counters, expiry index entries and revocations of one user."""
+        with self.stats_lock:
+            self.stats.update(counts)
+            self.expiries.extend(expiries)
+            self.refreshed.add(ssh_user)
+            self.revoked.update(revoked or {})
+            self.restored.update(restored)
+
+    def save_index(self, user_names):
+        """
+        Writes expiry index, users that could not be refreshed keep their
+        entries of the last sync.
+        """
+        path = os.path.join(self.state_dir, EXPIRY_INDEX)
+        with index_lock(path):
+            kept = [
+                entry
+                for entry in ExpiryIndex.load(path).entries
+                if entry.ssh_user in user_names and entry.ssh_user not in self.refreshed
+            ]
+            ExpiryIndex(kept + self.expiries).save(path)
+
+    def refresh(self, ssh_user, user_id):
+        """
+        Returns synced keys of the user without revoked keys, the keys of
+        the last sync if the Reg-App response did not change.
+        """
+        settings = self.settings
+        text = self.resolver.with_user_id(
+            settings,
+            ssh_user,
+            user_id,
+            lambda uid: self.resolver.key_text(settings, uid),
+        )
+        start = time.thread_time()
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        state = self.read_state(ssh_user) or {"keys": {}}
+        now = time.time()
+        counts = Counter(bytes=len(text))
+        if state.get("digest") == digest and (
+            state.get("next_change") is None or now < state["next_change"]
+        ):
+            counts.update(unchanged_responses=1, skipped_bytes=len(text))
+            output = self.resolver.revocations.filter_lines(state["output"])
+            counts["cpu"] += time.thread_time() - start
+            self.count(
+                ssh_user,
+                counts,
+                output_expiry(ssh_user, state["keys"], output, settings),
+            )
+            return output
+
+        keys = key_states(text, settings)
+        add_expiry(keys, state["keys"], settings)
+        added, changed, removed = diff_keys(state["keys"], keys)
+        counts.update(keys_added=added, keys_changed=changed, keys_removed=removed)
+        revoked, restored = revocations(ssh_user, state["keys"], keys, settings)
+        # Keys revoked now are added to the set at the end of the sync, the
+        # state keeps the keys that are only in the set
+        output = [
+            line
+            for line in run_pipeline(parse_records(text, settings, ssh_user), settings)
+            if line_fingerprint(line) not in revoked
+        ]
+        write_state(
+            self.state_path(ssh_user),
+            {
+                "settings": self.fingerprint,
+                "digest": digest,
+                "keys": keys,
+                "next_change": next_change(keys, settings, now),
+                "output": output,
+            },
+        )
+        output = self.resolver.revocations.filter_lines(output)
+        counts["cpu"] += time.thread_time() - start
+        self.count(
+            ssh_user,
+            counts,
+            output_expiry(ssh_user, keys, output, settings),
+            revoked,
+            restored,
+        )
+        return output
@@ -0,0 +1,267 @@
+"""
+Several Reg-App endpoints with hedged requests and failover.
+
+'reg_host' lists the endpoints in order of preference. A request goes to the
+first endpoint whose circuit breaker is closed, endpoints with recent
+failures (open breaker) are tried last. If the endpoint has not answered
+after the 'hedge_percentile' of its recent response times, the request is
+also sent to the next endpoint and the first answer wins. A request that
+fails moves on to the next endpoint at once. Client errors (e.g. 404 for
+users without access) are answers and end the request.
+
+Response times are kept per endpoint next to the breaker state, in a small
+file of the most recent samples shared by all processes.
+
+With a deadline (see bwidm_rest.deadline) requests run in threads, no
+request is sent after the deadline and the answer is only waited for until
+the deadline.
+"""
+
+import collections
+import os
+import queue
+import re
+import struct
+import threading
+import time
+
+from .breaker import CircuitBreaker
+from .deadline import NO_DEADLINE
+from .errors import RestError, Unreachable
+from .transport import make_transport
+
+HEDGE_MIN_SAMPLES = 20
+LATENCY_SAMPLES = 256
+SAMPLE = struct.Struct("<f")
+
+
+class LatencyLog:
+    """Recent response times of an endpoint, in memory without 'path'."""
+
+    def __init__(self, path, samples=LATENCY_SAMPLES):
+        self.path = path
+        self.samples = samples
+        self.memory = collections.deque(maxlen=samples)
+
+    def record(self, seconds):
+        """Adds a response time, appends are atomic with O_APPEND."""
+        if not self.path:
+            self.memory.append(seconds)
+            return
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        try:
+            try:
+                fd = os.open(self.path, flags, 0o600)
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(self.path), mode=0o755, exist_ok=True)
+                fd = os.open(self.path, flags, 0o600)
+            try:
+                os.write(fd, SAMPLE.pack(seconds))
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+            if size > 8 * self.samples * SAMPLE.size:
+                self.compact()
+        except OSError:
+            pass
+
+    def compact(self):
+        """Keeps the most recent samples, samples appended meanwhile are lost."""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(b"".join(SAMPLE.pack(seconds) for seconds in self.read()))
+        os.replace(tmp_path, self.path)
+
+    def read(self):
+        """Returns the most recent response times."""
+        if not self.path:
+            return list(self.memory)
+        try:
+            with open(self.path, "rb") as file:
+                size = os.fstat(file.fileno()).st_size
+                length = min(size - size % SAMPLE.size, self.samples * SAMPLE.size)
+                file.seek(size - size % SAMPLE.size - length)
+                data = file.read(length)
+        except OSError:
+            return []
+        return [seconds for (seconds,) in SAMPLE.iter_unpack(data)]
+
+    def percentile(self, percent):
+        """Returns 'percent' percentile of the response times, None if too few."""
+        samples = sorted(self.read())
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, len(samples) * percent // 100)]
+
+
+class DaemonPool:
+    """
+    Reused daemon threads: keep-alive connections of the stdlib transport
+    stay with their thread, and a request that still runs when the lookup is
+    done does not delay the exit of the process.
+    A forked child (background refresh) starts with an empty pool, the
+    threads of the parent do not exist there.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Starts without threads in this process."""
+        self.pid = os.getpid()
+        self.tasks = queue.SimpleQueue()
+        self.threads = set()
+        self.idle = 0
+        self.busy = 0
+        self.lock = threading.Lock()
+
+    def submit(self, call):
+        """Runs 'call' in an idle thread or a new one."""
+        if self.pid != os.getpid():
+            self.reset()
+        with self.lock:
+            self.busy += 1
+            if self.idle:
+                self.idle -= 1
+            else:
+                thread = threading.Thread(target=self.work, daemon=True)
+                thread.start()
+                self.threads.add(thread.ident)
+        self.tasks.put(call)
+
+    def work(self):
+        """Runs calls until the process exits."""
+        while True:
+            self.tasks.get()()
+            with self.lock:
+                self.idle += 1
+                self.busy -= 1
+
+    def quiet(self):
+        """Returns True if all threads of the pool are idle."""
+        with self.lock:
+            return not self.busy
+
+
+class Endpoint:
+    """Reg-App endpoint with its transport, circuit breaker and response times."""
+
+    def __init__(self, conf, host, pool_size=None):
+        self.conf = conf
+        self.host = host
+        self.pool_size = pool_size
+        self.pid = os.getpid()
+        self.transport = None
+        self.transport_lock = threading.Lock()
+        self.breaker = CircuitBreaker(
+            conf.breaker_dir, host, conf.failure_threshold, conf.reset_timeout
+        )
+        name = re.sub(r"[^\w.-]", "_", host)
+        self.latency = LatencyLog(
+            os.path.join(conf.breaker_dir, f"latency-{name}.bin")
+            if conf.breaker_dir
+            else None
+        )
+
+    def get(self, path, timeout=None, validators=None):
+        """Sends GET request, returns status code, text and validators."""
+        if self.pid != os.getpid():
+            # Forked, the connections of the transport belong to the parent
+            self.pid = os.getpid()
+            self.transport = None
+            self.transport_lock = threading.Lock()
+        with self.transport_lock:
+            if self.transport is None:
+                self.transport = make_transport(self.conf, self.pool_size, self.host)
+        start = time.monotonic()
+        try:
+            result = self.breaker.call(
+                lambda: self.transport.get(path, timeout, validators)
+            )
+        except Unreachable:
+            raise
+        except RestError:
+            self.latency.record(time.monotonic() - start)
+            raise
+        self.latency.record(time.monotonic() - start)
+        return result
+
+
+class Endpoints:
+    """All Reg-App endpoints of '[REST] reg_host'."""
+
+    def __init__(self, conf, pool_size=None):
+        self.endpoints = [Endpoint(conf, host, pool_size) for host in conf.reg_hosts]
+        self.hedge_percentile = conf.hedge_percentile
+        self.default_delay = conf.hedge_delay
+        self.max_time = conf.max_time
+        self.pool = DaemonPool()
+
+    def quiet(self):
+        """
+        Returns True if no other thread of this process may hold a lock,
+        all of them are idle request threads.
+        """
+        current = threading.get_ident()
+        return self.pool.quiet() and all(
+            thread.ident == current or thread.ident in self.pool.threads
+            for thread in threading.enumerate()
+        )
+
+    def order(self):
+        """Returns endpoints in config order, those with an open breaker last."""
+        return sorted(self.endpoints, key=lambda endpoint: endpoint.breaker.is_open())
+
+    def hedge_delay(self, endpoint):
+        """Returns seconds until a request to 'endpoint' is hedged, None: never."""
+        if self.hedge_percentile <= 0:
+            return None
+        delay = endpoint.latency.percentile(self.hedge_percentile)
+        return self.default_delay if delay is None else delay
+
+    def get(self, path, deadline=NO_DEADLINE, validators=None):
+        """
+        Sends GET request to the endpoints (conditional with 'validators'),
+        returns status code, text and validators of the first answer.
+        Raises the first error if no endpoint answers and 'Unreachable' if
+        there is no answer before 'deadline'.
+        """
+        endpoints = self.order()
+        if len(endpoints) == 1 and not deadline.bounded():
+            return endpoints[0].get(path, validators=validators)
+        answers = queue.SimpleQueue()
+
+        def send(endpoint, timeout):
+            try:
+                answers.put(endpoint.get(path, timeout, validators))
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                answers.put(e)
+
+        remaining = list(endpoints)
+        errors, pending = [], 0
+        while True:
+            # First request, hedged request after the delay or failover
+            if remaining:
+                # Socket timeouts end the abandoned request at the deadline
+                timeout = deadline.timeout(self.max_time)
+                endpoint = remaining.pop(0)
+                self.pool.submit(
+                    lambda endpoint=endpoint, timeout=timeout: send(endpoint, timeout)
+                )
+                pending += 1
+            if not pending:
+                raise errors[0]
+            try:
+                answer = answers.get(
+                    timeout=deadline.timeout(
+                        self.hedge_delay(endpoint) if remaining else None
+                    )
+                )
+            except queue.Empty:
+                continue
+            pending -= 1
+            if not isinstance(answer, Unreachable):
+                if isinstance(answer, Exception):
+                    raise answer
+                return answer
+            errors.append(answer)
@@ -0,0 +1,67 @@
+"""
+Index of user names to EPPNs for lookups with 'users = gecos' (ssh3).
+
+The EPPN is the gecos field of the local account, and getpwnam goes through
+NSS (SSSD/LDAP on the login nodes), which may stall on a cold cache.
+bwidm_rest_eppn_index.py writes user name, uidNumber and gecos of all
+accounts, from a bulk NSS enumeration or an export file in passwd format,
+to a file in the format of the key store (see bwidm_rest.store).
+Lookups only call getpwnam for users that are not in the index.
+"""
+
+import pwd
+import time
+
+from .defaults import EPPN_INDEX, EPPN_INDEX_MAX_AGE
+from .store import MappedStore, write_store
+
+# Mode in the header of the index
+EPPN_INDEX_MODE = "eppn"
+
+
+def nss_accounts():
+    """Returns user name, uidNumber and gecos of all accounts known to NSS."""
+    return [(pw.pw_name, pw.pw_uid, pw.pw_gecos) for pw in pwd.getpwall()]
+
+
+def read_passwd_file(path):
+    """Returns user name, uidNumber and gecos of a file in passwd format."""
+    accounts = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            fields = line.rstrip("\n").split(":")
+            if len(fields) >= 5 and fields[0] and not fields[0].startswith("#"):
+                accounts.append((fields[0], int(fields[2]), fields[4]))
+    return accounts
+
+
+def write_eppn_index(path, accounts):
+    """Writes index of 'accounts' atomically, returns number of users."""
+    # The first entry of a user wins, like for getpwnam
+    records = {}
+    for name, uid, gecos in accounts:
+        records.setdefault(name, (name, uid, gecos.encode("utf-8")))
+    write_store(path, EPPN_INDEX_MODE, records.values())
+    return len(records)
+
+
+class EppnIndex:
+    """Reads the index, maps it again when the file was replaced (mtime)."""
+
+    def __init__(self, path=EPPN_INDEX, max_age=EPPN_INDEX_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.mapped = MappedStore(path, EPPN_INDEX_MODE)
+
+    def current(self):
+        """Returns the mapped index, None if there is no recent index."""
+        store = self.mapped.current()
+        if store is None or time.time() - store.built > self.max_age:
+            return None
+        return store
+
+    def get(self, ssh_user):
+        """Returns EPPN of 'ssh_user', None if the user is not in the index."""
+        store = self.current() if self.path else None
+        entry = store.find(ssh_user) if store else None
+        return None if entry is None else entry[1].decode("utf-8")
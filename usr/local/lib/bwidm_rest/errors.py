@@ -0,0 +1,37 @@
+"""
+Exceptions and error reporting of the bwIDM REST API scripts.
+"""
+
+import sys
+
+
+class LookupFailed(Exception):
+    """Raised if a key lookup fails, carries exit code and messages."""
+
+    def __init__(self, exit_code, *messages):
+        super().__init__(exit_code, *messages)
+        self.exit_code = exit_code
+        self.messages = messages
+
+
+class LookupUnavailable(LookupFailed):
+    """Raised if a key lookup fails because the Reg-App can not be reached."""
+
+
+class RestError(Exception):
+    """Raised if a request to the Reg-App fails, with HTTP 'status' if any."""
+
+    def __init__(self, *args, status=None):
+        super().__init__(*args)
+        self.status = status
+
+
+class Unreachable(RestError):
+    """Raised if the Reg-App can not be reached."""
+
+
+def exit_with_msg(exit_code, *messages):
+    """Function prints message and exits."""
+    for msg in messages:
+        print(msg, file=sys.stderr)
+    sys.exit(exit_code)
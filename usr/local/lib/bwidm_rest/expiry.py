@@ -0,0 +1,79 @@
+"""
+Expiry index of synced SSH keys.
+
+Keys older than 'valid_days' are not served. The expiry instant of each key
+is computed once when the key enters the key state of the sync and kept in
+an index sorted by expiry. Eviction pops the expired head of the index
+without parsing any dates, and the index answers which keys expire soon.
+"""
+
+import bisect
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from typing import NamedTuple
+
+EXPIRY_INDEX = "expiry.index"
+
+
+class Expiry(NamedTuple):
+    """Index entry: expiry instant, user name, key fingerprint and key name."""
+
+    expires: float
+    ssh_user: str
+    fingerprint: str
+    name: str
+
+
+class ExpiryIndex:
+    """Keys sorted by expiry instant."""
+
+    def __init__(self, entries=()):
+        self.entries = sorted(Expiry(*entry) for entry in entries)
+
+    @classmethod
+    def load(cls, path):
+        """Reads index, an index that does not exist is empty."""
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return cls(json.load(file))
+        except (OSError, ValueError, TypeError):
+            return cls()
+
+    def save(self, path):
+        """Writes index atomically."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def next_expiry(self):
+        """Returns the next expiry instant, None if the index is empty."""
+        return self.entries[0].expires if self.entries else None
+
+    def position(self, instant):
+        """Returns index of the first entry that expires after 'instant'."""
+        return bisect.bisect_right(self.entries, instant, key=lambda entry: entry[0])
+
+    def pop_expired(self, now):
+        """Removes and returns the entries that expired at 'now'."""
+        end = self.position(now)
+        expired, self.entries = self.entries[:end], self.entries[end:]
+        return expired
+
+    def expiring(self, seconds, now):
+        """Returns the entries that expire within 'seconds' after 'now'."""
+        return self.entries[self.position(now) : self.position(now + seconds)]
+
+
+@contextmanager
+def index_lock(path):
+    """Serializes changes of the index at 'path' by sync and eviction."""
+    os.makedirs(os.path.dirname(path), mode=0o755, exist_ok=True)
+    fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
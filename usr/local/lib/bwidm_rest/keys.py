@@ -0,0 +1,171 @@
+"""
+SSH key handling of the bwIDM REST API scripts.
+"""
+
+import base64
+import hashlib
+import re
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import NamedTuple
+
+FIDO2_KEY_NAME = "FIDO2"
+FIDO2_KEY_TYPE = "sk-ssh-ed25519@openssh.com"
+PARSE_CACHE_SIZE = 4096
+KEY_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ[UTC]"
+
+# Options are everything up to the first whitespace outside of quotes
+OPTIONS_RE = re.compile(r'(?:[^\s"]|"(?:[^"\\]|\\.)*")+')
+COMMAND_RE = re.compile(r'(?:^|,)command="((?:[^"\\]|\\.)*)"')
+KEY_TYPE_RE = re.compile(r"(?:ssh|ecdsa|sk)-[\w@.-]+\s")
+
+
+class ParsedKey(NamedTuple):
+    """Fields of an authorized_keys line."""
+
+    options: str
+    key_type: str
+    blob: str
+    comment: str
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_key(line):
+    """
+    Parses an authorized_keys line in a single pass, returns ParsedKey
+    or None if the line is not a key. Results are memoized.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    options = ""
+    if not KEY_TYPE_RE.match(line):
+        match = OPTIONS_RE.match(line)
+        if not match:
+            return None
+        options = match[0]
+        line = line[match.end() :]
+    fields = line.split(None, 2)
+    if len(fields) < 2:
+        return None
+    return ParsedKey(
+        options, fields[0], fields[1], fields[2] if len(fields) > 2 else ""
+    )
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def wire_key_type(blob):
+    """
+    Returns key type from the wire format of the key blob, memoized by blob.
+    Only the start of the blob is decoded: uint32 length and type string.
+    """
+    try:
+        head = base64.b64decode(blob[:64])
+    except ValueError:
+        return None
+    length = int.from_bytes(head[:4], "big")
+    if len(head) < 4 + length:
+        return None
+    return head[4 : 4 + length].decode("ascii", errors="replace")
+
+
+def key_fingerprint(blob):
+    """Returns SHA256 fingerprint of a key blob like ssh-keygen -l, None if invalid."""
+    try:
+        digest = hashlib.sha256(base64.b64decode(blob, validate=True)).digest()
+    except ValueError:
+        return None
+    return "SHA256:" + base64.b64encode(digest).decode().rstrip("=")
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def line_fingerprint(line):
+    """
+    Returns fingerprint of an authorized_keys line, None if it is no key.
+    Memoized, the same lines are served again and again.
+    """
+    key = parse_key(line)
+    return key_fingerprint(key.blob) if key else None
+
+
+def fingerprint_index(lines):
+    """Returns authorized_keys 'lines' by fingerprint of their key."""
+    index = {}
+    for line in lines:
+        fingerprint = line_fingerprint(line)
+        if fingerprint:
+            index.setdefault(fingerprint, []).append(line)
+    return index
+
+
+def key_command(key):
+    """Returns forced command of a parsed key, or None."""
+    match = COMMAND_RE.search(key.options)
+    return match[1] if match else None
+
+
+def decode_fido2_public_key(fido2_pub_key):
+    """
+    Check, if submitted key is a bwIDM command key with command 'FIDO2_KEY_NAME'
+    and key type 'sk-ssh-ed25519@openssh.com' (also in the decoded key).
+    We use bwIDM command key functionality to submit FIDO2 SSH keys,
+    IP range is ignored.
+    Returns key type, base64 encoded key and comment or None.
+    """
+    # Most keys are no FIDO2 keys, skip parsing them
+    if FIDO2_KEY_TYPE not in fido2_pub_key:
+        return None
+    key = parse_key(fido2_pub_key)
+    if (
+        key
+        and key.key_type == FIDO2_KEY_TYPE
+        and key_command(key) == FIDO2_KEY_NAME
+        and wire_key_type(key.blob) == FIDO2_KEY_TYPE
+    ):
+        return (
+            key.key_type,
+            key.blob,
+            key.comment.split(None, 1)[0] if key.comment else "",
+        )
+    return None
+
+
+def rewrite_fido2_key(key):
+    """Returns FIDO2 command keys as plain keys, other keys unchanged."""
+    fido2_public_key = decode_fido2_public_key(key)
+    if fido2_public_key:
+        return " ".join(part for part in fido2_public_key if part)
+    return key
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def key_timestamp(ssh_k_date):
+    """
+    Returns creation date of a Reg-App key as POSIX timestamp, None if invalid.
+    Memoized, dates are parsed once per process.
+    """
+    if not isinstance(ssh_k_date, str) or not ssh_k_date.endswith("Z[UTC]"):
+        return None
+    try:
+        # Much faster than strptime, which also accepts other digit counts
+        created = datetime.fromisoformat(ssh_k_date[:-6])
+    except ValueError:
+        try:
+            created = datetime.strptime(ssh_k_date, KEY_DATE_FORMAT)
+        except ValueError:
+            return None
+    return created.replace(tzinfo=timezone.utc).timestamp()
+
+
+def key_expiry(ssh_k_date, ssh_valid_days):
+    """Returns time a key gets older than 'ssh_valid_days', None if invalid."""
+    created = key_timestamp(ssh_k_date)
+    return None if created is None else created + ssh_valid_days * 86400
+
+
+def ssh_key_valid(ssh_k_date, ssh_valid_days, now=None):
+    """Function takes SSH key date and checks if it is less than SSH_VALID_DAYS old."""
+    expiry = key_expiry(ssh_k_date, ssh_valid_days)
+    # Keys with dates that can not be parsed are not valid
+    return expiry is not None and expiry > (time.time() if now is None else now)
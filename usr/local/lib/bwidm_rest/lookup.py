@@ -0,0 +1,477 @@
+"""
+Key lookups of the bwIDM REST API scripts.
+The Resolver holds config and Reg-App transport and runs the key pipeline.
+"""
+
+import hashlib
+import json
+import pwd
+import sys
+import threading
+import time
+
+from .cache import (
+    cache_path,
+    cached_fetch,
+    read_cache,
+    refresh_in_background,
+    refresh_pending,
+    remove_cache,
+    write_cache,
+)
+from .deadline import NO_DEADLINE, lookup_deadline
+from .endpoints import Endpoints
+from .eppn import EppnIndex
+from .keys import fingerprint_index, parse_key
+from .errors import (
+    LookupFailed,
+    LookupUnavailable,
+    RestError,
+    Unreachable,
+    exit_with_msg,
+)
+from .metrics import Metrics
+from .negative import NegativeCache
+from .pipeline import lookup_settings, parse_records, run_pipeline, user_eppn
+from .revoked import RevocationSet
+from .warm import record_login
+
+
+def concurrently(calls, timeout):
+    """
+    Runs 'calls' in threads, returns their results or exceptions in order,
+    None for calls that did not finish within 'timeout' seconds.
+    """
+    results = [None] * len(calls)
+
+    def run(index, call):
+        try:
+            results[index] = call()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            results[index] = e
+
+    threads = [
+        threading.Thread(target=run, args=(index, call), daemon=True)
+        for index, call in enumerate(calls)
+    ]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    return list(results)
+
+
+def get_eppn(ssh_usr):
+    """Reads and returns eppn from passwd gecos"""
+    try:
+        return pwd.getpwnam(ssh_usr).pw_gecos
+    except KeyError as e:
+        raise LookupFailed(52, f"Can not get EPPN for '{ssh_usr}'") from e
+
+
+class Resolver:
+    """
+    Resolves SSH keys of users, holds config and Reg-App transport.
+    Stale entries are refreshed with 'background', the default queues them
+    for refresh_pending (see start_refreshes).
+    """
+
+    def __init__(
+        self, conf, background=refresh_in_background, pool_size=None, limiter=None
+    ):
+        self.conf = conf
+        self.background = background
+        self.pool_size = pool_size
+        # Rate limit of Reg-App requests (bulk operations), see bwidm_rest.audit
+        self.limiter = limiter
+        self.endpoints = Endpoints(conf, pool_size)
+        self.metrics = Metrics(conf.metrics_spool)
+        # Deadline of the lookup of each thread
+        self.local = threading.local()
+        self.negative = NegativeCache(
+            conf.cache_dir,
+            conf.ssn,
+            conf.cache_negative_ttl,
+            conf.cache_negative_max_entries,
+        )
+        self.eppn_index = EppnIndex(
+            conf.cache_eppn_index, conf.cache_eppn_index_max_age
+        )
+        self.revocations = RevocationSet(conf.cache_revoked)
+
+    def deadline(self):
+        """Returns deadline of the lookup of this thread."""
+        return getattr(self.local, "deadline", NO_DEADLINE)
+
+    def wait_time(self):
+        """Returns seconds to wait for other lookups or threads."""
+        remaining = self.deadline().remaining()
+        max_time = self.conf.max_time
+        return max_time if remaining is None else min(max_time, remaining)
+
+    def refresh(self, fetch, path, lock_dir):
+        """
+        Refreshes the stale cache entry 'path' with 'background'. The
+        refresh gets a deadline of its own, not the rest of the lookup's.
+        """
+        bounded = self.deadline().bounded()
+
+        def fetch_with_deadline(validators):
+            self.local.deadline = (
+                lookup_deadline(self.conf.deadline) if bounded else NO_DEADLINE
+            )
+            return fetch(validators)
+
+        self.background(fetch_with_deadline, path, lock_dir)
+
+    def start_refreshes(self):
+        """Forks the process refreshing the queued stale entries."""
+        refresh_pending(self.endpoints.quiet)
+
+    def rest_get(self, path, phase, validators=None):
+        """
+        Sends GET request to the Reg-App (conditional with 'validators'),
+        returns status code, text and validators of the response.
+        The request is timed as metrics 'phase'.
+        """
+        if self.limiter:
+            self.limiter.acquire()
+        with self.metrics.phase(phase):
+            try:
+                status, text, validators = self.endpoints.get(
+                    path, self.deadline(), validators
+                )
+            except RestError as e:
+                self.metrics.http(e.status or "error")
+                raise
+        self.metrics.http(status)
+        return status, text, validators
+
+    def get_eppn(self, ssh_usr):
+        """
+        Returns eppn of the EPPN index, reads it from passwd gecos if the
+        user is not in the index (timed as 'getpwnam').
+        """
+        if self.conf.cache_eppn_index:
+            eppn = self.eppn_index.get(ssh_usr)
+            self.metrics.cache("eppn", "miss" if eppn is None else "hit")
+            if eppn is not None:
+                return eppn
+        with self.metrics.phase("getpwnam"):
+            return get_eppn(ssh_usr)
+
+    def get_user_info(self, eppn):
+        """
+        Function takes EPPN and returns user info of the first service
+        in [SSN] ssn that grants access.
+        """
+        denied = None
+        for ssn in self.conf.ssns:
+            try:
+                return self.attribute_query(ssn, eppn)
+            except LookupFailed as e:
+                denied = denied or e
+        raise denied
+
+    def attribute_query(self, ssn, eppn):
+        """Returns user info of EPPN for service 'ssn'."""
+        try:
+            http_code_d, user_info_d, _ = self.rest_get(
+                f"/rest/attrq/eppn/{ssn}/{eppn}", "attrq"
+            )
+        except Unreachable:
+            raise
+        except RestError as r:
+            raise LookupFailed(31, f"Access denied ({r})") from r
+        if http_code_d != 200:
+            raise LookupFailed(32, f"Access denied ({http_code_d})")
+        return json.loads(user_info_d)
+
+    def cached(self, fetch, kind, uid, ttl, stale_ttl, max_age, ssn=None):
+        """
+        Returns cached text of entry 'kind' of 'uid' (of service 'ssn',
+        default the first one), concurrent fetches are coalesced.
+        """
+        conf = self.conf
+        return cached_fetch(
+            fetch,
+            cache_path(conf.cache_dir, kind, ssn or conf.ssn, uid),
+            ttl,
+            stale_ttl,
+            max_age,
+            self.refresh,
+            conf.cache_lock_dir,
+            self.wait_time(),
+            lambda outcome: self.metrics.cache(kind, outcome),
+        )
+
+    def uid_cache_path(self, eppn):
+        """Returns path of the EPPN to uidNumber cache entry."""
+        return cache_path(self.conf.cache_dir, "uid", self.conf.ssn, eppn)
+
+    def get_user_id(self, eppn):
+        """
+        Function takes EPPN and returns uidNumber of the user.
+        The mapping almost never changes, so it is cached for 'uid_ttl'
+        and the AttributeQuery is skipped on cache hits.
+        """
+        uid_ttl = self.conf.cache_uid_ttl
+        try:
+            return int(
+                self.cached(
+                    lambda _: (str(self.get_user_info(eppn)["uidNumber"]), None),
+                    "uid",
+                    eppn,
+                    uid_ttl,
+                    uid_ttl,
+                    uid_ttl,
+                )
+            )
+        except Unreachable as r:
+            raise LookupUnavailable(31, f"Access denied ({r})") from r
+
+    def invalidate_user_id(self, eppn):
+        """Removes cached uidNumber, e.g. if the key lookup was denied."""
+        remove_cache(self.uid_cache_path(eppn))
+
+    def get_keys(self, path, phase="keys", validators=None):
+        """
+        Fetches SSH keys from the Reg-App, returns response text and its
+        validators, None if the keys did not change since the response
+        with 'validators'. Without ETag and Last-Modified of the Reg-App
+        the validator is a hash of the text.
+        """
+        if not self.conf.cache_revalidate:
+            validators = None
+        try:
+            http_code, text, new_validators = self.rest_get(path, phase, validators)
+        except Unreachable:
+            raise
+        except RestError as e:
+            raise LookupFailed(
+                11, f"Access was not granted (Access denied). {e}"
+            ) from e
+        if http_code == 304 and validators:
+            return None
+        if http_code != 200:
+            raise LookupFailed(12, f"Access denied ({http_code})")
+        if not self.conf.cache_revalidate:
+            return text, None
+        if not new_validators:
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            if validators and validators.get("hash") == digest:
+                return None
+            new_validators = {"hash": digest}
+        return text, new_validators
+
+    def service_key_text(self, ssn, user_id, phase="keys"):
+        """Returns cached service keys of 'user_id' for service 'ssn'."""
+        conf = self.conf
+        path = f"/rest/ssh-key/auth/all/{ssn}/uidnumber/{user_id}"
+        return self.cached(
+            lambda validators: self.get_keys(path, phase, validators),
+            "keys",
+            user_id,
+            conf.cache_ttl,
+            conf.cache_stale_ttl,
+            conf.cache_max_age,
+            ssn,
+        )
+
+    def merged_service_key_text(self, user_id):
+        """
+        Returns service keys of all services in [SSN] ssn, fetched
+        concurrently within 'max_time' (and the deadline) and deduplicated
+        by key blob. Services that deny access or do not answer are left
+        out, unless no service grants access.
+        """
+        record = self.metrics.record()
+        deadline = self.deadline()
+
+        def fetch(ssn):
+            self.metrics.attach(record)
+            self.local.deadline = deadline
+            return self.service_key_text(ssn, user_id, f"keys-{ssn}")
+
+        ssns = self.conf.ssns
+        wait_time = self.wait_time()
+        results = concurrently([lambda ssn=ssn: fetch(ssn) for ssn in ssns], wait_time)
+        lines, blobs, errors = [], set(), []
+        for ssn, result in zip(ssns, results):
+            if result is None:
+                result = Unreachable(f"{ssn}: no answer within {wait_time:.1f} s")
+            if isinstance(result, Exception):
+                errors.append(result)
+                continue
+            for line in result.splitlines():
+                key = parse_key(line)
+                blob = key.blob if key else line
+                if line and blob not in blobs:
+                    blobs.add(blob)
+                    lines.append(line)
+        if len(errors) == len(ssns):
+            # Unreachable services may grant access, denial is not cached then
+            unreachable = [e for e in errors if isinstance(e, Unreachable)]
+            raise unreachable[0] if unreachable else errors[0]
+        return "".join(f"{line}\n" for line in lines)
+
+    def key_text(self, settings, user_id):
+        """Returns cached Reg-App response of the key source of 'settings'."""
+        conf = self.conf
+        try:
+            if settings.keys == "service":
+                if len(conf.ssns) > 1:
+                    return self.merged_service_key_text(user_id)
+                return self.service_key_text(conf.ssn, user_id)
+            selection = "all" if settings.keys == "all" else "key-status/ACTIVE"
+            path = f"/rest/ssh-key/list/uidnumber/{user_id}/{selection}"
+            return self.cached(
+                lambda validators: self.get_keys(path, validators=validators),
+                f"list-{settings.keys}",
+                user_id,
+                conf.cache_ttl,
+                conf.cache_stale_ttl,
+                conf.cache_max_age,
+            )
+        except Unreachable as e:
+            raise LookupUnavailable(
+                11, f"Access was not granted (Access denied). {e}"
+            ) from e
+
+    def fetch_records(self, settings, ssh_user, user_id):
+        """Stage: fetches keys of the user from the key source of 'settings'."""
+        return parse_records(self.key_text(settings, user_id), settings, ssh_user)
+
+    def lookup(
+        self,
+        mode,
+        ssh_user,
+        user_id=None,
+        phases=None,
+        deadline=NO_DEADLINE,
+        fingerprint=None,
+    ):
+        """
+        Returns authorized_keys lines of 'ssh_user' for lookup 'mode', with
+        'fingerprint' only the lines of that key.
+        Users without access are answered from the negative cache.
+        Timings and outcome are recorded in the metrics spool, 'phases'
+        were measured before (startup, config). Successful logins are
+        recorded for the cache warmer. Reg-App requests are abandoned at
+        'deadline', cached keys are served then.
+        """
+        self.metrics.begin(mode, phases)
+        self.local.deadline = deadline
+        exit_code = 0
+        try:
+            keys = self.negative_lookup(mode, ssh_user, user_id, fingerprint)
+        except LookupFailed as e:
+            exit_code = e.exit_code
+            raise
+        finally:
+            self.local.deadline = NO_DEADLINE
+            self.metrics.finish(exit_code)
+        if self.conf.warm_history:
+            record_login(self.conf.warm_history, mode, ssh_user, user_id)
+        return keys
+
+    def negative_lookup(self, mode, ssh_user, user_id, fingerprint=None):
+        """Runs the lookup unless it was denied recently."""
+        settings = lookup_settings(mode, self.conf.lookup)
+        negative_key = f"{settings.mode}.{ssh_user}.{user_id}"
+        denied = self.negative.get(negative_key)
+        if denied:
+            raise denied
+        try:
+            if fingerprint is not None:
+                return self.match_lookup(settings, ssh_user, user_id, fingerprint)
+            return self.run_lookup(settings, ssh_user, user_id)
+        except LookupUnavailable:
+            raise
+        except LookupFailed as e:
+            self.negative.put(negative_key, e)
+            raise
+
+    def run_pipeline(self, records, settings):
+        """Runs the key pipeline without revoked keys, timed as 'parse'."""
+        with self.metrics.phase("parse"):
+            return self.revocations.filter_lines(run_pipeline(records, settings))
+
+    def with_user_id(self, settings, ssh_user, user_id, lookup):
+        """
+        Resolves the uidNumber of 'ssh_user' and returns 'lookup(user_id)'.
+        If access is denied, the cached uidNumber may be outdated and is removed.
+        """
+        eppn = user_eppn(settings, ssh_user, self.get_eppn)
+        if eppn is None:
+            if user_id is None:
+                raise LookupFailed(31, f"Not a bwIDM User ID: {user_id}")
+            return lookup(user_id)
+        try:
+            return lookup(self.get_user_id(eppn))
+        except LookupUnavailable:
+            raise
+        except LookupFailed:
+            self.invalidate_user_id(eppn)
+            raise
+
+    def run_lookup(self, settings, ssh_user, user_id):
+        """Resolves the uidNumber and runs the key pipeline."""
+        return self.with_user_id(
+            settings,
+            ssh_user,
+            user_id,
+            lambda uid: self.run_pipeline(
+                self.fetch_records(settings, ssh_user, uid), settings
+            ),
+        )
+
+    def match_lookup(self, settings, ssh_user, user_id, fingerprint):
+        """
+        Returns the lines of the key with 'fingerprint' of all keys of
+        'ssh_user', none if the user has no such key. Matches are cached
+        for 'ttl' seconds, so the next logins with the key skip the key
+        pipeline.
+        """
+        if self.revocations.revoked(fingerprint):
+            return []
+        conf = self.conf
+        # Named like negative cache entries, '<mode>.<user>.<uidNumber>.<key>'
+        path = cache_path(
+            conf.cache_dir,
+            "match",
+            conf.ssn,
+            f"{settings.mode}.{ssh_user}.{user_id}.{fingerprint}",
+        )
+        entry = read_cache(path)
+        if entry is not None and entry[0] < conf.cache_ttl:
+            self.metrics.cache("match", "hit")
+            return entry[1].splitlines()
+        self.metrics.cache("match", "miss")
+        keys = self.run_lookup(settings, ssh_user, user_id)
+        lines = fingerprint_index(keys).get(fingerprint, [])
+        if lines:
+            write_cache(path, "\n".join(lines))
+        return lines
+
+
+def run_lookup(mode, ssh_user, user_id, conf, phases, deadline, fingerprint=None):
+    """
+    Runs lookup in this process with config 'conf', prints keys, starts
+    the refresh of stale entries and exits.
+    'phases' were measured before (startup, config), Reg-App requests are
+    abandoned at 'deadline'. With 'fingerprint' only the lines of that key
+    are printed.
+    """
+    resolver = Resolver(conf)
+    try:
+        keys = resolver.lookup(mode, ssh_user, user_id, phases, deadline, fingerprint)
+    except LookupFailed as e:
+        exit_with_msg(e.exit_code, *e.messages)
+    for key in keys:
+        print(key)
+    # Stale entries are refreshed after sshd got the keys
+    sys.stdout.flush()
+    resolver.start_refreshes()
+    sys.exit(0)
@@ -0,0 +1,246 @@
+"""
+Latency metrics of the key lookups.
+
+Each lookup records the duration of its phases (interpreter startup, config,
+getpwnam, attrq, key fetch, key parsing) and its outcome (exit code, cache
+hits and misses, HTTP status) and appends them as one JSON line to a spool
+file. Appends with O_APPEND are atomic and not synced, the spool is on tmpfs.
+bwidm_rest_metrics.py (run by a systemd timer) aggregates the spool into
+histograms for the node_exporter textfile collector.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from .defaults import METRICS_SPOOL
+
+# Histogram buckets in seconds
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Seconds for lookups to finish appending to a spool that was moved aside
+SPOOL_GRACE = 0.1
+
+
+def process_age():
+    """Returns seconds since this process was started, None if unknown (Linux)."""
+    try:
+        with open("/proc/self/stat", "r", encoding="ascii") as file:
+            # Field 22 is the start time in clock ticks after boot, the
+            # command name in field 2 may contain spaces
+            start = int(file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r", encoding="ascii") as file:
+            uptime = float(file.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, uptime - start / os.sysconf("SC_CLK_TCK"))
+
+
+class Metrics:
+    """Records the lookups of this process, one record per thread."""
+
+    def __init__(self, spool_file=METRICS_SPOOL):
+        self.spool_file = spool_file
+        self.local = threading.local()
+
+    def record(self):
+        """Returns record of the running lookup, None if not recording."""
+        return getattr(self.local, "record", None)
+
+    def attach(self, record):
+        """Records into 'record' of another thread, e.g. for concurrent requests."""
+        self.local.record = record
+
+    def begin(self, mode, phases=None):
+        """Starts record of a lookup, 'phases' were measured before."""
+        if not self.spool_file:
+            return
+        self.local.record = {
+            "mode": mode,
+            "exit": None,
+            "phases": dict(phases or {}),
+            "cache": {},
+            "http": Counter(),
+        }
+        self.local.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        """Adds duration of the 'with' block to phase 'name'."""
+        record = self.record()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if record is not None:
+                phases = record["phases"]
+                phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+    def cache(self, kind, outcome):
+        """Records cache outcome of entry 'kind' ('hit', 'stale', 'miss', ...)."""
+        record = self.record()
+        if record is not None:
+            record["cache"][kind] = outcome
+
+    def http(self, status):
+        """Records HTTP status of a Reg-App response."""
+        record = self.record()
+        if record is not None:
+            record["http"][str(status)] += 1
+
+    def finish(self, exit_code):
+        """Appends record of the lookup to the spool file, errors are ignored."""
+        record = self.record()
+        if record is None:
+            return
+        self.local.record = None
+        record["exit"] = exit_code
+        record["phases"]["lookup"] = time.perf_counter() - self.local.started
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        try:
+            fd = os.open(self.spool_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        except OSError:
+            return
+        try:
+            os.write(fd, line.encode("utf-8"))
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def take_spool(spool_file):
+    """
+    Moves the spool aside and returns its records, lookups start a new spool.
+    Spools left by an interrupted run are taken as well.
+    """
+    spool_dir, name = os.path.split(spool_file)
+    try:
+        os.rename(spool_file, f"{spool_file}.{os.getpid()}")
+    except OSError:
+        pass
+    try:
+        taken = [
+            os.path.join(spool_dir, entry)
+            for entry in os.listdir(spool_dir)
+            if entry.startswith(f"{name}.") and entry[len(name) + 1 :].isdigit()
+        ]
+    except OSError:
+        return [], []
+    # Lookups that opened the spool before the rename finish their append
+    time.sleep(SPOOL_GRACE)
+    records = []
+    for path in taken:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records, taken
+
+
+def read_state(state_file):
+    """Returns aggregated metrics of earlier runs."""
+    try:
+        with open(state_file, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {"histograms": {}, "counters": {}}
+
+
+def write_atomic(path, text):
+    """Writes file atomically, readers never see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+def fold(state, records):
+    """Adds lookup records to histograms and counters of 'state'."""
+    histograms = state["histograms"]
+    counters = Counter(state["counters"])
+    for record in records:
+        mode = record.get("mode")
+        for phase, seconds in record.get("phases", {}).items():
+            histogram = histograms.setdefault(
+                f"{mode}|{phase}",
+                {"buckets": [0] * len(METRICS_BUCKETS), "sum": 0.0, "count": 0},
+            )
+            for index, bound in enumerate(METRICS_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+        counters[f"logins|{mode}|{record.get('exit')}"] += 1
+        for kind, outcome in record.get("cache", {}).items():
+            counters[f"cache|{mode}|{kind}|{outcome}"] += 1
+        for status, count in record.get("http", {}).items():
+            counters[f"http|{mode}|{status}"] += count
+    state["counters"] = dict(counters)
+    return state
+
+
+def render(state):
+    """Returns metrics in the Prometheus text format."""
+    prefix = "bwidm_rest_ssh"
+    lines = [
+        f"# HELP {prefix}_phase_seconds Duration of the phases of key lookups.",
+        f"# TYPE {prefix}_phase_seconds histogram",
+    ]
+    for key, histogram in sorted(state["histograms"].items()):
+        mode, phase = key.split("|")
+        labels = f'mode="{mode}",phase="{phase}"'
+        for bound, count in zip(METRICS_BUCKETS, histogram["buckets"]):
+            lines.append(
+                f'{prefix}_phase_seconds_bucket{{{labels},le="{bound}"}} {count}'
+            )
+        lines.append(
+            f'{prefix}_phase_seconds_bucket{{{labels},le="+Inf"}} '
+            f"{histogram['count']}"
+        )
+        lines.append(f"{prefix}_phase_seconds_sum{{{labels}}} {histogram['sum']:.6f}")
+        lines.append(f"{prefix}_phase_seconds_count{{{labels}}} {histogram['count']}")
+
+    counters = {
+        "logins": ("logins_total", "Key lookups by exit code.", ("mode", "exit")),
+        "cache": (
+            "cache_total",
+            "Key cache outcomes by entry kind.",
+            ("mode", "kind", "outcome"),
+        ),
+        "http": (
+            "http_responses_total",
+            "Reg-App responses by HTTP status.",
+            ("mode", "status"),
+        ),
+    }
+    for counter, (name, help_text, label_names) in counters.items():
+        name = f"{prefix}_{name}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for key, count in sorted(state["counters"].items()):
+            fields = key.split("|")
+            if fields[0] != counter:
+                continue
+            labels = ",".join(
+                f'{label}="{value}"' for label, value in zip(label_names, fields[1:])
+            )
+            lines.append(f"{name}{{{labels}}} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def aggregate(spool_file, state_file, textfile):
+    """Folds the spool into the state and writes the textfile, returns records."""
+    records, taken = take_spool(spool_file)
+    state = fold(read_state(state_file), records)
+    write_atomic(state_file, json.dumps(state))
+    write_atomic(textfile, render(state))
+    # Only removed once they are part of the state
+    for path in taken:
+        os.unlink(path)
+    return len(records)
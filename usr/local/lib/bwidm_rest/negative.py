@@ -0,0 +1,108 @@
+"""
+Negative cache for users that do not exist or have no access.
+Repeated SSH attempts for such users are answered without a Reg-App request.
+Entries are kept in memory (resolver daemon) and on disk for 'ttl' seconds,
+at most 'max_entries' of them.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from .defaults import NEGATIVE_MAX_ENTRIES, NEGATIVE_TTL
+from .errors import LookupFailed
+
+# Unknown user, access denied by the Reg-App, no passwd entry
+NEGATIVE_EXIT_CODES = (11, 12, 31, 32, 52)
+
+
+class NegativeCache:
+    """Bounded cache of failed lookups."""
+
+    def __init__(
+        self, cache_dir, ssn, ttl=NEGATIVE_TTL, max_entries=NEGATIVE_MAX_ENTRIES
+    ):
+        self.cache_dir = os.path.join(
+            cache_dir, "negative", re.sub(r"[^\w.-]", "_", ssn)
+        )
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached LookupFailed of 'key', or None."""
+        if self.ttl <= 0:
+            return None
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+        if entry is None:
+            path = os.path.join(self.cache_dir, f"{key}.json")
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    entry = (os.fstat(file.fileno()).st_mtime, json.load(file))
+            except (OSError, ValueError):
+                return None
+        created, data = entry
+        if now - created >= self.ttl:
+            return None
+        try:
+            return LookupFailed(int(data["exit"]), *data["messages"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def put(self, key, error):
+        """Caches LookupFailed 'error' of 'key', if it means no access."""
+        if self.ttl <= 0 or error.exit_code not in NEGATIVE_EXIT_CODES:
+            return
+        data = {"exit": error.exit_code, "messages": list(error.messages)}
+        now = time.time()
+        with self.lock:
+            self.memory[key] = (now, data)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_entries:
+                self.memory.popitem(last=False)
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(data, file)
+            os.replace(tmp_path, path)
+            self.prune(now)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def prune(self, now):
+        """Removes expired entries on disk, then the oldest above 'max_entries'."""
+        with os.scandir(self.cache_dir) as entries:
+            if sum(1 for _ in entries) <= self.max_entries:
+                return
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if now - mtime >= self.ttl:
+                self.remove(entry.path)
+            else:
+                entries.append((mtime, entry.path))
+        entries.sort()
+        for _, path in entries[: max(0, len(entries) - self.max_entries)]:
+            self.remove(path)
+
+    @staticmethod
+    def remove(path):
+        """Removes an entry on disk."""
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
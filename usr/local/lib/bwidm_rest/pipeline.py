@@ -0,0 +1,171 @@
+"""
+Key lookup pipeline of the bwIDM REST API scripts.
+
+A lookup resolves the uidNumber of the user, fetches the keys and passes them
+through a chain of filter stages. Each stage is a generator over key records,
+dicts with the fields of the Reg-App key list or an authorized_keys 'line'.
+
+The stages are selected by the lookup mode (one per script) and can be
+changed in section [LOOKUP] of the config file.
+"""
+
+import json
+import re
+import time
+from types import SimpleNamespace
+
+from .errors import LookupFailed
+from .keys import rewrite_fido2_key, ssh_key_valid
+
+EPPN_DOMAIN = "uni-freiburg.de"
+SSH_KEY_NAME = "UNIFR-JUMPHOST"
+SSH_KEY_STATUS = ("ACTIVE", "EXPIRED")
+SSH_VALID_DAYS = 365
+
+# users: 'arg' (uidNumber argument), 'gecos' (EPPN from passwd gecos)
+#        or 'eppn' (<user>@<eppn_domain>)
+# keys: 'service' (active keys of the service), 'active' or 'all' (key list)
+PROFILES = {
+    "ssh": {"users": "arg", "keys": "service", "filters": ("fido2",)},
+    "ssh2": {"users": "arg", "keys": "service", "filters": ()},
+    "ssh3": {"users": "gecos", "keys": "service", "filters": ("fido2",)},
+    "jumphost": {"users": "eppn", "keys": "active", "filters": ("prefix",)},
+    "jumphost2": {
+        "users": "eppn",
+        "keys": "all",
+        "filters": ("prefix", "status", "age"),
+    },
+}
+LOOKUP_OPTIONS = (
+    "mode",
+    "users",
+    "keys",
+    "filters",
+    "key_name",
+    "key_status",
+    "valid_days",
+    "eppn_domain",
+)
+USER_SOURCES = ("arg", "gecos", "eppn")
+KEY_SOURCES = ("service", "active", "all")
+
+
+def split_list(value):
+    """Splits comma or space separated config value."""
+    return tuple(item for item in re.split(r"[,\s]+", value) if item)
+
+
+def lookup_settings(mode, options):
+    """Returns pipeline settings of 'mode', changed by '[LOOKUP]' 'options'."""
+    mode = options.get("mode", mode)
+    if mode not in PROFILES:
+        raise LookupFailed(26, f"Not a valid lookup mode: {mode}")
+    settings = SimpleNamespace(
+        mode=mode,
+        key_name=options.get("key_name", SSH_KEY_NAME),
+        key_status=SSH_KEY_STATUS,
+        valid_days=SSH_VALID_DAYS,
+        eppn_domain=options.get("eppn_domain", EPPN_DOMAIN),
+        **PROFILES[mode],
+    )
+    settings.users = options.get("users", settings.users)
+    settings.keys = options.get("keys", settings.keys)
+    if "filters" in options:
+        settings.filters = split_list(options["filters"])
+    if "key_status" in options:
+        settings.key_status = split_list(options["key_status"])
+    if "valid_days" in options:
+        try:
+            settings.valid_days = int(options["valid_days"])
+        except ValueError as e:
+            raise LookupFailed(26, f"Not a valid number: {e}") from e
+
+    if settings.users not in USER_SOURCES:
+        raise LookupFailed(26, f"Not a valid user source: {settings.users}")
+    if settings.keys not in KEY_SOURCES:
+        raise LookupFailed(26, f"Not a valid key source: {settings.keys}")
+    for name in settings.filters:
+        if name not in FILTERS:
+            raise LookupFailed(26, f"Not a valid key filter: {name}")
+    return settings
+
+
+def user_eppn(settings, ssh_user, get_eppn):
+    """Returns EPPN for the AttributeQuery, None if the uidNumber is given."""
+    if settings.users == "gecos":
+        return get_eppn(ssh_user)
+    if settings.users == "eppn":
+        return f"{ssh_user}@{settings.eppn_domain}"
+    return None
+
+
+def service_records(lines):
+    """Stage: authorized_keys lines of the service as records."""
+    for line in lines:
+        yield {"line": line}
+
+
+def list_records(keys, ssh_user):
+    """Stage: keys of the Reg-App key list as records, commented with user name."""
+    for key in keys:
+        yield dict(key, comment=ssh_user)
+
+
+def parse_records(text, settings, ssh_user):
+    """Stage: records of a Reg-App response of the key source of 'settings'."""
+    if settings.keys == "service":
+        return service_records(text.splitlines())
+    return list_records(json.loads(text), ssh_user)
+
+
+def fido2_filter(records, settings):
+    """Stage: rewrites FIDO2 command keys to plain keys."""
+    for record in records:
+        if "line" in record:
+            record = dict(record, line=rewrite_fido2_key(record["line"]))
+        yield record
+
+
+def prefix_filter(records, settings):
+    """Stage: keys whose name contains 'key_name'."""
+    for record in records:
+        if re.search(settings.key_name, record.get("name", "")):
+            yield record
+
+
+def status_filter(records, settings):
+    """Stage: keys with a 'key_status'."""
+    for record in records:
+        if record.get("keyStatus") in settings.key_status:
+            yield record
+
+
+def age_filter(records, settings):
+    """Stage: keys that are less than 'valid_days' old."""
+    now = time.time()
+    for record in records:
+        if ssh_key_valid(record.get("createdAt", ""), settings.valid_days, now):
+            yield record
+
+
+FILTERS = {
+    "fido2": fido2_filter,
+    "prefix": prefix_filter,
+    "status": status_filter,
+    "age": age_filter,
+}
+
+
+def render(record):
+    """Returns authorized_keys line of a record."""
+    if "line" in record:
+        return record["line"]
+    return f"{record['keyType']} {record['encodedKey']} {record['comment']}"
+
+
+def run_pipeline(records, settings):
+    """Passes records through the filters of 'settings', yields lines."""
+    for name in settings.filters:
+        records = FILTERS[name](records, settings)
+    for record in records:
+        yield render(record)
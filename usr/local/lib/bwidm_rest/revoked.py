@@ -0,0 +1,122 @@
+"""
+Revocation set: fingerprints of keys that must not be served any more.
+
+Stale cache entries, cached keys served while the Reg-App is down, the key
+store and the synced files may hold keys that were revoked after they were
+fetched. The revocation set is a file in the format of the key store (see
+bwidm_rest.store) with the SHA256 fingerprints of revoked keys as names, so
+each served key is checked with one hash lookup in the mapped file, without
+asking the Reg-App.
+
+The incremental bulk sync of the full key lists ('keys = all') updates the
+set with the changes it sees: keys that got the status REVOKED or were
+removed from the key list of a user are added, keys it added that are
+listed again are removed. Other key sources do not tell revoked keys from
+expired ones. bwidm_rest_revoke.py adds and removes fingerprints by hand,
+these are only removed by hand.
+"""
+
+from .defaults import REVOKED_SET
+from .keys import line_fingerprint
+from .store import KeyStore, MappedStore, write_store
+
+# Mode in the header of the set
+REVOKED_MODE = "revoked"
+REVOKED_STATUS = ("REVOKED",)
+# Note of the entries, the sync only removes its own entries
+SYNC_NOTE = "sync"
+MANUAL_NOTE = "manual"
+
+
+class RevocationSet:
+    """Reads the revocation set, maps it again when the file was replaced."""
+
+    def __init__(self, path=REVOKED_SET):
+        self.mapped = MappedStore(path, REVOKED_MODE) if path else None
+
+    def current(self):
+        """Returns the mapped set, None if there are no revoked keys."""
+        store = self.mapped.current() if self.mapped else None
+        return store if store is not None and store.count else None
+
+    def revoked(self, fingerprint):
+        """Returns True if the key with 'fingerprint' is revoked."""
+        store = self.current()
+        return bool(store and fingerprint) and store.find(fingerprint) is not None
+
+    def filter_lines(self, lines, extra=()):
+        """
+        Returns the authorized_keys 'lines' without revoked keys and keys
+        with 'extra' fingerprints.
+        """
+        store = self.current()
+        if store is None and not extra:
+            return list(lines)
+        kept = []
+        for line in lines:
+            fingerprint = line_fingerprint(line)
+            if fingerprint and (
+                fingerprint in extra
+                or (store is not None and store.find(fingerprint) is not None)
+            ):
+                continue
+            kept.append(line)
+        return kept
+
+    def filter_keys(self, keys):
+        """Returns authorized_keys file content 'keys' (bytes) without revoked keys."""
+        if self.current() is None:
+            return keys
+        lines = self.filter_lines(keys.decode("utf-8").splitlines())
+        return "".join(f"{line}\n" for line in lines).encode("utf-8")
+
+
+def read_revocations(path):
+    """Returns notes of the revoked fingerprints."""
+    try:
+        store = KeyStore(path)
+    except (OSError, ValueError):
+        return {}
+    try:
+        if store.mode != REVOKED_MODE:
+            return {}
+        return {name: keys.decode("utf-8") for name, _, keys in store.records()}
+    finally:
+        store.close()
+
+
+def update_revocations(path, revoked, restored=(), restore_all=False):
+    """
+    Adds 'revoked' (fingerprints with note) to the set and removes 'restored'
+    fingerprints that the sync added (all with 'restore_all'), returns the
+    numbers of added and removed fingerprints.
+    """
+    # Imported here, lookups only read the set
+    from .expiry import index_lock  # pylint: disable=import-outside-toplevel
+
+    with index_lock(path):
+        entries = read_revocations(path)
+        removed = 0
+        for fingerprint in restored:
+            note = entries.get(fingerprint)
+            if note is not None and (restore_all or note.startswith(SYNC_NOTE)):
+                del entries[fingerprint]
+                removed += 1
+        added, changed = 0, removed
+        for fingerprint, note in revoked.items():
+            old_note = entries.get(fingerprint)
+            if old_note is None:
+                added += 1
+            # Keys the sync revoked and that are revoked by hand again are
+            # not restored by the sync
+            elif not (note.startswith(MANUAL_NOTE) and old_note.startswith(SYNC_NOTE)):
+                continue
+            entries[fingerprint] = note
+            changed += 1
+        if changed:
+            write_store(
+                path,
+                REVOKED_MODE,
+                [(name, 0, note.encode("utf-8")) for name, note in entries.items()],
+            )
+    return added, removed
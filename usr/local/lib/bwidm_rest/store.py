@@ -0,0 +1,193 @@
+"""
+Compact key store of the bulk sync, read by the lookup scripts with mmap.
+
+The store maps user names to the rendered authorized_keys lines of the sync
+mode. It is one file with a header, an open addressing hash table (CRC-32 of
+the user name, linear probing) and the names and keys:
+
+  header  magic, version, length of the mode, slots, entries, build time
+  mode    sync mode, the store only answers lookups of this mode
+  slots   hash, uidNumber, name offset and length, keys offset and length
+  data    user names and keys
+
+A lookup maps the file and reads one or a few slots, no parsing or JSON.
+The store is replaced with a rename, readers keep the file they mapped.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from .keys import fingerprint_index
+
+STORE_MAGIC = b"BWKS"
+STORE_VERSION = 1
+HEADER = struct.Struct("<4sHHIId")
+SLOT = struct.Struct("<IIIIII")
+
+
+class KeyStore:
+    """Read-only view of a key store file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise ValueError(f"Not a key store: {path}")
+        magic, version, mode_len, self.slots, self.count, self.built = (
+            HEADER.unpack_from(self.map)
+        )
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            raise ValueError(f"Not a key store: {path}")
+        self.mode = self.map[HEADER.size : HEADER.size + mode_len].decode()
+        self.table = HEADER.size + mode_len
+
+    def find(self, ssh_user):
+        """Returns uidNumber and keys of 'ssh_user', None if not stored."""
+        name = ssh_user.encode("utf-8")
+        name_hash = zlib.crc32(name)
+        mask = self.slots - 1
+        index = name_hash & mask
+        while True:
+            slot_hash, uid, name_off, name_len, keys_off, keys_len = SLOT.unpack_from(
+                self.map, self.table + index * SLOT.size
+            )
+            if not name_len:
+                return None
+            if (
+                slot_hash == name_hash
+                and self.map[name_off : name_off + name_len] == name
+            ):
+                return uid, self.map[keys_off : keys_off + keys_len]
+            index = (index + 1) & mask
+
+    def records(self):
+        """Yields user name, uidNumber and keys of all entries."""
+        for index in range(self.slots):
+            _, uid, name_off, name_len, keys_off, keys_len = SLOT.unpack_from(
+                self.map, self.table + index * SLOT.size
+            )
+            if name_len:
+                yield (
+                    self.map[name_off : name_off + name_len].decode("utf-8"),
+                    uid,
+                    self.map[keys_off : keys_off + keys_len],
+                )
+
+    def close(self):
+        """Unmaps the file."""
+        self.map.close()
+
+
+class MappedStore:
+    """Maps the store 'path' of 'mode', again when the file was replaced (mtime)."""
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.store = None
+        self.mtime = None
+        self.lock = threading.Lock()
+
+    def current(self):
+        """Returns the mapped store, None if there is none of 'mode'."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        with self.lock:
+            if mtime != self.mtime:
+                # The previous mapping is not closed, other threads may read it
+                try:
+                    store = KeyStore(self.path)
+                except (OSError, ValueError):
+                    return None
+                self.store = store if store.mode == self.mode else None
+                self.mtime = mtime
+            return self.store
+
+
+def write_store(path, mode, records, built=None):
+    """
+    Writes store of 'records' (user name, uidNumber or None, keys as bytes)
+    atomically, readers never see a partial file.
+    """
+    records = list(records)
+    # Power of two with at least twice the entries, probe chains stay short
+    slots = 1 << max(1, (2 * len(records) - 1).bit_length())
+    mode_bytes = mode.encode("utf-8")
+    table = HEADER.size + len(mode_bytes)
+    offset = table + slots * SLOT.size
+    size = offset + sum(
+        len(name.encode("utf-8")) + len(keys) for name, _, keys in records
+    )
+    buffer = bytearray(size)
+    HEADER.pack_into(
+        buffer,
+        0,
+        STORE_MAGIC,
+        STORE_VERSION,
+        len(mode_bytes),
+        slots,
+        len(records),
+        time.time() if built is None else built,
+    )
+    buffer[HEADER.size : table] = mode_bytes
+    used = bytearray(slots)
+    for name, uid, keys in records:
+        name_bytes = name.encode("utf-8")
+        name_hash = zlib.crc32(name_bytes)
+        index = name_hash & (slots - 1)
+        while used[index]:
+            index = (index + 1) & (slots - 1)
+        used[index] = 1
+        keys_off = offset + len(name_bytes)
+        SLOT.pack_into(
+            buffer,
+            table + index * SLOT.size,
+            name_hash,
+            uid or 0,
+            offset,
+            len(name_bytes),
+            keys_off,
+            len(keys),
+        )
+        buffer[offset:keys_off] = name_bytes
+        buffer[keys_off : keys_off + len(keys)] = keys
+        offset = keys_off + len(keys)
+    os.makedirs(os.path.dirname(path), mode=0o755, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(buffer)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def stored_keys(
+    path, max_age, mode, ssh_user, user_id=None, revoked=None, fingerprint=None
+):
+    """
+    Returns the keys of 'ssh_user' in the store as authorized_keys file
+    content (bytes), None if the store is missing, too old, of another mode
+    or has no entry for the user. Keys in the revocation set 'revoked' are
+    left out, with 'fingerprint' only the lines of that key are returned.
+    """
+    try:
+        store = KeyStore(path)
+    except (OSError, ValueError):
+        return None
+    if store.mode != mode or time.time() - store.built > max_age:
+        return None
+    entry = store.find(ssh_user)
+    # A uidNumber that does not match the synced one is looked up
+    if entry is None or (user_id is not None and entry[0] != user_id):
+        return None
+    keys = entry[1] if revoked is None else revoked.filter_keys(entry[1])
+    if fingerprint is not None:
+        index = fingerprint_index(keys.decode("utf-8").splitlines())
+        lines = index.get(fingerprint, ())
+        keys = "".join(f"{line}\n" for line in lines).encode("utf-8")
+    return keys
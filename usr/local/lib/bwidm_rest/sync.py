@@ -0,0 +1,267 @@
+"""
+Bulk synchronization of SSH keys into an AuthorizedKeysFile tree.
+sshd reads the keys of a user from '<output_dir>/<user>' without network I/O.
+"""
+
+import os
+import pwd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .defaults import SYNC_WORKERS
+from .delta import DeltaSync
+from .errors import LookupFailed, LookupUnavailable
+from .expiry import EXPIRY_INDEX, ExpiryIndex, index_lock
+from .keys import key_fingerprint, parse_key
+from .pipeline import lookup_settings
+from .revoked import update_revocations
+from .store import KeyStore, write_store
+
+MIN_USER_ID = 900000
+# Seconds between checks of the expiry index for keys added by a sync
+EVICT_POLL = 60
+
+
+def passwd_users(min_uid=MIN_USER_ID):
+    """Returns user names and uidNumbers of all bwIDM users known to NSS."""
+    return [(pw.pw_name, pw.pw_uid) for pw in pwd.getpwall() if pw.pw_uid > min_uid]
+
+
+def read_user_file(path):
+    """Reads user names and uidNumbers, one 'user_name uidNumber' per line."""
+    users = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            fields = line.split()
+            if fields and not fields[0].startswith("#"):
+                uid = int(fields[1]) if len(fields) > 1 else None
+                users.append((fields[0], uid))
+    return users
+
+
+def tree_lock(output_dir):
+    """
+    Serializes changes of the files of the AuthorizedKeysFile tree and the
+    key store by sync and eviction, the lock file is next to the tree.
+    """
+    return index_lock(os.path.normpath(output_dir))
+
+
+def write_if_changed(path, content):
+    """Writes file atomically if its content changed, returns True if written."""
+    try:
+        with open(path, "rb") as file:
+            if file.read() == content:
+                return False
+    except OSError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as file:
+            file.write(content)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except OSError:
+        remove_file(tmp_path)
+        raise
+    return True
+
+
+def remove_file(path):
+    """Removes file, returns True if it existed."""
+    try:
+        os.unlink(path)
+        return True
+    except OSError:
+        return False
+
+
+def sync_user(resolver, mode, output_dir, user, delta=None):
+    """
+    Syncs keys of one user, returns 'changed', 'unchanged', 'removed' or 'failed'.
+    With 'delta', unchanged Reg-App responses are not processed again, the
+    file is still compared with their keys, so local changes are repaired.
+    """
+    ssh_user, user_id = user
+    path = os.path.join(output_dir, ssh_user)
+    try:
+        if delta:
+            keys = delta.refresh(ssh_user, user_id)
+        else:
+            keys = resolver.lookup(mode, ssh_user, user_id)
+    except LookupUnavailable:
+        # Keep the last synced keys
+        return "failed"
+    except LookupFailed:
+        # Access denied
+        if delta:
+            delta.forget(ssh_user)
+        with tree_lock(output_dir):
+            return "removed" if remove_file(path) else "unchanged"
+    content = "".join(f"{key}\n" for key in keys).encode("utf-8")
+    with tree_lock(output_dir):
+        return "changed" if write_if_changed(path, content) else "unchanged"
+
+
+def read_keys_file(path):
+    """Returns content of a keys file, None if it does not exist."""
+    try:
+        with open(path, "rb") as file:
+            return file.read()
+    except OSError:
+        return None
+
+
+def build_store(path, mode, users, output_dir):
+    """Writes key store of the synced files of 'users', returns its entries."""
+    records = []
+    for ssh_user, user_id in users:
+        keys = read_keys_file(os.path.join(output_dir, ssh_user))
+        if keys is not None:
+            records.append((ssh_user, user_id, keys))
+    write_store(path, mode, records)
+    return len(records)
+
+
+def update_store(path, output_dir, user_names):
+    """Replaces keys of 'user_names' in the key store by their synced files."""
+    try:
+        store = KeyStore(path)
+    except (OSError, ValueError):
+        return
+    records = []
+    for ssh_user, user_id, keys in store.records():
+        if ssh_user in user_names:
+            keys = read_keys_file(os.path.join(output_dir, ssh_user))
+            if keys is None:
+                continue
+        records.append((ssh_user, user_id, keys))
+    # Eviction does not make the keys more recent than the sync
+    write_store(path, store.mode, records, store.built)
+    store.close()
+
+
+def sync_keys(
+    resolver,
+    mode,
+    users,
+    output_dir,
+    workers=SYNC_WORKERS,
+    state_dir=None,
+    store=None,
+    revoked=None,
+):
+    """
+    Syncs keys of all 'users' with a bounded number of concurrent requests.
+    Files of users that are no longer listed are removed.
+    With 'state_dir' the sync is incremental, see bwidm_rest.delta, and
+    updates the revocation set 'revoked', see bwidm_rest.revoked.
+    With 'store' the synced keys are also written to a key store for 'mode',
+    see bwidm_rest.store.
+    Returns counters, the duration in seconds and the CPU time.
+    """
+    start, start_cpu = time.monotonic(), time.process_time()
+    os.makedirs(output_dir, mode=0o755, exist_ok=True)
+    delta = None
+    if state_dir:
+        delta = DeltaSync(
+            resolver, lookup_settings(mode, resolver.conf.lookup), state_dir
+        )
+    stats = {"changed": 0, "unchanged": 0, "removed": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(
+            lambda user: sync_user(resolver, mode, output_dir, user, delta), users
+        ):
+            stats[result] += 1
+    user_names = {user[0] for user in users}
+    if delta:
+        delta.prune(user_names)
+        delta.save_index(user_names)
+        stats.update(delta.stats)
+        if revoked:
+            stats["revoked"], stats["restored"] = update_revocations(
+                revoked, delta.revoked, delta.restored
+            )
+    with tree_lock(output_dir):
+        for file_name in os.listdir(output_dir):
+            if file_name not in user_names and not file_name.endswith(".tmp"):
+                if remove_file(os.path.join(output_dir, file_name)):
+                    stats["removed"] += 1
+        if store:
+            stats["stored"] = build_store(store, mode, users, output_dir)
+    stats["users"] = len(users)
+    stats["seconds"] = time.monotonic() - start
+    stats["cpu_seconds"] = time.process_time() - start_cpu
+    return stats
+
+
+def evict_keys(path, fingerprints):
+    """
+    Removes keys with 'fingerprints' from the keys file 'path', returns
+    True if the file changed. The caller holds the tree_lock.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return False
+    kept = []
+    for line in lines:
+        key = parse_key(line)
+        if key is None or key_fingerprint(key.blob) not in fingerprints:
+            kept.append(line)
+    return write_if_changed(path, "".join(f"{line}\n" for line in kept).encode("utf-8"))
+
+
+def evict_revoked(output_dir, fingerprints, store=None):
+    """
+    Removes keys with 'fingerprints' from all files of the AuthorizedKeysFile
+    tree and from the key 'store', returns the users whose keys changed.
+    """
+    try:
+        file_names = os.listdir(output_dir)
+    except OSError:
+        return set()
+    with tree_lock(output_dir):
+        users = {
+            file_name
+            for file_name in file_names
+            if not file_name.endswith(".tmp")
+            and evict_keys(os.path.join(output_dir, file_name), fingerprints)
+        }
+        if users and store:
+            update_store(store, output_dir, users)
+    return users
+
+
+def evict_expired(state_dir, output_dir, now=None, store=None):
+    """
+    Removes keys that got older than 'valid_days' from the AuthorizedKeysFile
+    tree and the key 'store', without network I/O or date parsing.
+    Returns the evicted index entries and the next expiry instant.
+    """
+    now = time.time() if now is None else now
+    path = os.path.join(state_dir, EXPIRY_INDEX)
+    with index_lock(path):
+        index = ExpiryIndex.load(path)
+        expired = index.pop_expired(now)
+        users = {}
+        for entry in expired:
+            users.setdefault(entry.ssh_user, set()).add(entry.fingerprint)
+        if expired:
+            with tree_lock(output_dir):
+                for ssh_user, fingerprints in users.items():
+                    evict_keys(os.path.join(output_dir, ssh_user), fingerprints)
+                if store:
+                    update_store(store, output_dir, users)
+            index.save(path)
+    return expired, index.next_expiry()
+
+
+def expiring_keys(state_dir, seconds, now=None):
+    """Returns index entries of synced keys that expire within 'seconds'."""
+    now = time.time() if now is None else now
+    return ExpiryIndex.load(os.path.join(state_dir, EXPIRY_INDEX)).expiring(
+        seconds, now
+    )
@@ -0,0 +1,267 @@
+"""
+HTTP transports for requests to the Reg-App.
+
+'requests' uses a keep-alive requests.Session.
+'stdlib' only uses http.client and ssl, which start much faster than
+requests with urllib3, idna, charset detection and certifi. Like requests
+it tunnels through the proxy of HTTPS_PROXY (or ALL_PROXY) unless the host
+is listed in NO_PROXY.
+Both raise 'Unreachable' for connection errors, timeouts and 5xx responses
+and 'RestError' for other errors, like requests.get() and raise_for_status().
+
+Requests with validators of an earlier response (ETag, Last-Modified) are
+conditional, the Reg-App may answer 304 Not Modified without a body.
+"""
+
+import base64
+import os
+import threading
+from urllib.parse import unquote, urlsplit
+
+from .errors import RestError, Unreachable
+
+TRANSPORTS = ("requests", "stdlib")
+USER_AGENT = "bwidm-rest-ssh"
+MAX_REDIRECTS = 5
+# Validators of a response and the headers of conditional requests
+VALIDATORS = (
+    ("etag", "ETag", "If-None-Match"),
+    ("last_modified", "Last-Modified", "If-Modified-Since"),
+)
+
+
+def conditional_headers(validators):
+    """Returns headers of a request conditional on 'validators'."""
+    return {
+        request_header: validators[name]
+        for name, _, request_header in VALIDATORS
+        if validators and validators.get(name)
+    }
+
+
+def response_validators(headers):
+    """Returns validators of a response with 'headers', None if there are none."""
+    validators = {
+        name: headers[header] for name, header, _ in VALIDATORS if headers.get(header)
+    }
+    return validators or None
+
+
+def https_proxy(host):
+    """
+    Returns URL of the proxy for HTTPS requests to 'host' from the
+    environment like requests, None if there is none or 'host' bypasses it.
+    """
+    if not any(name.lower().endswith("_proxy") for name in os.environ):
+        return None
+    # Imported here, only needed with a proxy
+    import urllib.request  # pylint: disable=import-outside-toplevel
+
+    proxies = urllib.request.getproxies_environment()
+    proxy = proxies.get("https") or proxies.get("all")
+    if not proxy or urllib.request.proxy_bypass_environment(host, proxies):
+        return None
+    return proxy if "://" in proxy else f"http://{proxy}"
+
+
+class RequestsTransport:
+    """Transport based on a requests.Session, shared by all threads."""
+
+    def __init__(self, reg_host, rest_user, rest_pw, timeout, pool_size=None):
+        # Imported here, the stdlib transport does not need it
+        import requests  # pylint: disable=import-outside-toplevel
+
+        self.requests = requests
+        self.base_url = f"https://{reg_host}"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = (rest_user, rest_pw)
+        if pool_size:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=pool_size
+            )
+            self.session.mount("https://", adapter)
+
+    def get(self, path, timeout=None, validators=None):
+        """
+        Sends GET request to the Reg-App, returns status code, text and
+        validators of the response. 'timeout' replaces the timeout of the
+        transport for this request, with 'validators' the request is
+        conditional.
+        """
+        exceptions = self.requests.exceptions
+        try:
+            response = self.session.get(
+                f"{self.base_url}{path}",
+                timeout=timeout or self.timeout,
+                headers=conditional_headers(validators),
+            )
+            response.raise_for_status()
+        except (exceptions.ConnectionError, exceptions.Timeout) as e:
+            raise Unreachable(e) from e
+        except exceptions.RequestException as e:
+            status = e.response.status_code if e.response is not None else None
+            if status is not None and status >= 500:
+                raise Unreachable(e, status=status) from e
+            raise RestError(e, status=status) from e
+        return (
+            response.status_code,
+            response.text,
+            response_validators(response.headers),
+        )
+
+
+class StdlibTransport:
+    """Transport based on http.client, one keep-alive connection per thread."""
+
+    def __init__(self, reg_host, rest_user, rest_pw, timeout, pool_size=None):
+        # pylint: disable=import-outside-toplevel
+        import http.client
+        import ssl
+
+        self.http = http.client
+        self.reg_host = reg_host
+        self.timeout = timeout
+        # Same as requests: Basic auth encoded as latin1, CA bundle from env
+        credentials = f"{rest_user}:{rest_pw}".encode("latin1")
+        self.headers = {
+            "Authorization": f"Basic {base64.b64encode(credentials).decode()}",
+            "Accept-Encoding": "gzip",
+            "Accept": "*/*",
+            "User-Agent": USER_AGENT,
+        }
+        self.ssl = ssl
+        self.context = None
+        self.local = threading.local()
+
+    def connection(self, host, timeout):
+        """Returns keep-alive connection of this thread to 'host'."""
+        conn_host, conn = getattr(self.local, "conn", (None, None))
+        if conn is None or conn_host != host:
+            if conn is not None:
+                conn.close()
+            # Loading the CA certificates is expensive, like requests only
+            # do it for the first connection
+            if self.context is None:
+                self.context = self.ssl.create_default_context(
+                    cafile=os.environ.get("REQUESTS_CA_BUNDLE")
+                    or os.environ.get("CURL_CA_BUNDLE")
+                )
+            proxy = https_proxy(host)
+            if proxy is None:
+                conn = self.http.HTTPSConnection(
+                    host, timeout=timeout, context=self.context
+                )
+            else:
+                conn = self.tunnel(proxy, host, timeout)
+            self.local.conn = (host, conn)
+        else:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+        return conn
+
+    def tunnel(self, proxy, host, timeout):
+        """Returns connection to 'host' through a CONNECT tunnel of 'proxy'."""
+        url = urlsplit(proxy)
+        conn = self.http.HTTPSConnection(
+            url.hostname, url.port or 80, timeout=timeout, context=self.context
+        )
+        headers = {}
+        if url.username:
+            credentials = f"{unquote(url.username)}:{unquote(url.password or '')}"
+            headers["Proxy-Authorization"] = (
+                f"Basic {base64.b64encode(credentials.encode('latin1')).decode()}"
+            )
+        conn.set_tunnel(host, headers=headers)
+        return conn
+
+    def close(self):
+        """Closes the connection of this thread."""
+        _, conn = getattr(self.local, "conn", (None, None))
+        if conn is not None:
+            conn.close()
+        self.local.conn = (None, None)
+
+    def request(self, host, path, headers, timeout):
+        """Sends one request, retries once if a kept-alive connection was closed."""
+        for attempt in (1, 2):
+            conn = self.connection(host, timeout)
+            try:
+                conn.request("GET", path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+                return response, body
+            except (self.http.RemoteDisconnected, ConnectionResetError):
+                self.close()
+                if attempt == 2:
+                    raise
+            except (OSError, self.http.HTTPException):
+                self.close()
+                raise
+        return None
+
+    def get(self, path, timeout=None, validators=None):
+        """
+        Sends GET request to the Reg-App, returns status code, text and
+        validators of the response. 'timeout' replaces the timeout of the
+        transport for this request, with 'validators' the request is
+        conditional.
+        """
+        host, timeout = self.reg_host, timeout or self.timeout
+        headers = {**self.headers, **conditional_headers(validators)}
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                response, body = self.request(host, path, headers, timeout)
+                location = response.getheader("Location") or ""
+                if response.status not in (301, 302, 303, 307, 308):
+                    break
+                if location.startswith("/"):
+                    path = location
+                elif location.startswith("https://"):
+                    new_host, _, path = location[8:].partition("/")
+                    path = f"/{path}"
+                    # Like requests, credentials are only sent to the same host
+                    if new_host != host:
+                        headers = {
+                            k: v for k, v in headers.items() if k != "Authorization"
+                        }
+                    host = new_host
+                else:
+                    break
+        except (OSError, self.http.HTTPException) as e:
+            raise Unreachable(f"{e.__class__.__name__}: {e} (https://{host})") from e
+
+        url = f"https://{host}{path}"
+        if response.status >= 500:
+            raise Unreachable(
+                f"{response.status} Server Error: {response.reason} for url: {url}",
+                status=response.status,
+            )
+        if response.status >= 400:
+            raise RestError(
+                f"{response.status} Client Error: {response.reason} for url: {url}",
+                status=response.status,
+            )
+        if response.getheader("Content-Encoding") == "gzip":
+            import gzip  # pylint: disable=import-outside-toplevel
+
+            body = gzip.decompress(body)
+        charset = response.headers.get_content_charset() or "utf-8"
+        return (
+            response.status,
+            body.decode(charset, errors="replace"),
+            response_validators(response.headers),
+        )
+
+
+def make_transport(conf, pool_size=None, reg_host=None):
+    """Returns transport selected by '[REST] transport' for 'reg_host'."""
+    transport = StdlibTransport if conf.transport == "stdlib" else RequestsTransport
+    return transport(
+        reg_host or conf.reg_host,
+        conf.rest_user,
+        conf.rest_pw,
+        conf.max_time,
+        pool_size,
+    )
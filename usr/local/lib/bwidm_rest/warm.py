@@ -0,0 +1,180 @@
+"""
+Predictive cache warmer driven by the recent logins.
+
+Every successful lookup appends mode, user name and uidNumber to a spool
+file, like the metrics. bwidm_rest_warm.py (run by a systemd timer) folds the
+spool into a login history of the last 'days' days and predicts the users
+that will log in within the next 'lead' seconds:
+
+  daily   logins at the same time of day on earlier days (workday start)
+  recent  logins within the last 'recent' seconds (job submission bursts)
+
+For these users it runs the lookup with the cache TTLs shortened by 'lead',
+so cache entries that expire within 'lead' seconds are refreshed and fresh
+entries cost nothing. At most 'budget' Reg-App requests are sent per run,
+users with most predicted logins first.
+"""
+
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from .defaults import WARM_DAYS, WARM_RECENT
+from .errors import LookupFailed, LookupUnavailable
+from .metrics import take_spool, write_atomic
+
+# Logins of a user closer than this are one login (e.g. parallel sessions)
+LOGIN_SPACING = 300
+LOGINS_PER_USER = 100
+
+
+def record_login(spool_file, mode, ssh_user, user_id):
+    """Appends a successful login to the spool, errors are ignored."""
+    line = json.dumps(
+        {"time": time.time(), "mode": mode, "user": ssh_user, "uid": user_id},
+        separators=(",", ":"),
+    )
+    try:
+        fd = os.open(spool_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    except OSError:
+        return
+    try:
+        os.write(fd, f"{line}\n".encode("utf-8"))
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def read_history(state_file):
+    """Returns login history of earlier runs, login times by user."""
+    try:
+        with open(state_file, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def user_key(mode, ssh_user, user_id):
+    """Returns key of a user in the login history."""
+    return json.dumps([mode, ssh_user, user_id])
+
+
+def fold_logins(history, records, now, days=WARM_DAYS):
+    """Adds login records to 'history', drops logins older than 'days'."""
+    for record in sorted(records, key=lambda record: record.get("time", 0)):
+        try:
+            key = user_key(record["mode"], record["user"], record["uid"])
+            login = float(record["time"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        logins = history.setdefault(key, [])
+        if not logins or login - logins[-1] >= LOGIN_SPACING:
+            logins.append(login)
+    oldest = now - days * 86400
+    for key in list(history):
+        logins = [login for login in history[key] if login >= oldest]
+        if logins:
+            history[key] = logins[-LOGINS_PER_USER:]
+        else:
+            del history[key]
+    return history
+
+
+def login_score(logins, now, horizon, days=WARM_DAYS, recent=WARM_RECENT):
+    """
+    Returns number of earlier days with a login between now and 'horizon'
+    seconds later in the day, plus one after a login in the last 'recent'
+    seconds. 0: no login expected.
+    """
+    score = 0
+    for day in range(1, days + 1):
+        start = now - day * 86400 - LOGIN_SPACING
+        end = start + horizon + 2 * LOGIN_SPACING
+        if any(start <= login <= end for login in logins):
+            score += 1
+    if logins and now - logins[-1] <= recent:
+        score += 1
+    return score
+
+
+def predict_logins(history, now, horizon, days=WARM_DAYS, recent=WARM_RECENT):
+    """Returns mode, user name and uidNumber of expected logins, likeliest first."""
+    scored = []
+    for key, logins in history.items():
+        score = login_score(logins, now, horizon, days, recent)
+        if score:
+            scored.append((-score, -logins[-1], key))
+    return [tuple(json.loads(key)) for _, _, key in sorted(scored)]
+
+
+class RequestBudget:
+    """Counts the Reg-App requests of a resolver (its 'limiter')."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Counts a request."""
+        with self.lock:
+            self.used += 1
+
+    def allows(self, requests):
+        """Returns True if 'requests' more requests fit into the budget."""
+        return self.used + requests <= self.budget
+
+
+def warming_config(conf, lead):
+    """
+    Returns config of the warmer: entries that expire within 'lead' seconds
+    are not fresh, lookups of the warmer are not logins or metrics.
+    """
+    warming = SimpleNamespace(**vars(conf))
+    warming.cache_ttl = max(0, conf.cache_ttl - lead)
+    warming.cache_uid_ttl = max(0, conf.cache_uid_ttl - lead)
+    warming.metrics_spool = ""
+    warming.warm_history = ""
+    return warming
+
+
+def warm_cache(resolver, logins, budget):
+    """
+    Runs lookups of the expected 'logins' with 'resolver' (built with
+    warming_config, refresh in the foreground and a RequestBudget)
+    until the budget is used up, returns counts.
+    """
+    counts = {"users": 0, "warmed": 0, "denied": 0, "unavailable": 0, "skipped": 0}
+    # AttributeQuery and key lists of all services
+    worst_case = 1 + len(resolver.conf.ssns)
+    for mode, ssh_user, user_id in logins:
+        if not budget.allows(worst_case):
+            counts["skipped"] += 1
+            continue
+        counts["users"] += 1
+        used = budget.used
+        try:
+            resolver.lookup(mode, ssh_user, user_id)
+        except LookupUnavailable:
+            counts["unavailable"] += 1
+        except LookupFailed:
+            counts["denied"] += 1
+        else:
+            if budget.used > used:
+                counts["warmed"] += 1
+    counts["requests"] = budget.used
+    return counts
+
+
+def update_history(spool_file, state_file, now, days=WARM_DAYS):
+    """Folds the login spool into the history file, returns the history."""
+    records, taken = take_spool(spool_file)
+    history = fold_logins(read_history(state_file), records, now, days)
+    write_atomic(state_file, json.dumps(history))
+    # Only removed once they are part of the history
+    for path in taken:
+        os.unlink(path)
+    return history
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Reports the SSH keys of all users of the bwIDM service, one row per key:
+name, type, FIDO2 or plain, key name prefix, status, expiry, whether the
+lookup mode serves the key and whether it is revoked. Rows are streamed as
+CSV or JSON lines.
+Users are read from NSS (uidNumber > 900000) or from a file.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+# Shared library location (/usr/local/lib/bwidm_rest)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "lib")
+)
+# pylint: disable-next=wrong-import-position
+from bwidm_rest.audit import AUDIT_FIELDS, RateLimiter, audit_keys
+from bwidm_rest.cache import refresh_in_thread
+from bwidm_rest.config import CONFIG_FILE, read_config
+from bwidm_rest.errors import LookupFailed, exit_with_msg
+from bwidm_rest.lookup import Resolver
+from bwidm_rest.pipeline import PROFILES, lookup_settings
+from bwidm_rest.sync import passwd_users, read_user_file
+
+# Command line variables
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-c", "--config", default=CONFIG_FILE, help="Config file")
+parser.add_argument("--mode", choices=sorted(PROFILES), help="Lookup mode")
+parser.add_argument("--users", help="File with lines 'user_name [uidNumber]'")
+parser.add_argument("--workers", type=int, help="Concurrent requests")
+parser.add_argument("--rate", type=float, help="Requests per second, 0: no limit")
+parser.add_argument("--format", choices=["csv", "json"], default="csv")
+parser.add_argument("--prefix", action="store_true", help="Keys with the key_name")
+parser.add_argument("--fido2", action="store_true", help="FIDO2 keys only")
+parser.add_argument("--plain", action="store_true", help="Plain keys only")
+parser.add_argument(
+    "--expiring", type=float, metavar="DAYS", help="Keys expiring within DAYS"
+)
+args = parser.parse_args()
+
+try:
+    config = read_config(args.config)
+    settings = lookup_settings(args.mode or "jumphost2", config.lookup)
+except LookupFailed as e:
+    exit_with_msg(e.exit_code, *e.messages)
+# Always fetch, the key cache is updated on the way
+config.cache_ttl = config.cache_stale_ttl = config.cache_negative_ttl = 0
+config.metrics_spool = ""
+workers = args.workers or config.audit_workers
+rate = config.audit_rate if args.rate is None else args.rate
+
+try:
+    users = read_user_file(args.users) if args.users else passwd_users()
+except (OSError, ValueError) as e:
+    exit_with_msg(27, f"Can not read users: {e}")
+
+
+def selected(row):
+    """Returns True if the row passes the selection of the command line."""
+    if row["error"]:
+        return True
+    if args.prefix and not row["prefix"]:
+        return False
+    if args.fido2 and not row["fido2"]:
+        return False
+    if args.plain and row["fido2"]:
+        return False
+    if args.expiring is not None and not (
+        row["days_left"] is not None and 0 <= row["days_left"] < args.expiring
+    ):
+        return False
+    return True
+
+
+start = time.monotonic()
+resolver = Resolver(
+    config,
+    refresh_in_thread,
+    pool_size=workers,
+    limiter=RateLimiter(rate) if rate > 0 else None,
+)
+if args.format == "csv":
+    writer = csv.DictWriter(sys.stdout, AUDIT_FIELDS)
+    writer.writeheader()
+counts = {"keys": 0, "errors": 0}
+last_user = None
+for row in audit_keys(resolver, settings, users, workers):
+    if not selected(row):
+        continue
+    counts["errors" if row["error"] else "keys"] += 1
+    if args.format == "csv":
+        writer.writerow(row)
+    else:
+        sys.stdout.write(json.dumps(row) + "\n")
+    # Streamed, flushed once per user
+    if row["user"] != last_user:
+        sys.stdout.flush()
+        last_user = row["user"]
+seconds = time.monotonic() - start
+print(
+    f"Audited {len(users)} users in {seconds:.1f} s"
+    f" ({len(users) / max(seconds, 0.001):.0f} users/s):"
+    f" {counts['keys']} keys, {counts['errors']} failed",
+    file=sys.stderr,
+)
+sys.exit(1 if counts["errors"] else 0)
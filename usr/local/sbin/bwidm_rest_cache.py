@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Invalidates entries of the key and uidNumber cache of the bwIDM REST API scripts.
+Names can be user names, EPPNs or uidNumbers.
+"""
+
+import argparse
+import os
+import sys
+
+# Shared library location (/usr/local/lib/bwidm_rest)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "lib")
+)
+# pylint: disable-next=wrong-import-position
+from bwidm_rest.cache import cache_path, flush_cache, remove_cache
+from bwidm_rest.config import CONFIG_FILE, read_config
+from bwidm_rest.errors import LookupFailed, exit_with_msg
+from bwidm_rest.lookup import get_eppn
+from bwidm_rest.negative import NegativeCache
+from bwidm_rest.pipeline import EPPN_DOMAIN
+
+
+def match_entries(conf, name, field):
+    """
+    Returns paths of cached key matches with 'name' as 'field' of the
+    entry name '<mode>.<user>.<uidNumber>.<key>' (dots are quoted).
+    """
+    match_dir = os.path.dirname(cache_path(conf.cache_dir, "match", conf.ssn, ""))
+    try:
+        return [
+            entry.path
+            for entry in os.scandir(match_dir)
+            if entry.name.split("%2E")[field : field + 1] == [name]
+        ]
+    except OSError:
+        return []
+
+
+def cache_entries(conf, name):
+    """Returns paths of all cache entries belonging to 'name'."""
+    if name.isdigit():
+        return match_entries(conf, name, 2) + [
+            cache_path(conf.cache_dir, kind, ssn, name)
+            for ssn in conf.ssns
+            for kind in ("keys", "list-active", "list-all")
+        ]
+    # Negative cache entries are named '<mode>.<user>.<uidNumber>.json'
+    negative = NegativeCache(conf.cache_dir, conf.ssn)
+    try:
+        paths = [
+            entry.path
+            for entry in os.scandir(negative.cache_dir)
+            if entry.name.split(".")[1:2] == [name]
+        ]
+    except OSError:
+        paths = []
+    eppns = {name}
+    if "@" not in name:
+        eppns.add(f"{name}@{conf.lookup.get('eppn_domain', EPPN_DOMAIN)}")
+        try:
+            eppns.add(get_eppn(name))
+        except LookupFailed:
+            pass
+    return (
+        paths
+        + match_entries(conf, name, 1)
+        + [cache_path(conf.cache_dir, "uid", conf.ssn, eppn) for eppn in eppns]
+    )
+
+
+# Command line variables
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-c", "--config", default=CONFIG_FILE, help="Config file")
+commands = parser.add_subparsers(dest="command", required=True)
+invalidate = commands.add_parser("invalidate", help="Remove entries of users")
+invalidate.add_argument("names", nargs="+", help="User name, EPPN or uidNumber")
+flush = commands.add_parser("flush", help="Remove all entries")
+flush.add_argument(
+    "--kind",
+    choices=["keys", "list-active", "list-all", "match", "uid", "negative"],
+    help="Only remove this kind",
+)
+args = parser.parse_args()
+
+try:
+    config = read_config(args.config)
+except LookupFailed as e:
+    exit_with_msg(e.exit_code, *e.messages)
+
+if args.command == "flush":
+    flush_cache(config.cache_dir, args.kind)
+else:
+    for user_name in args.names:
+        for path in cache_entries(config, user_name):
+            remove_cache(path)
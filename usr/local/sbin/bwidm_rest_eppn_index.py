@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Writes the index of user names to EPPNs (gecos field) that bwidm_rest_ssh3.py
+reads instead of calling getpwnam on every login.
+Accounts are enumerated with NSS (SSSD needs 'enumerate = true') or read
+from an export file in passwd format, e.g. 'getent passwd' of another host.
+Run it periodically, e.g. with the systemd timer bwidm-rest-eppn-index.timer.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Shared library location (/usr/local/lib/bwidm_rest)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "lib")
+)
+# pylint: disable-next=wrong-import-position
+from bwidm_rest.config import CONFIG_FILE, read_config
+from bwidm_rest.eppn import nss_accounts, read_passwd_file, write_eppn_index
+from bwidm_rest.errors import LookupFailed, exit_with_msg
+
+# Command line variables
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-c", "--config", default=CONFIG_FILE, help="Config file")
+parser.add_argument("--export", help="File in passwd format instead of NSS")
+parser.add_argument(
+    "--force", action="store_true", help="Write index even if the export is older"
+)
+args = parser.parse_args()
+
+try:
+    config = read_config(args.config)
+except LookupFailed as e:
+    exit_with_msg(e.exit_code, *e.messages)
+index = config.cache_eppn_index
+if not index:
+    exit_with_msg(26, "Config variable eppn_index is empty")
+
+start = time.monotonic()
+try:
+    if args.export:
+        # Unchanged export, the index only needs a new build time before it
+        # gets older than eppn_index_max_age
+        index_mtime = os.stat(index).st_mtime if os.path.exists(index) else 0
+        if (
+            not args.force
+            and os.stat(args.export).st_mtime < index_mtime
+            and time.time() - index_mtime < config.cache_eppn_index_max_age / 2
+        ):
+            print(f"{index} is up to date")
+            sys.exit(0)
+        accounts = read_passwd_file(args.export)
+    else:
+        accounts = nss_accounts()
+    users = write_eppn_index(index, accounts)
+except (OSError, ValueError) as e:
+    exit_with_msg(27, f"Can not write EPPN index: {e}")
+print(f"Indexed {users} users in {time.monotonic() - start:.2f} s: {index}")
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Aggregates the latency metrics of the key lookups of the bwIDM REST API scripts
+into histograms for the node_exporter textfile collector.
+Run it periodically, e.g. with the systemd timer bwidm-rest-metrics.timer.
+"""
+
+import argparse
+import os
+import sys
+
+# Shared library location (/usr/local/lib/bwidm_rest)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "lib")
+)
+# pylint: disable-next=wrong-import-position
+from bwidm_rest.config import CONFIG_FILE, read_config
+from bwidm_rest.errors import LookupFailed, exit_with_msg
+from bwidm_rest.metrics import aggregate
+
+# Command line variables
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-c", "--config", default=CONFIG_FILE, help="Config file")
+parser.add_argument("--textfile", help="Output file of the textfile collector")
+args = parser.parse_args()
+
+try:
+    config = read_config(args.config)
+except LookupFailed as e:
+    exit_with_msg(e.exit_code, *e.messages)
+if not config.metrics_spool:
+    exit_with_msg(26, "Config variable spool is empty")
+
+try:
+    aggregate(
+        config.metrics_spool,
+        config.metrics_state,
+        args.textfile or config.metrics_textfile,
+    )
+except OSError as e:
+    exit_with_msg(1, f"Can not aggregate metrics: {e}")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Adds keys to or removes them from the revocation set of the bwIDM REST API
+scripts. Revoked keys are never served, also not from the key cache or the
+key store, and are removed from the synced AuthorizedKeysFile tree. Keys
+removed from the set are synced again by the next bulk sync.
+Keys are given as SHA256 fingerprints or authorized_keys lines.
+"""
+
+import argparse
+import os
+import sys
+
+# Shared library location (/usr/local/lib/bwidm_rest)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "lib")
+)
+# pylint: disable-next=wrong-import-position
+from bwidm_rest.config import CONFIG_FILE, read_config
+from bwidm_rest.delta import invalidate_states
+from bwidm_rest.errors import LookupFailed, exit_with_msg
+from bwidm_rest.keys import line_fingerprint
+from bwidm_rest.revoked import MANUAL_NOTE, read_revocations, update_revocations
+from bwidm_rest.sync import evict_revoked
+
+
+def fingerprints(keys, file_name=None):
+    """Returns fingerprints of 'keys' and of the lines of 'file_name'."""
+    keys = list(keys)
+    if file_name:
+        with open(file_name, "r", encoding="utf-8") as file:
+            keys.extend(line.strip() for line in file)
+    result = set()
+    for key in keys:
+        if not key or key.startswith("#"):
+            continue
+        fingerprint = key if key.startswith("SHA256:") else line_fingerprint(key)
+        if fingerprint is None:
+            exit_with_msg(42, f"Not a key or fingerprint: {key}")
+        result.add(fingerprint)
+    return result
+
+
+# Command line variables
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-c", "--config", default=CONFIG_FILE, help="Config file")
+commands = parser.add_subparsers(dest="command", required=True)
+for name, help_text in (("add", "Revoke keys"), ("remove", "Serve keys again")):
+    command = commands.add_parser(name, help=help_text)
+    command.add_argument("keys", nargs="*", help="Fingerprint or key line")
+    command.add_argument("-f", "--file", help="File with fingerprints or keys")
+commands.add_parser("list", help="List revoked keys")
+args = parser.parse_args()
+
+try:
+    config = read_config(args.config)
+except LookupFailed as e:
+    exit_with_msg(e.exit_code, *e.messages)
+revoked_set = config.cache_revoked
+if not revoked_set:
+    exit_with_msg(26, "Config variable revoked is empty")
+
+try:
+    if args.command == "list":
+        for fingerprint, note in sorted(read_revocations(revoked_set).items()):
+            print(fingerprint, note)
+    elif args.command == "add":
+        keys = fingerprints(args.keys, args.file)
+        added, _ = update_revocations(revoked_set, dict.fromkeys(keys, MANUAL_NOTE))
+        users = evict_revoked(config.sync_dir, keys, config.sync_store)
+        print(
+            f"Revoked {added} keys, removed from the synced keys of {len(users)} users"
+        )
+    else:
+        keys = fingerprints(args.keys, args.file)
+        _, removed = update_revocations(revoked_set, {}, keys, restore_all=True)
+        users = invalidate_states(config.sync_state_dir, keys)
+        print(
+            f"Removed {removed} keys from the revocation set, "
+            f"synced again for {len(users)} users by the next sync"
+        )
+except OSError as e:
+    exit_with_msg(27, f"Can not update revocation set: {e}")
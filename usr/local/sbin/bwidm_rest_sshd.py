@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Resolver daemon for the bwIDM REST API scripts.
+Holds config, a keep-alive session to the Reg-App and the key cache in memory
+and answers key lookups of the scripts on a Unix socket.
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import socketserver
+import sys
+
+# Shared library location (/usr/local/lib/bwidm_rest)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "lib")
+)
+# pylint: disable-next=wrong-import-position
+from bwidm_rest.cache import refresh_in_thread
+from bwidm_rest.client import DAEMON_SOCKET
+from bwidm_rest.config import CONFIG_FILE, read_config
+from bwidm_rest.deadline import lookup_deadline
+from bwidm_rest.errors import LookupFailed, exit_with_msg
+from bwidm_rest.lookup import Resolver
+from bwidm_rest.pipeline import PROFILES
+
+MAX_REQUEST = 4096
+
+
+class LookupHandler(socketserver.StreamRequestHandler):
+    """Answers one key lookup per connection."""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline(MAX_REQUEST))
+            mode = request["mode"]
+            ssh_user = request["ssh_user"]
+            user_id = request["user_id"]
+            fingerprint = request.get("fingerprint")
+            # Seconds the client waits for the answer
+            wait = request.get("deadline")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return
+        # Invalid requests are not answered, the client falls back to a
+        # direct lookup and reports the error
+        if mode not in PROFILES or not isinstance(ssh_user, str):
+            return
+        if not re.fullmatch(r"\w{1,12}", ssh_user):
+            return
+        if user_id is not None and not isinstance(user_id, int):
+            return
+        if fingerprint is not None and not isinstance(fingerprint, str):
+            return
+        if wait is not None and not (isinstance(wait, (int, float)) and wait > 0):
+            return
+        resolver = self.server.resolver
+        seconds = resolver.conf.deadline
+        if wait is not None:
+            seconds = min(seconds, wait) if seconds else wait
+        try:
+            keys = resolver.lookup(
+                mode,
+                ssh_user,
+                user_id,
+                deadline=lookup_deadline(seconds),
+                fingerprint=fingerprint,
+            )
+            reply = {"exit": 0, "keys": keys, "messages": []}
+        except LookupFailed as e:
+            reply = {"exit": e.exit_code, "keys": [], "messages": e.messages}
+        self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+
+class ResolverServer(socketserver.ThreadingUnixStreamServer):
+    """Threaded Unix socket server holding the resolver."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, config_file):
+        self.config_file = config_file
+        self.resolver = None
+        self.reload()
+        socketserver.ThreadingUnixStreamServer.__init__(
+            self, socket_path, LookupHandler
+        )
+
+    def reload(self, *_):
+        """Reads config file and starts with a new Reg-App session."""
+        try:
+            self.resolver = Resolver(read_config(self.config_file), refresh_in_thread)
+        except LookupFailed as e:
+            if self.resolver is None:
+                exit_with_msg(e.exit_code, *e.messages)
+            print(*e.messages, file=sys.stderr)
+
+
+# Command line variables
+parser = argparse.ArgumentParser(description="bwIDM SSH key resolver daemon.")
+parser.add_argument("-c", "--config", default=CONFIG_FILE, help="Config file")
+parser.add_argument("-s", "--socket", default=DAEMON_SOCKET, help="Socket path")
+args = parser.parse_args()
+
+os.makedirs(os.path.dirname(args.socket), mode=0o755, exist_ok=True)
+if os.path.exists(args.socket):
+    os.unlink(args.socket)
+
+server = ResolverServer(args.socket, args.config)
+# Only the AuthorizedKeysCommandUser (owner or group) may query keys
+os.chmod(args.socket, 0o660)
+signal.signal(signal.SIGHUP, server.reload)
+signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+try:
+    server.serve_forever()
+finally:
+    server.server_close()
+    os.unlink(args.socket)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Fetches the SSH keys of all users of the bwIDM service and writes them
+to one file per user, which sshd reads with AuthorizedKeysFile.
+Users are read from NSS (uidNumber > 900000) or from a file.
+With --evict, keys that got older than 'valid_days' are removed from the
+files using the expiry index of the last sync, without contacting the Reg-App.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Shared library location (/usr/local/lib/bwidm_rest)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "lib")
+)
+# pylint: disable-next=wrong-import-position
+from bwidm_rest.cache import refresh_in_thread
+from bwidm_rest.config import CONFIG_FILE, read_config
+from bwidm_rest.errors import LookupFailed, exit_with_msg
+from bwidm_rest.lookup import Resolver
+from bwidm_rest.pipeline import PROFILES, lookup_settings
+from bwidm_rest.sync import (
+    EVICT_POLL,
+    evict_expired,
+    expiring_keys,
+    passwd_users,
+    read_user_file,
+    sync_keys,
+)
+
+# Command line variables
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-c", "--config", default=CONFIG_FILE, help="Config file")
+parser.add_argument("--mode", choices=sorted(PROFILES), help="Lookup mode")
+parser.add_argument("--output-dir", help="AuthorizedKeysFile directory")
+parser.add_argument("--workers", type=int, help="Concurrent requests")
+parser.add_argument("--users", help="File with lines 'user_name [uidNumber]'")
+parser.add_argument(
+    "--full", action="store_true", help="Process all responses, ignore key states"
+)
+parser.add_argument("--evict", action="store_true", help="Remove expired keys, no sync")
+parser.add_argument(
+    "--follow", action="store_true", help="With --evict: evict when keys expire"
+)
+parser.add_argument(
+    "--expiring", type=float, metavar="DAYS", help="List keys expiring within DAYS"
+)
+args = parser.parse_args()
+
+try:
+    config = read_config(args.config)
+except LookupFailed as e:
+    exit_with_msg(e.exit_code, *e.messages)
+output_dir = args.output_dir or config.sync_dir
+
+if args.expiring is not None:
+    for entry in expiring_keys(config.sync_state_dir, args.expiring * 86400):
+        expires = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.expires))
+        print(f"{expires}  {entry.ssh_user}  {entry.fingerprint}  {entry.name}")
+    sys.exit(0)
+
+if args.evict:
+    while True:
+        try:
+            expired, next_expiry = evict_expired(
+                config.sync_state_dir, output_dir, store=config.sync_store
+            )
+        except OSError as e:
+            exit_with_msg(27, f"Can not evict keys: {e}")
+        for entry in expired:
+            print(f"Evicted {entry.fingerprint} ({entry.name}) of {entry.ssh_user}")
+        if not args.follow:
+            sys.exit(0)
+        sys.stdout.flush()
+        # The index is read again for keys added by a sync in the meantime
+        wait = EVICT_POLL if next_expiry is None else next_expiry - time.time()
+        time.sleep(min(max(wait, 0), EVICT_POLL))
+
+# [SYNC] mode overrides [LOOKUP] mode
+if args.mode or config.sync_mode:
+    config.lookup["mode"] = args.mode or config.sync_mode
+try:
+    settings = lookup_settings("ssh", config.lookup)
+except LookupFailed as e:
+    exit_with_msg(e.exit_code, *e.messages)
+workers = args.workers or config.sync_workers
+# Always fetch, the key cache is updated on the way
+config.cache_ttl = config.cache_stale_ttl = config.cache_negative_ttl = 0
+# Login metrics and login history only
+config.metrics_spool = config.warm_history = ""
+
+try:
+    users = read_user_file(args.users) if args.users else passwd_users()
+except (OSError, ValueError) as e:
+    exit_with_msg(27, f"Can not read users: {e}")
+
+stats = sync_keys(
+    Resolver(config, refresh_in_thread, pool_size=workers),
+    settings.mode,
+    users,
+    output_dir,
+    workers,
+    None if args.full else config.sync_state_dir,
+    config.sync_store,
+    config.cache_revoked,
+)
+print(
+    f"Synced {stats['users']} users in {stats['seconds']:.1f} s"
+    f" ({stats['users'] / max(stats['seconds'], 0.001):.0f} users/s):"
+    f" {stats['changed']} changed, {stats['unchanged']} unchanged,"
+    f" {stats['removed']} removed, {stats['failed']} failed,"
+    f" {stats['cpu_seconds']:.2f} s CPU"
+)
+if "bytes" in stats:
+    print(
+        f"Incremental: {stats.get('unchanged_responses', 0)} unchanged responses,"
+        f" {stats.get('skipped_bytes', 0) / 1024:.0f} of"
+        f" {stats['bytes'] / 1024:.0f} KiB not processed again,"
+        f" {stats.get('keys_added', 0)} new keys,"
+        f" {stats.get('keys_changed', 0)} status transitions,"
+        f" {stats.get('keys_removed', 0)} removed keys,"
+        f" {stats.get('cpu', 0):.2f} s CPU for processing responses"
+    )
+if "revoked" in stats:
+    print(
+        f"Revocation set: {stats['revoked']} keys revoked,"
+        f" {stats['restored']} restored"
+    )
+if "stored" in stats:
+    print(f"Key store: {stats['stored']} users in {config.sync_store}")
+sys.exit(1 if stats["failed"] else 0)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Refreshes the cached keys and uidNumbers of users that are expected to log in
+soon, from the logins recorded by the key lookups, before the cache entries
+expire. Sends at most [WARM] budget Reg-App requests per run.
+Run it periodically, e.g. with the systemd timer bwidm-rest-warm.timer.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Shared library location (/usr/local/lib/bwidm_rest)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "lib")
+)
+# pylint: disable-next=wrong-import-position
+from bwidm_rest.cache import refresh
+from bwidm_rest.config import CONFIG_FILE, read_config
+from bwidm_rest.errors import LookupFailed, exit_with_msg
+from bwidm_rest.lookup import Resolver
+from bwidm_rest.warm import (
+    RequestBudget,
+    predict_logins,
+    update_history,
+    warm_cache,
+    warming_config,
+)
+
+# Command line variables
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("-c", "--config", default=CONFIG_FILE, help="Config file")
+parser.add_argument("--budget", type=int, help="Reg-App requests of this run")
+parser.add_argument(
+    "--dry-run", action="store_true", help="Only list the expected logins"
+)
+args = parser.parse_args()
+
+try:
+    config = read_config(args.config)
+except LookupFailed as e:
+    exit_with_msg(e.exit_code, *e.messages)
+if not config.warm_history:
+    exit_with_msg(26, "Config variable history is empty")
+
+start = time.monotonic()
+now = time.time()
+try:
+    history = update_history(
+        config.warm_history, config.warm_state, now, config.warm_days
+    )
+except OSError as e:
+    exit_with_msg(27, f"Can not update login history: {e}")
+logins = predict_logins(
+    history, now, config.warm_lead, config.warm_days, config.warm_recent
+)
+if args.dry_run:
+    for mode, ssh_user, user_id in logins:
+        print(mode, ssh_user, "" if user_id is None else user_id)
+    sys.exit(0)
+
+budget = RequestBudget(config.warm_budget if args.budget is None else args.budget)
+counts = warm_cache(
+    Resolver(warming_config(config, config.warm_lead), refresh, limiter=budget),
+    logins,
+    budget,
+)
+print(
+    f"{len(logins)} of {len(history)} users expected, {counts['users']} looked up "
+    f"in {time.monotonic() - start:.2f} s with {counts['requests']} requests: "
+    f"{counts['warmed']} warmed, {counts['denied']} denied, "
+    f"{counts['unavailable']} unavailable, {counts['skipped']} over budget"
+)